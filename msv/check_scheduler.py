@@ -0,0 +1,100 @@
+"""Decide which safety checks run on each loop tick"""
+import time
+
+
+class ScheduledCheck:
+    def __init__(self, name, func, cost=0.0, min_interval=0.0, max_interval=None, watch=None):
+        """
+        :param func: callable running the check, returns its result
+        :param cost: estimated seconds per run, replaced by measured average as it runs
+        :param min_interval: seconds between runs at least
+        :param max_interval: seconds between runs at most, check runs even over budget after it
+        :param watch: callable returning hashable state (e.g. fingerprint of a screen region). If given, check runs only
+                      when state changed since its last run (or max_interval passed)
+        """
+        self.name = name
+        self.func = func
+        self.cost = cost
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.watch = watch
+        self.watched = None  # state of last run
+        self.last_run = None
+        self.last_result = None
+        self.runs = 0
+        self.skips = 0  # due but over budget
+        self.idle = 0  # not due
+        self.total_time = 0.0
+
+    def is_due(self, now, state):
+        if self.last_run is None:
+            return True
+        elapsed = now - self.last_run
+        if elapsed < self.min_interval:
+            return False
+        if self.watch is not None:
+            return state != self.watched or self.is_overdue(now)
+        return True
+
+    def is_overdue(self, now):
+        return self.max_interval is not None and (self.last_run is None or now - self.last_run >= self.max_interval)
+
+    def run(self, now, state):
+        t = time.perf_counter()
+        self.last_result = self.func()
+        elapsed = time.perf_counter() - t
+        self.cost = elapsed if self.runs == 0 else self.cost * 0.8 + elapsed * 0.2
+        self.total_time += elapsed
+        self.runs += 1
+        self.last_run = now
+        self.watched = state
+        return self.last_result
+
+
+class CheckScheduler:
+    """
+    Checks are registered in order of priority. On each tick, due checks run in that order while their estimated cost
+    fits in the tick's time budget. First due check and overdue checks (max_interval passed) always run.
+    """
+    def __init__(self, budget=0.02):
+        """:param budget: seconds per tick for checks"""
+        self.budget = budget
+        self.checks = []
+        self.ticks = 0
+
+    def register(self, name, func, cost=0.0, min_interval=0.0, max_interval=None, watch=None):
+        check = ScheduledCheck(name, func, cost, min_interval, max_interval, watch)
+        self.checks.append(check)
+        return check
+
+    def tick(self):
+        """:return: dict name -> result of checks run in this tick"""
+        self.ticks += 1
+        now = time.perf_counter()
+        spent = 0.0
+        results = {}
+        for check in self.checks:
+            state = check.watch() if check.watch is not None else None
+            if not check.is_due(now, state):
+                check.idle += 1
+                continue
+            if spent and spent + check.cost > self.budget and not check.is_overdue(now):
+                check.skips += 1
+                continue
+            t = time.perf_counter()
+            results[check.name] = check.run(now, state)
+            spent += time.perf_counter() - t
+        return results
+
+    def reset(self):
+        for check in self.checks:
+            check.last_run = check.watched = check.last_result = None
+
+    def report(self):
+        """:return: statistics string of every check"""
+        lines = ['%d ticks, budget %.1fms' % (self.ticks, self.budget * 1000)]
+        for check in self.checks:
+            lines.append('%s: %d runs, %d skips, %d idle, avg %.2fms' % (
+                check.name, check.runs, check.skips, check.idle,
+                check.total_time / check.runs * 1000 if check.runs else 0))
+        return '\n'.join(lines)
@@ -0,0 +1,325 @@
+"""
+Headless 2D game simulator for evaluating PlayerController movement without the game.
+Platforms of a .platform file are the terrain, the virtual player moves in response to key events of InputManager, and
+frames with its minimap marker are rendered for StaticImageProcessor. Time is a msv.replay.ReplayClock, so sleeps of
+movement loops cost nothing and runs are deterministic.
+Units are minimap pixels and seconds. Physics is a coarse approximation of Kanna's movement, good enough to compare
+movement strategies against each other, not to predict exact in-game timing.
+"""
+import random
+import time
+import cv2
+import numpy as np
+from msv.directinput_constants import DIK_RIGHT, DIK_DOWN, DIK_LEFT, DIK_UP
+from msv.input_manager import DEFAULT_KEY_MAP
+from msv.player_controller import PlayerController
+from msv.replay import ReplayClock, RecordingInputManager
+from msv.screen_processor import MockScreenProcessor, StaticImageProcessor
+from msv.terrain_analyzer import PathAnalyzer
+
+
+class GameSimulator:
+    WALK_SPEED = 14  # pixels per second
+    AIR_SPEED = 20  # horizontal speed of jump, jump distance is about 10 pixels
+    JUMP_SPEED = 48  # initial upward speed, jump height is about 6 pixels
+    GRAVITY = 192
+    MAX_FALL_SPEED = 80
+    TELEPORT_HORIZONTAL_RANGE = 18
+    TELEPORT_VERTICAL_RANGE = 24
+    TELEPORT_DELAY = 0.1  # teleport key is ignored for this long after a teleport
+    PLAYER_MARKER_COLOR = (68, 221, 255)  # BGR
+    MINIMAP_COLOR = (120, 120, 120)
+    PLATFORM_COLOR = (160, 160, 160)
+
+    def __init__(self, platform_file=None, platforms=None, minimap_rect=None, start=None, keymap=DEFAULT_KEY_MAP,
+                 frame_size=(1024, 768), step=1/120):
+        """
+        :param platform_file: terrain file, path or qt resource
+        :param platforms: dict of hash -> Platform, instead of platform_file
+        :param minimap_rect: [x,y,w,h] of minimap in frame, default the one stored in platform_file
+        :param start: (x, y) of player, default middle of first platform
+        :param step: seconds of one physics step
+        """
+        if platform_file:
+            analyzer = PathAnalyzer()
+            analyzer.load(platform_file)
+            platforms = analyzer.platforms
+            minimap_rect = minimap_rect or analyzer.astar_minimap_rect
+        self.platforms = list(platforms.values())
+        if minimap_rect is None:
+            minimap_rect = [6, 60, max(i.end_x for i in self.platforms) + 10,
+                            max(max(i.start_y, i.end_y) for i in self.platforms) + 10]
+        self.minimap_rect = list(minimap_rect)
+        self.frame_size = frame_size
+        self.step = step
+        self.jump_key = keymap['jump']
+        self.teleport_key = keymap['teleport']
+
+        self.x = self.y = self.vx = self.vy = 0.0
+        self.grounded = None
+        self.dropping_through = None  # platform fallen through by drop, not landed on until below it
+        self.facing_right = True
+        self.keys_down = set()
+        self.time = 0.0
+        self.last_teleport_time = -1.0
+        self.teleports = self.jumps = 0
+        self.place(start)
+
+        self.background = self._render_background()
+        self.frame = self.background.copy()
+        self._marker_rect = None
+
+    def place(self, start=None):
+        """Put player standing still at start, default middle of first platform"""
+        if start is None:
+            p = self.platforms[0]
+            start = ((p.start_x + p.end_x) // 2, p.start_y)
+        self.x, self.y = float(start[0]), float(start[1])
+        self.vx = self.vy = 0.0
+        self.grounded = self.platform_at(self.x, self.y)
+        self.dropping_through = None
+        self.keys_down.clear()
+
+    def _platform_y(self, platform, x):
+        """y of platform at x, sloped platforms are interpolated"""
+        if platform.end_x == platform.start_x:
+            return platform.start_y
+        slope = (platform.end_y - platform.start_y) / (platform.end_x - platform.start_x)
+        return platform.start_y + slope * (x - platform.start_x)
+
+    def platform_at(self, x, y, tolerance=0.5):
+        """:return: Platform the point stands on, None if in the air"""
+        for p in self.platforms:
+            if p.start_x <= x <= p.end_x and abs(self._platform_y(p, x) - y) <= tolerance:
+                return p
+        return None
+
+    def _landing_platform(self, x, y0, y1):
+        """:return: highest platform crossed when falling from y0 to y1 at x"""
+        best = None
+        for p in self.platforms:
+            if p is self.dropping_through or not p.start_x <= x <= p.end_x:
+                continue
+            py = self._platform_y(p, x)
+            if y0 <= py <= y1 and (best is None or py < best[1]):
+                best = (p, py)
+        return best
+
+    @property
+    def position(self):
+        """:return: (x, y) minimap coordinate of player marker"""
+        return int(round(self.x)), int(round(self.y))
+
+    def key_event(self, key, down, timestamp):
+        """Apply a key press or release happened at timestamp"""
+        self.advance(timestamp)
+        if not down:
+            self.keys_down.discard(key)
+            return
+        if key in self.keys_down:
+            return  # key repeat
+        self.keys_down.add(key)
+        if key in (DIK_LEFT, DIK_RIGHT):
+            self.facing_right = key == DIK_RIGHT
+        elif key == self.jump_key:
+            self._jump()
+        elif key == self.teleport_key:
+            self._teleport()
+
+    def _horizontal_input(self):
+        left, right = DIK_LEFT in self.keys_down, DIK_RIGHT in self.keys_down
+        return (right - left) if left != right else 0
+
+    def _jump(self):
+        if self.grounded is None:
+            return
+        if DIK_DOWN in self.keys_down:
+            below = self._landing_platform(self.x, self.y + 1, self.minimap_rect[3])
+            if below is None:
+                return  # can't drop from lowest platform
+            self.dropping_through = self.grounded
+            self.vx = self.vy = 0.0
+        else:
+            self.vx = self._horizontal_input() * self.AIR_SPEED
+            self.vy = -self.JUMP_SPEED
+        self.grounded = None
+        self.jumps += 1
+
+    def _teleport(self):
+        if self.time - self.last_teleport_time < self.TELEPORT_DELAY:
+            return
+        self.last_teleport_time = self.time
+        self.teleports += 1
+        if DIK_UP in self.keys_down:
+            self.y = max(self.y - self.TELEPORT_VERTICAL_RANGE, 0)
+        elif DIK_DOWN in self.keys_down:
+            self.y = min(self.y + self.TELEPORT_VERTICAL_RANGE, self.minimap_rect[3] - 1)
+        else:
+            direction = self._horizontal_input() or (1 if self.facing_right else -1)
+            self.x = min(max(self.x + direction * self.TELEPORT_HORIZONTAL_RANGE, 0), self.minimap_rect[2] - 1)
+        self.vx = self.vy = 0.0
+        self.dropping_through = None
+        self.grounded = self.platform_at(self.x, self.y)
+        if self.grounded is not None:
+            self.y = self._platform_y(self.grounded, self.x)
+
+    def advance(self, timestamp):
+        """Run physics in fixed steps until timestamp"""
+        while self.time + self.step <= timestamp:
+            self._step(self.step)
+            self.time += self.step
+
+    def _step(self, dt):
+        max_x, max_y = self.minimap_rect[2] - 1, self.minimap_rect[3] - 1
+        if self.grounded is not None:
+            self.x = min(max(self.x + self._horizontal_input() * self.WALK_SPEED * dt, 0), max_x)
+            p = self.grounded
+            if p.start_x <= self.x <= p.end_x:
+                self.y = self._platform_y(p, self.x)
+                return
+            self.grounded = None  # walked off the edge
+            self.vx = self.vy = 0.0
+
+        self.x = min(max(self.x + self.vx * dt, 0), max_x)
+        self.vy = min(self.vy + self.GRAVITY * dt, self.MAX_FALL_SPEED)
+        y0, y1 = self.y, self.y + self.vy * dt
+        self.y = y1
+        if self.dropping_through is not None and y1 > self.dropping_through.start_y + 1:
+            self.dropping_through = None
+        if self.vy > 0:
+            landing = self._landing_platform(self.x, y0, y1)
+            if landing:
+                self.grounded, self.y = landing
+                self.vx = self.vy = 0.0
+            elif y1 >= max_y:  # bottom of map
+                self.y = max_y
+                self.vx = self.vy = 0.0
+                self.grounded = self.platform_at(self.x, self.y)
+
+    def _render_background(self):
+        w, h = self.frame_size
+        frame = np.zeros((h, w, 3), np.uint8)
+        x, y, mw, mh = self.minimap_rect
+        frame[y:y+mh, x+1:x+mw] = self.MINIMAP_COLOR  # edge detection of get_minimap_rect finds x one pixel left
+        for p in self.platforms:
+            cv2.line(frame, (x + p.start_x, y + p.start_y), (x + p.end_x, y + p.end_y), self.PLATFORM_COLOR, 1)
+        return frame
+
+    def render(self):
+        """
+        :return: frame with player marker, the frame buffer is reused between calls.
+        Marker has 12 pixels in rows of 2, 4, 4, 2 like the game, its centroid truncates to self.position
+        """
+        if self._marker_rect is not None:
+            x, y, w, h = self._marker_rect
+            self.frame[y:y+h, x:x+w] = self.background[y:y+h, x:x+w]
+        px, py = self.position
+        x, y = self.minimap_rect[0] + px - 1, self.minimap_rect[1] + py - 1
+        self.frame[y, x+1:x+3] = self.PLAYER_MARKER_COLOR
+        self.frame[y+1:y+3, x:x+4] = self.PLAYER_MARKER_COLOR
+        self.frame[y+3, x+1:x+3] = self.PLAYER_MARKER_COLOR
+        self._marker_rect = (x, y, 4, 4)
+        return self.frame
+
+
+class SimulatedScreenProcessor(MockScreenProcessor):
+    """Frames rendered by GameSimulator at current virtual time. Every capture takes capture_cost of virtual time"""
+    def __init__(self, simulator, clock, capture_cost=1/60):
+        super().__init__()
+        self.simulator = simulator
+        self.clock = clock
+        self.capture_cost = capture_cost
+        self.captures = 0
+        self.img = simulator.render()
+
+    def is_foreground(self):
+        return True
+
+    def capture(self, hwnd=None, rect=None, plan=None, reuse_buffer=False, bgra=False):
+        self.clock.sleep(self.capture_cost)
+        self.simulator.advance(self.clock.elapsed)
+        self.img = self.simulator.render()
+        self.captures += 1
+        if plan is not None and not bgra:
+            return self.img  # rendered frame is black outside minimap, no need to mask regions of plan
+        return super().capture(hwnd, rect, plan, reuse_buffer, bgra)
+
+
+class SimulatedInputManager(RecordingInputManager):
+    """Key events are recorded and applied to GameSimulator"""
+    def __init__(self, simulator, clock):
+        super().__init__(clock)
+        self.simulator = simulator
+
+    def press_key(self, hexKeyCode):
+        super().press_key(hexKeyCode)
+        self.simulator.key_event(hexKeyCode, True, self.clock.elapsed)
+
+    def release_key(self, hexKeyCode):
+        super().release_key(hexKeyCode)
+        self.simulator.key_event(hexKeyCode, False, self.clock.elapsed)
+
+
+class SimulationResult:
+    def __init__(self, ret, start, end, virtual_time, real_time, key_events, captures):
+        self.ret = ret
+        self.start = start
+        self.end = end
+        self.virtual_time = virtual_time
+        self.real_time = real_time
+        self.key_events = key_events
+        self.captures = captures
+
+    def __str__(self):
+        return 'returned %s, %s -> %s in %.2fs (%.1fms real), %d key events, %d captures' % (
+            self.ret, self.start, self.end, self.virtual_time, self.real_time * 1000, self.key_events, self.captures)
+
+
+class Simulation:
+    """
+    PlayerController wired to a GameSimulator. Movement methods are run by run(), e.g.
+    Simulation('resources/platform/corridor_h01.platform', start=(30, 33)).run('horizontal_move_goal', 100)
+    """
+    def __init__(self, platform_file=None, platforms=None, start=None, keymap=DEFAULT_KEY_MAP, capture_cost=1/60,
+                 seed=0, **simulator_kwargs):
+        """:param seed: seed of random delays of PlayerController, runs with same seed are identical"""
+        self.seed = seed
+        self.clock = ReplayClock()
+        self.simulator = GameSimulator(platform_file, platforms, start=start, keymap=keymap, **simulator_kwargs)
+        self.screen_capturer = SimulatedScreenProcessor(self.simulator, self.clock, capture_cost)
+        self.screen_processor = StaticImageProcessor(self.screen_capturer)
+        self.key_mgr = SimulatedInputManager(self.simulator, self.clock)
+        self.player = PlayerController(self.key_mgr, self.screen_processor, keymap)
+
+    def reset(self, start=None):
+        """Move player to start for a new run, keeps loaded terrain and detected minimap"""
+        self.simulator.place(start)
+        self.key_mgr.actual_key_state.clear()
+        self.player.x = self.player.y = None
+
+    def run(self, method, *args, **kwargs):
+        """
+        Call a method of PlayerController (name or function taking the controller) in virtual time.
+        :return: SimulationResult
+        """
+        if isinstance(method, str):
+            func = getattr(self.player, method)
+        else:
+            func = lambda *a, **kw: method(self.player, *a, **kw)
+        start_time, start_events = self.clock.elapsed, len(self.key_mgr.events)
+        start_captures = self.screen_capturer.captures
+        start = self.simulator.position
+        state = random.getstate()  # PlayerController uses global random, seed it only during the run
+        random.seed(self.seed)
+        t = time.perf_counter()
+        try:
+            with self.clock:
+                if self.player.x is None:
+                    self.player.update()
+                ret = func(*args, **kwargs)
+        finally:
+            random.setstate(state)
+        real_time = time.perf_counter() - t
+        self.simulator.advance(self.clock.elapsed)  # sleeps after last capture
+        return SimulationResult(ret, start, self.simulator.position, self.clock.elapsed - start_time, real_time,
+                                len(self.key_mgr.events) - start_events, self.screen_capturer.captures - start_captures)
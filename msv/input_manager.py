@@ -84,6 +84,7 @@ class InputManager:
         self.actual_key_state = {}
         self.debug = debug
         self.use_driver = use_driver
+        self.recorder = None  # SessionRecorder, key events are added to it
 
     def get_key_state(self, key_code=None):
         """
@@ -190,12 +191,16 @@ class InputManager:
         self.translate_key_state()
 
     def press_key(self, hexKeyCode):
+        if self.recorder is not None:
+            self.recorder.add_key_event(hexKeyCode, True)
         extra = ctypes.c_ulong(0)
         ii_ = Input_I()
         ii_.ki = KeyBdInput(0, hexKeyCode, win32con.KEYEVENTF_SCANCODE, 0, ctypes.pointer(extra))
         self._send_input(Input(win32con.INPUT_KEYBOARD, ii_))
 
     def release_key(self, hexKeyCode):
+        if self.recorder is not None:
+            self.recorder.add_key_event(hexKeyCode, False)
         extra = ctypes.c_ulong(0)
         ii_ = Input_I()
         ii_.ki = KeyBdInput(0, hexKeyCode, win32con.KEYEVENTF_SCANCODE | win32con.KEYEVENTF_KEYUP, 0, ctypes.pointer(extra))
@@ -10,6 +10,9 @@ from msv import driver
 from msv.screen_processor import ScreenProcessor, StaticImageProcessor, MiniMapError, GameCaptureError
 from msv.player_controller import PlayerController
 from msv.rune_solver.rune_solver_simple import RuneSolverSimple
+from msv.vision_worker import VisionWorkerPool
+from msv.check_scheduler import CheckScheduler
+from msv.session_recorder import SessionRecorder
 from msv.util import get_file_log_handler, ConnLoggerHandler, random_number
 
 
@@ -70,7 +73,11 @@ class MacroController:
     RUNE_FAIL_CD = 5
     MINIMAP_DELAY = 0.08  # update delay of player mark in minimap
 
-    def __init__(self, conn=None, config=None):
+    def __init__(self, conn=None, config=None, screen_capturer=None, keyhandler=None):
+        """
+        :param screen_capturer: frame source, default ScreenProcessor of game window (see msv.replay for recorded ones)
+        :param keyhandler: input sink, default InputManager sending input to game
+        """
         if config is None:
             config = {}
         self.conn = conn
@@ -93,10 +100,13 @@ class MacroController:
 
         self.auto_resolve_rune = config.get('auto_solve_rune', True)
         self.vacuum_pet_picking = config.get('vacuum_pet_picking', False)
-        self.screen_capturer = ScreenProcessor()
+        self.screen_capturer = ScreenProcessor() if not screen_capturer else screen_capturer
         self.screen_processor = StaticImageProcessor(self.screen_capturer)
+        self.background_capture = config.get('background_capture', False)  # capture minimap in another thread
+        vision_workers = config.get('vision_workers', 0)  # process count for full frame checks, 0 to check in loop
+        self.vision_workers = VisionWorkerPool(workers=vision_workers, bgra=self.screen_processor.bgra) if vision_workers else None
         self.terrain_analyzer = PathAnalyzer()
-        self.keyhandler = km.InputManager(use_driver=kernel_driver)
+        self.keyhandler = km.InputManager(use_driver=kernel_driver) if not keyhandler else keyhandler
         self.player_manager = pc.PlayerController(self.keyhandler, self.screen_processor,
                                                   config.get('keymap', km.DEFAULT_KEY_MAP), self.poll_conn)
         if config.get('corsair_legion'):  # adjust summon skill cooldown
@@ -106,6 +116,7 @@ class MacroController:
         self.last_platform_hash = None
         self.current_platform_hash = None
         self.goal_platform_hash = None
+        self.pending_move = None  # (solution, duration) of a move which left player in air, recorded when landed
 
         self.platform_error = 3  # if x within 3 pixels of platform border, consider to be on said platform
 
@@ -126,13 +137,17 @@ class MacroController:
         self.unstick_attempts = 0  # If not on platform, how many times did we attempt unstick()?
         self.unstick_attempts_threshold = 5  # abort if unstick after this amount fails to get us on a known platform
 
+        self.check_scheduler = CheckScheduler(config.get('check_budget', 0.05))
+        self.record_session = config.get('record_session')  # directory to record frames and key events in
+        self.recorder = None
+        self._register_checks()
+
         self.pickup_money_interval = 90
         self.other_player_detected_start = None
         self.player_pos_not_found_start = None
 
     def load_and_process_platform_map(self, path):
         ret = self.terrain_analyzer.load(path)
-        self.terrain_analyzer.generate_solution_dict()
         if ret != 0:
             self.logger.info("Loaded terrain %s (%s platforms)" % (path, len(self.terrain_analyzer.platforms)))
         else:
@@ -142,19 +157,12 @@ class MacroController:
         return math.sqrt((x1-x2)**2 + (y1-y2)**2)
 
     def find_current_platform(self):
-        current_platform_hash = None
-
-        for p in self.terrain_analyzer.platforms.values():
-            if self.player_manager.is_on_platform(p):
-                current_platform_hash = p.hash
-                break
-
+        x, y = self.player_manager.x, self.player_manager.y
+        current_platform_hash = self.terrain_analyzer.find_platform(x, y)
         if current_platform_hash is None:
             #  Add additional check to take into account imperfect platform coordinates
-            for p in self.terrain_analyzer.platforms.values():
-                if self.player_manager.is_on_platform(p, self.platform_error):
-                    current_platform_hash = p.hash
-                    break
+            current_platform_hash = self.terrain_analyzer.find_platform(x, y, above=self.platform_error,
+                                                                        side=self.platform_error)
 
         return current_platform_hash
 
@@ -164,12 +172,8 @@ class MacroController:
         """
         if not coord:
             return None
-        for key, platform in self.terrain_analyzer.platforms.items():
-            if (platform.start_y - self.FIND_PLATFORM_OFFSET <= coord[1] <= platform.start_y + self.FIND_PLATFORM_OFFSET and
-                    platform.start_x <= coord[0] <= platform.end_x):
-                return key
-
-        return None
+        return self.terrain_analyzer.find_platform(coord[0], coord[1], above=self.FIND_PLATFORM_OFFSET,
+                                                   below=self.FIND_PLATFORM_OFFSET)
 
     def navigate_to_platform(self, platform_hash):
         """
@@ -211,10 +215,9 @@ class MacroController:
                 self.poll_conn()
                 self.player_manager.horizontal_move_goal(x)
 
-                self._player_move(solution.method)
+                self._player_move(solution.method, solution)
 
                 self.poll_conn()
-                self.update()
                 if self.current_platform_hash != solution.to_hash:  # should retry
                     if self.current_platform_hash is None:  # in case stuck in ladder
                         self.logger.warning("stuck. attempting unstick()...")
@@ -262,9 +265,12 @@ class MacroController:
 
         # Update Screen
         self.screen_processor.update_image(set_focus=False)
+        if self.vision_workers:
+            self.vision_workers.publish(self.screen_processor.bgr_img, self.screen_processor.frame_time)
 
         # Update Constants
-        player_pos = self.screen_processor.find_player_minimap_marker()
+        minimap = self.screen_processor.get_minimap_snapshot()  # shared by all minimap checks of this frame
+        player_pos = minimap.player_marker
         if not player_pos:
             white_room = self.screen_processor.check_white_room()
             if self.player_pos_not_found_start is None:
@@ -281,32 +287,37 @@ class MacroController:
             self.player_pos_not_found_start = None
         self.player_manager.update(player_pos[0], player_pos[1])
 
+        checks = self.check_scheduler.tick()
+        if self.check_scheduler.ticks % 100 == 0:
+            self.logger.debug('check statistics: ' + self.check_scheduler.report())
+
         ### GM check
-        if self.screen_processor.check_gm_cap():
+        if checks.get('gm_cap'):
             self.conn.send(('play', 'white_room'))
             self.logger.info('GM detected')
             self.save_current_screen('gm')
             return -4
 
         ### Other player check
-        other_pos = self.screen_processor.find_other_player_marker()
-        if other_pos:  # Other player present
-            if self.other_player_detected_start is None:
-                self.logger.info('other player detected')
-                self.other_player_detected_start = time.time()
-            self.alert_sound(2)
-        else:
-            self.other_player_detected_start = None
+        if 'other_player' in checks:
+            other_markers = checks['other_player']
+            if other_markers:  # Other player present
+                if self.other_player_detected_start is None:
+                    self.logger.info('other player detected: ' + ', '.join(i[2] for i in other_markers))
+                    self.other_player_detected_start = time.time()
+                self.alert_sound(2)
+            else:
+                self.other_player_detected_start = None
 
         ### Death check
-        if self.screen_processor.check_death():
+        if checks.get('death'):
             self.save_current_screen('dead')
             self.exit_to_ch_select()
             self.alert_sound(1)
             self.abort('character dead')
 
         ### Dialog box check
-        if self.screen_processor.check_dialog():
+        if checks.get('dialog'):
             self.keyhandler.single_press(dc.DIK_ESCAPE)
 
         self.current_platform_hash = self.find_current_platform()
@@ -327,11 +338,62 @@ class MacroController:
 
         return 0
 
+    def _register_checks(self):
+        """
+        Checks of _loop_common_job, cheapest first so an expensive check can't take the budget of cheap ones.
+        max_interval bounds how long any safety check is skipped for budget
+        """
+        sp = self.screen_processor
+        self.check_scheduler.register('other_player', lambda: sp.get_minimap_snapshot().other_player_markers,
+                                      cost=0.0005, max_interval=0.5)
+        # death and dialog only matter when their screen area changed
+        self.check_scheduler.register('death', lambda: self._check('death'), cost=0.001, max_interval=5,
+                                      watch=lambda: sp.region_fingerprint(sp.death_countdown_region(sp.frame_size())))
+        self.check_scheduler.register('dialog', lambda: self._check('dialog'), cost=0.001, max_interval=5,
+                                      watch=lambda: sp.region_fingerprint(sp.dialog_button_region(sp.frame_size())))
+        # about 34ms at 1366x768
+        self.check_scheduler.register('gm_cap', lambda: self._check('gm_cap'), cost=0.035, max_interval=1)
+
+    def _check(self, name):
+        """
+        Result of StaticImageProcessor.check_<name>, or latest verdict of vision workers if they are used. Checks
+        which failed in a worker, or all checks after a worker died, are run here
+        """
+        if self.vision_workers:
+            verdict = self.vision_workers.take(name)
+            if not self.vision_workers.failed and (verdict is None or verdict[0] is not None):
+                return verdict is not None and verdict[0]
+        return getattr(self.screen_processor, 'check_' + name)()
+
     def update(self):
         self.player_manager.update()  # will update image
         self.current_platform_hash = self.find_current_platform()
+        if self.pending_move and self.current_platform_hash is not None:
+            solution, duration = self.pending_move
+            self.pending_move = None
+            self.terrain_analyzer.record_move(solution, duration, self.current_platform_hash == solution.to_hash)
 
     def loop_entry(self):
+        if self.background_capture:
+            self.screen_processor.start_frame_grabber()
+        if self.record_session:
+            self.recorder = SessionRecorder(self.record_session).start()
+            self.screen_processor.recorder = self.keyhandler.recorder = self.recorder
+        try:
+            self._loop_with_retry()
+        finally:
+            self.screen_processor.stop_frame_grabber()
+            if self.vision_workers:
+                self.vision_workers.stop()
+            if self.recorder:
+                self.screen_processor.recorder = self.keyhandler.recorder = None
+                self.recorder.close()
+                self.logger.debug('recorded %d frames (%d full, %d dropped), %d bytes' % (
+                    self.recorder.frames, self.recorder.full_frames, self.recorder.dropped,
+                    self.recorder.bytes_written))
+                self.recorder = None
+
+    def _loop_with_retry(self):
         retry_err_count = 0
         while True:
             try:
@@ -372,7 +434,7 @@ class MacroController:
 
         if self.loop_count % self.reset_navmap_loop_count == 0 and self.loop_count != 0:
             # Reset navigation map to randomize pathing
-            self.terrain_analyzer.generate_solution_dict()
+            self.terrain_analyzer.reset_navmap()
             numbers = []
             for x in range(0, len(self.terrain_analyzer.platforms.keys())):
                 numbers.append(x)
@@ -465,7 +527,7 @@ class MacroController:
         ### End other buffs
 
         # All movement and attacks finished. Now perform movement
-        self._player_move(next_platform_solution.method)
+        self._player_move(next_platform_solution.method, next_platform_solution)
         # End inter-platform movement
 
         ### Start set skills
@@ -536,7 +598,16 @@ class MacroController:
         self.current_platform_hash = rune_platform_hash
         time.sleep(0.05 + random_number(0.05))
 
-    def _player_move(self, move_method):
+    def _player_move(self, move_method, solution=None):
+        """
+        :param solution: Solution being executed, if given current platform is updated after the move and its duration
+        and result are recorded in terrain_analyzer so pathfind prefers moves which are fast and reliable. If player is
+        still in air (e.g. teleported off a platform), result is recorded by the update() which sees player landed
+        """
+        if self.pending_move:  # never landed on a platform
+            self.terrain_analyzer.record_move(self.pending_move[0], self.pending_move[1], False)
+            self.pending_move = None
+        start = time.time()
         if move_method == MoveMethod.DROP:
             self.player_manager.drop()
         elif move_method == MoveMethod.JUMPL:
@@ -563,6 +634,14 @@ class MacroController:
             self.player_manager.teleport_up()
             time.sleep(self.MINIMAP_DELAY)
 
+        if solution is not None:
+            self.update()
+            if self.current_platform_hash is None:
+                self.pending_move = (solution, time.time() - start)
+            else:
+                self.terrain_analyzer.record_move(solution, time.time() - start,
+                                                  self.current_platform_hash == solution.to_hash)
+
     def set_skills(self, combine=False):
         self.update()
         if self.current_platform_hash is None:
@@ -7,8 +7,8 @@ import msv.directinput_constants as dc
 
 # deep cavern lower path 1 script
 class Dclp1MacroController(MacroController):
-    def __init__(self, conn, config):
-        super().__init__(conn, config)
+    def __init__(self, conn, config, **kwargs):
+        super().__init__(conn, config, **kwargs)
         self.last_pickup_money_time = time.time() + 20
 
     def loop(self):
@@ -12,8 +12,8 @@ class EndOfTheWorld1_4(MacroController):
     LEFT_X = 60
     RIGHT_X = 91
 
-    def __init__(self, conn, config):
-        super().__init__(conn, config)
+    def __init__(self, conn, config, **kwargs):
+        super().__init__(conn, config, **kwargs)
         self.last_pickup_money_time = time.time() + 20
         self.alt_pattern = random.random() < 0.5
 
@@ -9,8 +9,8 @@ class LabyrinthInterior1(MacroController):
     LEFT_X = 66
     RIGHT_X = 85
 
-    def __init__(self, conn, config):
-        super().__init__(conn, config)
+    def __init__(self, conn, config, **kwargs):
+        super().__init__(conn, config, **kwargs)
         self.last_pickup_money_time = time.time() + 20
 
     def loop(self):
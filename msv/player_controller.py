@@ -64,18 +64,23 @@ class PlayerController:
 
         self.last_skill_use_time = {}
 
-    def update(self, player_coords_x=None, player_coords_y=None):
+    def update(self, player_coords_x=None, player_coords_y=None, newer_than=None):
         """
         Updates self.x, self.y to input coordinates
         :param player_coords_x: Coordinates to update self.x
         :param player_coords_y: Coordinates to update self.y
+        :param newer_than: perf_counter timestamp, if frame grabber is running wait for a frame captured after it.
+                           Default is time of last consumed frame, every update sees a new frame instead of one
+                           possibly captured before keys just sent
         :return: None
         """
         self._call_poll()
+        if newer_than is None:
+            newer_than = self.screen_processor.frame_time
         if player_coords_x:
             self.x, self.y = player_coords_x, player_coords_y
         else:
-            self.screen_processor.update_image()
+            self.screen_processor.update_image(plan=self.screen_processor.minimap_capture_plan, newer_than=newer_than)
             pos = self.screen_processor.find_player_minimap_marker()
             if not pos:
                 raise MiniMapError("failed to find player pos in minimap")
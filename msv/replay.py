@@ -0,0 +1,268 @@
+"""
+Offline replay: run MacroController (or any mapscripts class) against a recorded frame stream, headless.
+Frames come from a recorded session (msv.session_recorder), a directory of PNGs or a compressed .npz archive, key
+events go to a recording input sink, and time is virtual, so time.sleep() of the loop costs nothing and replay is
+deterministic.
+"""
+import bisect
+import glob
+import os
+import time
+import cv2
+import numpy as np
+from msv.screen_processor import MockScreenProcessor
+from msv.input_manager import InputManager
+from msv.macro_script import MacroController, Aborted
+from msv.session_recorder import SessionReader
+
+
+_real_time = time.time
+_real_sleep = time.sleep
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+class PngDirectorySource:
+    """
+    Frames are *.png in a directory in order of file name. Timestamps (seconds, one per line) are read from
+    timestamps.txt if it exists, otherwise frames are 1 / fps apart.
+    """
+    def __init__(self, path, fps=10):
+        self.files = sorted(glob.glob(os.path.join(path, '*.png')))
+        if not self.files:
+            raise FileNotFoundError('no png in ' + path)
+        ts_file = os.path.join(path, 'timestamps.txt')
+        if os.path.exists(ts_file):
+            with open(ts_file) as f:
+                self.timestamps = [float(i) for i in f.read().split()]
+        else:
+            self.timestamps = [i / fps for i in range(len(self.files))]
+        self._cached = (None, None)
+
+    def __len__(self):
+        return len(self.files)
+
+    def frame(self, index):
+        if self._cached[0] != index:
+            self._cached = (index, cv2.imread(self.files[index]))
+        return self._cached[1]
+
+
+class NpzArchiveSource:
+    """Frames in np.savez_compressed archive with arrays 'frames' (N, H, W, 3) BGR and 'timestamps' (N,)"""
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.frames = data['frames']
+            self.timestamps = [float(i) for i in data['timestamps']]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, index):
+        return self.frames[index]
+
+    @staticmethod
+    def save(path, frames, timestamps):
+        np.savez_compressed(path, frames=np.asarray(frames), timestamps=np.asarray(timestamps, np.float64))
+
+
+def open_source(path):
+    if os.path.isdir(path):
+        return SessionReader(path) if os.path.exists(os.path.join(path, 'meta.json')) else PngDirectorySource(path)
+    return NpzArchiveSource(path)
+
+
+class ReplayClock:
+    """Virtual time, replaces time.time and time.sleep while installed. time.perf_counter stays real for profiling"""
+    def __init__(self):
+        self.start = _real_time()
+        self.elapsed = 0.0
+
+    def time(self):
+        return self.start + self.elapsed
+
+    def sleep(self, seconds):
+        self.elapsed += max(seconds, 0)
+
+    def __enter__(self):
+        time.time, time.sleep = self.time, self.sleep
+        return self
+
+    def __exit__(self, *_):
+        time.time, time.sleep = _real_time, _real_sleep
+
+
+class ReplayScreenProcessor(MockScreenProcessor):
+    """Frame of recording at current virtual time. Every capture takes capture_cost of virtual time"""
+    def __init__(self, source, clock, capture_cost=1/60):
+        super().__init__()
+        self.source = source
+        self.clock = clock
+        self.capture_cost = capture_cost
+        ts = source.timestamps
+        self.timestamps = [i - ts[0] for i in ts]
+        self.end_time = self.timestamps[-1] + (self.timestamps[-1] - self.timestamps[-2] if len(ts) > 1 else capture_cost)
+        self.frame_index = 0
+        self.captures = 0
+        self.img = source.frame(0)
+
+    def is_foreground(self):
+        return True
+
+    def capture(self, hwnd=None, rect=None, plan=None, reuse_buffer=False, bgra=False):
+        self.clock.sleep(self.capture_cost)
+        if self.clock.elapsed >= self.end_time:
+            raise ReplayFinished
+        self.frame_index = bisect.bisect_right(self.timestamps, self.clock.elapsed) - 1
+        self.img = self.source.frame(self.frame_index)
+        self.captures += 1
+        return super().capture(hwnd, rect, plan, reuse_buffer, bgra)
+
+
+class RecordingInputManager(InputManager):
+    """Input sink, key events are recorded as (virtual time, 'press' or 'release', DIK key code) instead of sent"""
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.events = []
+
+    def press_key(self, hexKeyCode):
+        self.events.append((self.clock.elapsed, 'press', hexKeyCode))
+
+    def release_key(self, hexKeyCode):
+        self.events.append((self.clock.elapsed, 'release', hexKeyCode))
+
+    def mouse_move_absolute(self, x, y):
+        pass
+
+    def mouse_click_left(self, down):
+        pass
+
+    def get_cursor_pos(self):
+        return 0, 0
+
+
+class RecordingConn:
+    """Stands for pipe to GUI process, messages sent by macro are recorded and no command is ever received"""
+    def __init__(self):
+        self.messages = []
+
+    def send(self, obj):
+        self.messages.append(obj)
+
+    def poll(self, timeout=0):
+        return False
+
+
+class ReplayReport:
+    def __init__(self):
+        self.reason = None
+        self.loops = 0
+        self.decisions = 0  # platform moves selected or paths planned
+        self.key_events = 0
+        self.captures = 0
+        self.real_time = 0.0
+        self.virtual_time = 0.0
+        self.stages = {}  # name -> [calls, total seconds], nested stages are included in outer ones
+
+    def __str__(self):
+        real = self.real_time or 1e-9
+        lines = ['replay %s: %d loops in %.2fs (%.1fs recorded), %.1f loops/s, %.1f decisions/s, %d key events, '
+                 '%d captures' % (self.reason, self.loops, self.real_time, self.virtual_time, self.loops / real,
+                                  self.decisions / real, self.key_events, self.captures)]
+        for name, (calls, total) in self.stages.items():
+            lines.append('%s: %d calls, avg %.2fms, total %.3fs' % (name, calls, total / calls * 1000 if calls else 0,
+                                                                    total))
+        return '\n'.join(lines)
+
+
+class ReplayEngine:
+    def __init__(self, source, macro_class=MacroController, config=None, platform_file=None, capture_cost=1/60,
+                 max_loops=None):
+        """
+        :param source: path of recorded session, png directory or .npz archive, or a source object
+        :param macro_class: MacroController or a class of msv.mapscripts
+        :param max_loops: stop after this count of loop(), default run until recording ends
+        """
+        self.source = open_source(source) if isinstance(source, str) else source
+        self.max_loops = max_loops
+        self.clock = ReplayClock()
+        self.screen_capturer = ReplayScreenProcessor(self.source, self.clock, capture_cost)
+        self.keyhandler = RecordingInputManager(self.clock)
+        self.conn = RecordingConn()
+        self.report = ReplayReport()
+        with self.clock:  # constructor may read time
+            self.macro = macro_class(self.conn, config or {}, screen_capturer=self.screen_capturer,
+                                     keyhandler=self.keyhandler)
+        if platform_file:
+            self.macro.load_and_process_platform_map(platform_file)
+        self._instrument()
+
+    def _instrument(self):
+        macro = self.macro
+        self._time_stage(macro.screen_processor, 'update_image', 'capture')
+        self._time_stage(macro.check_scheduler, 'tick', 'checks')
+        self._time_stage(macro, 'find_current_platform', 'platform')
+        self._time_stage(macro, '_loop_common_job', 'common_job')
+        self._time_stage(macro.terrain_analyzer, 'pathfind', 'pathfind', decision=True)
+        self._time_stage(macro.terrain_analyzer, 'select_move', 'select_move', decision=True)
+        loop = self._time_stage(macro, 'loop', 'loop')
+
+        def counted_loop():
+            ret = loop()
+            self.report.loops += 1
+            if self.max_loops is not None and self.report.loops >= self.max_loops:
+                raise ReplayFinished
+            return ret
+        macro.loop = counted_loop
+
+    def _time_stage(self, obj, attr, name, decision=False):
+        """Replace method of obj by one recording its timing, :return: original method"""
+        func = getattr(obj, attr)
+        stat = self.report.stages[name] = [0, 0.0]
+        report = self.report
+
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stat[0] += 1
+                stat[1] += time.perf_counter() - t
+                if decision:
+                    report.decisions += 1
+        setattr(obj, attr, timed)
+        return timed
+
+    def run(self):
+        """:return: ReplayReport"""
+        start = time.perf_counter()
+        with self.clock:
+            try:
+                self.macro.loop_entry()
+            except ReplayFinished:
+                self.report.reason = 'finished'
+            except Aborted:
+                self.report.reason = 'aborted'
+        self.report.real_time = time.perf_counter() - start
+        self.report.virtual_time = self.clock.elapsed
+        self.report.key_events = len(self.keyhandler.events)
+        self.report.captures = self.screen_capturer.captures
+        return self.report
+
+
+if __name__ == "__main__":
+    import argparse
+    from msv import mapscripts
+
+    parser = argparse.ArgumentParser(description='Replay recorded frames through a macro script')
+    parser.add_argument('source', help='recorded session, directory of png frames or .npz archive')
+    parser.add_argument('--script', help='name in mapscripts.map_scripts, default MacroController')
+    parser.add_argument('--platform', help='terrain file')
+    parser.add_argument('--loops', type=int, help='stop after this count of loops')
+    args = parser.parse_args()
+    engine = ReplayEngine(args.source, mapscripts.map_scripts[args.script] if args.script else MacroController,
+                          platform_file=args.platform, max_loops=args.loops)
+    print(engine.run())
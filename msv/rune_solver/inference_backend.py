@@ -0,0 +1,102 @@
+"""Inference backends of RuneSolverCnn, so the arrow classifier can run without TensorFlow"""
+import os
+import time
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+
+
+class InferenceBackend(ABC):
+    """
+    Loads a classifier model and runs batches of NHWC float32 tensors through it.
+    Load time and latency of every forward pass are recorded for report().
+    """
+    name = 'base'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.load_time = None
+        self.last_latency = None
+        self.total_latency = 0.0
+        self.runs = 0
+
+    def load(self):
+        t = time.perf_counter()
+        self._load()
+        self.load_time = time.perf_counter() - t
+        return self
+
+    def predict(self, tensor):
+        """
+        :param tensor: np.array of shape [batch, 60, 60, 1]
+        :return: np.array of shape [batch, classes], class probabilities
+        """
+        t = time.perf_counter()
+        ret = self._predict(np.ascontiguousarray(tensor, np.float32))
+        self.last_latency = time.perf_counter() - t
+        self.total_latency += self.last_latency
+        self.runs += 1
+        return ret
+
+    def report(self):
+        return '%s backend: load %.3fs, %d runs, last %.1fms, avg %.1fms' % (
+            self.name, self.load_time or 0, self.runs, (self.last_latency or 0) * 1000,
+            self.total_latency / self.runs * 1000 if self.runs else 0)
+
+    @abstractmethod
+    def _load(self):
+        """Load model of self.model_path"""
+
+    @abstractmethod
+    def _predict(self, tensor):
+        """:param tensor: C contiguous float32 np.array of shape [batch, 60, 60, 1]"""
+
+
+class OpenCvDnnBackend(InferenceBackend):
+    """
+    Model exported to ONNX (see rune_trainer/export_onnx.py), run by cv2.dnn on CPU.
+    Exported keras model keeps NHWC input, set input_layout to 'NCHW' for models expecting channels first.
+    """
+    name = 'cv2.dnn'
+
+    def __init__(self, model_path, input_layout='NHWC'):
+        super().__init__(model_path)
+        self.input_layout = input_layout
+        self.net = None
+
+    def _load(self):
+        self.net = cv2.dnn.readNet(self.model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def _predict(self, tensor):
+        if self.input_layout == 'NCHW':
+            tensor = np.ascontiguousarray(tensor.transpose(0, 3, 1, 2))
+        self.net.setInput(tensor)  # whole batch in one forward pass
+        return self.net.forward()
+
+
+class KerasBackend(InferenceBackend):
+    """Original keras model, TensorFlow is only imported when it's loaded"""
+    name = 'keras'
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        self.model = None
+
+    def _load(self):
+        from keras.models import load_model
+        from tensorflow import device
+        with device("/cpu:0"):  # Use cpu for evaluation
+            self.model = load_model(self.model_path)
+            self.model.load_weights(self.model_path)
+
+    def _predict(self, tensor):
+        return self.model.predict(tensor, batch_size=len(tensor))
+
+
+def get_backend(model_path):
+    """:return: loaded backend chosen by extension of model file, .h5 is keras, others (.onnx) cv2.dnn"""
+    if os.path.splitext(model_path)[1].lower() == '.h5':
+        return KerasBackend(model_path).load()
+    return OpenCvDnnBackend(model_path).load()
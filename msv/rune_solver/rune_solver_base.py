@@ -26,17 +26,15 @@ class RuneSolverBase:
         self.key_mgr = InputManager() if not key_mgr else key_mgr
 
     def capture_roi(self):
-        captured_image = self.screen_processor.capture()
-        screen_width = captured_image.shape[1]
+        screen_width = self.screen_processor.get_client_size()[0]
         if screen_width > 1300:
             self.rune_roi = self.rune_roi_1366
         elif screen_width > 1000:
             self.rune_roi = self.rune_roi_1024
         elif screen_width > 800:
             self.rune_roi = self.rune_roi_800
-        captured_roi = captured_image[self.rune_roi[1]:self.rune_roi[1]+self.rune_roi[3], self.rune_roi[0]:self.rune_roi[0]+self.rune_roi[2]]
 
-        return captured_roi
+        return self.screen_processor.capture(rect=self.rune_roi)
 
     def solve_auto(self):
         """
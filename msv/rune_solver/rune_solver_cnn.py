@@ -1,94 +1,102 @@
 """Classifier model verifier"""
+import time
 import cv2
 import numpy as np
-from keras.models import load_model
-from tensorflow import device
-from input_manager import InputManager
-from directinput_constants import DIK_UP, DIK_DOWN, DIK_LEFT, DIK_RIGHT, DIK_NUMLOCK, DIK_PERIOD
 from msv.rune_solver.rune_solver_base import RuneSolverBase
+from msv.rune_solver.inference_backend import get_backend
+
+
+def build_hue_gray_lut():
+    """
+    :return: 256 entries uint8 LUT, hue of OpenCV HSV (0-179) -> gray of the color with same hue and S, V set to 255
+    """
+    hsv = np.full((1, 256, 3), 255, np.uint8)
+    hsv[0, :, 0] = np.minimum(np.arange(256), 179)
+    return cv2.cvtColor(cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR), cv2.COLOR_BGR2GRAY)[0]
 
 
 class RuneSolverCnn(RuneSolverBase):
-    def __init__(self, model_path, labels=None, screen_capturer=None, key_mgr=None):
+    def __init__(self, model_path, labels=None, screen_capturer=None, key_mgr=None, backend=None):
         """
         Run just Once to initialize
-        :param model_path: Path to trained keras model
+        :param model_path: Path to trained model, keras .h5 or exported .onnx
         :param labels: dictionary with class names as keys, integer as values
         example: {'down': 0, 'left': 1, 'right': 2, 'up': 3}
+        :param backend: loaded InferenceBackend, default chosen by extension of model_path
         """
         super().__init__(screen_capturer, key_mgr)
 
         self.labels = labels if labels else {'down': 0, 'left': 1, 'right': 2, 'up': 3}
+        self.class_names = {v: k for k, v in self.labels.items()}
         self.model_path = model_path
-        with device("/cpu:0"):  # Use cpu for evaluation
-            model = load_model(self.model_path)
-            #model.compile(optimizer="adam", loss='categorical_crossentropy', metrics=['accuracy'])
-            model.load_weights(self.model_path)
-
-        self.model = model
+        self.backend = backend if backend else get_backend(model_path)
+        self.solve_latency = None
+        self.hue_gray_lut = build_hue_gray_lut()
+        self.tensor = np.zeros((4, 60, 60, 1), np.float32)  # input of classifier, crops are written into it
+        self.tensor_slots = [self.tensor[i, :, :, 0] for i in range(len(self.tensor))]
+        self.logger.debug('model loaded in %.3fs by %s' % (self.backend.load_time or 0, self.backend.name))
+
+    def hue_gray(self, img):
+        """
+        Grayscale of hue only, same as converting to HSV, setting S and V to 255, and converting back to BGR then gray
+        :param img: BGR image
+        """
+        hue = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)[:, :, 0]
+        return cv2.LUT(hue, self.hue_gray_lut)
 
     def preprocess(self, img):
         """
         finds and returns sorted list of 60 by 60 grayscale images of circles, centered
         :param img: BGR image of roi containing circle
-        :return: list of grayscale images each containing a circle
+        :return: list of grayscale images each containing a circle, first ones are views of self.tensor
         """
-        hsv_img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        hsv_img[:, :, 1] = 255
-        hsv_img[:, :, 2] = 255
-        bgr_img = cv2.cvtColor(hsv_img, cv2.COLOR_HSV2BGR)
-        gray_img = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
+        gray_img = self.hue_gray(img)
 
         circles = cv2.HoughCircles(gray_img, cv2.HOUGH_GRADIENT, 1, gray_img.shape[0] / 8, param1=100, param2=30, minRadius=18, maxRadius=30)
-        temp_list = []
-        img_index = 1
+        return_list = []
         if circles is not None:
             circles = np.round(circles[0, :]).astype("int")
-            for (x, y, r) in circles:
-
-                cropped = gray_img[max(0, int(y - 60 / 2)):int(y + 60 / 2), max(0, int(x - 60 / 2)):int(x + 60 / 2)].astype(np.float32)
-
-                temp_list.append((cropped, (x, y)))
-                img_index += 1
-
-        temp_list = sorted(temp_list, key= lambda x: x[1][0])
-        return_list = []
-        for image in temp_list:
-            return_list.append(image[0])
+            circles = circles[np.argsort(circles[:, 0], kind='stable')]
+            for i, (x, y, r) in enumerate(circles):
+                cropped = gray_img[max(0, y - 30):y + 30, max(0, x - 30):x + 30]
+                if i < len(self.tensor_slots) and cropped.shape == (60, 60):
+                    slot = self.tensor_slots[i]
+                    slot[:] = cropped
+                    return_list.append(slot)
+                else:
+                    return_list.append(cropped.astype(np.float32))
 
         return return_list
 
     def images2tensor(self, img_list):
         """
         Creates a tf compliant tensor by stacking images in img_list
-        :param img_list:
-        :return: np.array of shape [1, 60, 60, 1]
+        :param img_list: crops returned by preprocess() are already in self.tensor, and it's returned without copying
+        :return: np.array of shape [len(img_list), 60, 60, 1]
         """
+        if len(img_list) <= len(self.tensor_slots) and all(a is b for a, b in zip(img_list, self.tensor_slots)):
+            return self.tensor[:len(img_list)]
         return np.vstack([np.reshape(x, [1, 60, 60, 1]) for x in img_list])
 
-    def classify(self, tensor, batch_size = 4):
+    def classify(self, tensor):
         """
-        Runs tensor through model and returns list of direction in string.
+        Runs tensor through model in one batch and returns list of direction in string.
         :param tensor: input tensor
-        :param batch_size: batch size
-        :return: size of strings "up", "down", "left", "right"
+        :return: size of strings "up", "down", "left", "right", None if model returned a class not in labels
         """
-        return_list = []
-        result = self.model.predict(tensor, batch_size=batch_size)
-        for res in result:
-            final_class = np.argmax(res, axis=-1)
-            for key, val in self.labels.items():
-                if final_class == val:
-                    return_list.append(key)
-
-        return return_list
+        classes = np.argmax(self.backend.predict(tensor), axis=-1)
+        if not all(i in self.class_names for i in classes):  # a missing arrow would press wrong keys
+            self.logger.warning('unknown class in %s, labels %s' % (classes, self.class_names))
+            return None
+        return [self.class_names[i] for i in classes]
 
     def solve(self):
         """
         Solves rune if present and just returns solution.
-        :return: None if rune not detected, result of classify() if successful
+        :return: None if rune not detected or not classified, result of classify() if successful
         """
         img = self.capture_roi()
+        t = time.perf_counter()
         processed_imgs = self.preprocess(img)
         if len(processed_imgs) != 4:
             return None
@@ -98,6 +106,8 @@ class RuneSolverCnn(RuneSolverBase):
         except ValueError as e:
             return None
         result = self.classify(tensor)
+        self.solve_latency = time.perf_counter() - t
+        self.logger.debug('solved in %.1fms, %s' % (self.solve_latency * 1000, self.backend.report()))
 
         return result
 
@@ -1,11 +1,13 @@
 import cv2
 import numpy as np
 from msv.rune_solver.rune_solver_base import RuneSolverBase
-from msv.util import read_qt_resource
+from msv.template_bank import get_template_bank
 
 
 class RuneSolverSimple(RuneSolverBase):
     THRESHOLD = 0.2
+    NMS_DISTANCE = 12  # arrows closer than it (in both axes) are the same one
+    DIRECTIONS = ('left', 'up', 'right', 'down')
 
     """
     Using OpenCV's static template matching to solve rune.
@@ -15,35 +17,98 @@ class RuneSolverSimple(RuneSolverBase):
     def __init__(self, screen_capturer=None, key_mgr=None):
         super().__init__(screen_capturer, key_mgr)
 
-        # load template
-        down_tpl = cv2.imdecode(read_qt_resource(':/template/down_arrow_template.png', True), cv2.IMREAD_COLOR)
-        right_tpl = np.rot90(down_tpl)
-        up_tpl = np.rot90(right_tpl)
-        left_tpl = np.rot90(up_tpl)
-        self.templates = {'left': left_tpl, 'up': up_tpl, 'right': right_tpl, 'down': down_tpl}
+        # load template, rotated ones and their masks are made only once
+        bank = get_template_bank()
+        self.templates = self.rotate_template(bank['down_arrow_template'])
+        self.templates_small = self.rotate_template(bank['down_arrow_template_small'])
+        self.batch_templates = [self.templates[i] for i in self.DIRECTIONS] + \
+                               [self.templates_small[i] for i in self.DIRECTIONS]
+        self._spectra = {}  # roi shape -> (conjugated spectra of mask and masked template channels, template energy)
+        for x, y, w, h in (self.rune_roi_1366, self.rune_roi_1024, self.rune_roi_800):
+            self._get_spectra((h, w))  # precompute, solving is timed
 
-        down_sm_tpl = cv2.imdecode(read_qt_resource(':/template/down_arrow_template_small.png', True), cv2.IMREAD_COLOR)
-        right_sm_tpl = np.rot90(down_sm_tpl)
-        up_sm_tpl = np.rot90(right_sm_tpl)
-        left_sm_tpl = np.rot90(up_sm_tpl)
-        self.templates_small = {'left': left_sm_tpl, 'up': up_sm_tpl, 'right': right_sm_tpl, 'down': down_sm_tpl}
+    @staticmethod
+    def rotate_template(down_tpl):
+        # mask is non-black pixels, arrow has no transparency
+        __, mask = cv2.threshold(cv2.cvtColor(down_tpl.bgr, cv2.COLOR_BGR2GRAY), 1, 255, cv2.THRESH_BINARY)
+        return {'left': down_tpl.rotated(3, mask=mask), 'up': down_tpl.rotated(2, mask=mask),
+                'right': down_tpl.rotated(1, mask=mask), 'down': down_tpl.rotated(0, mask=mask)}
 
-    def do_match(self, img, template, threshold):
-        # make mask
-        __, mask = cv2.threshold(cv2.cvtColor(template, cv2.COLOR_BGR2GRAY), 1, 255, cv2.THRESH_BINARY)
-        res = cv2.matchTemplate(img, template, cv2.TM_SQDIFF_NORMED, mask=mask)
-        return np.where(res <= threshold)  # matched locations
+    def _get_spectra(self, shape):
+        spectra = self._spectra.get(shape)
+        if spectra is None:
+            kernels = np.zeros((len(self.batch_templates), 4) + shape, np.float32)
+            energy = np.empty((len(self.batch_templates), 1, 1), np.float32)
+            for i, tpl in enumerate(self.batch_templates):
+                h, w = tpl.shape
+                mask = (tpl.mask > 0).astype(np.float32)
+                masked = tpl.bgr.astype(np.float32) * mask[..., None]
+                kernels[i, 0, :h, :w] = mask
+                kernels[i, 1:, :h, :w] = np.moveaxis(masked, 2, 0)
+                energy[i] = (masked * masked).sum()
+            spectra = self._spectra[shape] = (np.conj(np.fft.rfft2(kernels)), energy)
+        return spectra
+
+    def score_maps(self, img):
+        """
+        Masked TM_SQDIFF_NORMED scores of all batch_templates in one pass of FFT correlation: spectra of the ROI are
+        computed once, spectra of templates once per ROI size.
+        score = sum(mask*(I-T)^2) / sqrt(sum(mask*I^2) * sum(mask*T^2)), where both sums having I are correlations.
+        :return: float32 array of shape (len(batch_templates), roi_h, roi_w), index is center of template,
+                 inf where template doesn't fit
+        """
+        img = img[:, :, :3].astype(np.float32)
+        shape = img.shape[:2]
+        spectra, energy = self._get_spectra(shape)
+        planes = np.empty((4,) + shape, np.float32)
+        planes[0] = (img * img).sum(axis=2)
+        planes[1:] = np.moveaxis(img, 2, 0)
+        img_spectra = np.fft.rfft2(planes)
+        products = np.empty(spectra.shape[:1] + (2,) + spectra.shape[2:], spectra.dtype)
+        products[:, 0] = img_spectra[0] * spectra[:, 0]
+        products[:, 1] = np.einsum('cij,tcij->tij', img_spectra[1:], spectra[:, 1:])
+        corr = np.fft.irfft2(products, s=shape)
+        img_energy, cross = corr[:, 0], corr[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.maximum(img_energy - 2 * cross + energy, 0) / np.sqrt(img_energy * energy)
+
+        ret = np.full((len(self.batch_templates),) + shape, np.inf, np.float32)
+        for i, tpl in enumerate(self.batch_templates):
+            h, w = tpl.shape
+            valid_h, valid_w = shape[0] - h + 1, shape[1] - w + 1
+            if valid_h > 0 and valid_w > 0:
+                ret[i, h//2:h//2+valid_h, w//2:w//2+valid_w] = scores[i, :valid_h, :valid_w]
+        ret[np.isnan(ret)] = np.inf
+        return ret
+
+    def match_all(self, img):
+        """
+        Match arrows of all directions and sizes at once. Best direction of every pixel is taken, then non-maximum
+        suppression keeps local best matches.
+        :return: list of dict with dir, pos (top left of matched template, as of cv2.matchTemplate) and score
+        """
+        maps = self.score_maps(img)
+        best = maps.min(axis=0)
+        best_idx = maps.argmin(axis=0)
+        size = self.NMS_DISTANCE * 2 - 1
+        local_best = cv2.erode(best, np.ones((size, size), np.uint8))
+        ys, xs = np.nonzero((best <= self.THRESHOLD) & (best == local_best))
+        # remaining close ones have equal score, keep first of them
+        near = (np.abs(ys[:, None] - ys) < self.NMS_DISTANCE) & (np.abs(xs[:, None] - xs) < self.NMS_DISTANCE)
+        keep = ~np.triu(near, 1).any(axis=0)
+        ret = []
+        for y, x in zip(ys[keep], xs[keep]):
+            h, w = self.batch_templates[best_idx[y, x]].shape  # score maps are aligned on template centers
+            ret.append({'dir': self.DIRECTIONS[best_idx[y, x] % len(self.DIRECTIONS)],
+                        'pos': (int(x) - w // 2, int(y) - h // 2), 'score': float(best[y, x])})
+        return ret
 
     def solve(self):
         img = self.capture_roi()
         return self.try_solve(img)
 
     def try_solve(self, img):
-        result = []
-        for dir in self.templates:
-            pos_list = self.match_one_direction(img, dir)
-            for i in pos_list:
-                result.append({'dir': dir, 'pos': i})
+        result = self.match_all(img)
 
         if len(result) != 4:
             self.logger.warning('wrong rune result: ' + str(result))
@@ -51,19 +116,3 @@ class RuneSolverSimple(RuneSolverBase):
 
         result.sort(key=lambda i: i['pos'][0])
         return tuple(i['dir'] for i in result)
-
-    def match_one_direction(self, img, direction):
-        template = self.templates[direction]
-        template_sm = self.templates_small[direction]
-
-        loc = self.do_match(img, template, self.THRESHOLD)
-        loc_sm = self.do_match(img, template_sm, self.THRESHOLD)
-        loc = (np.concatenate((loc[0], loc_sm[0])), np.concatenate((loc[1], loc_sm[1])))
-
-        ret = []
-
-        for pt in zip(*loc[::-1]):
-            if any(abs(i[0]-pt[0]) < 12 and abs(i[1]-pt[1]) < 12 for i in ret):
-                continue
-            ret.append(pt)
-        return ret
@@ -2,17 +2,19 @@ import cv2
 import win32gui
 import win32con
 import time
-import math
+import threading
+import zlib
 import numpy as np
 import ctypes
 import ctypes.wintypes
 from PIL import Image
 from msv import winapi
-from msv.util import read_qt_resource
+from msv.template_bank import get_template_bank
 
 
 _bmp_info_header = None
 _rect = None
+_PENDING = object()  # lazy result not computed yet
 
 
 def is_window_scaled(hwnd):
@@ -22,80 +24,394 @@ def is_window_scaled(hwnd):
         return False
 
 
-def gdi_capture(hwnd, force_scaled=None, rect=None):
+def get_client_size(hwnd, force_scaled=None, hdc=None):
     """
-    Use Windows GDI API to capture singe window.
-    :return: BGR numpy array
+    Get size of window client area, fixed to unscaled size if window is scaled by DPI.
+    :param hdc: DC of window, optional
+    :return: width, height
     """
-    global _rect, _bmp_info_header
-    if not hwnd:
-        raise ValueError('invalid hwnd')
+    global _rect
+    if _rect is None:
+        _rect = ctypes.wintypes.RECT()
+    if not winapi.GetClientRect(hwnd, ctypes.byref(_rect)):
+        raise GameCaptureError("can't get rect of game window")
+    width = _rect.right - _rect.left
+    height = _rect.bottom - _rect.top
+    # fix window size if scaled
+    is_scaled = is_window_scaled(hwnd) if force_scaled is None else force_scaled
+    if is_scaled:
+        game_hdc = hdc or winapi.GetDC(hwnd)
+        if not game_hdc:
+            raise GameCaptureError("can't get DC of game window")
+        screen_dpi = winapi.GetDeviceCaps(game_hdc, winapi.LOGPIXELSX)
+        if not hdc:
+            winapi.ReleaseDC(hwnd, game_hdc)
+        if screen_dpi != 96:
+            width = round(width * 96 / screen_dpi)
+            height = round(height * 96 / screen_dpi)
+    return width, height
 
-    game_hdc = winapi.GetDC(hwnd)  # client area only, not GetWindowDC
-    if not game_hdc:
-        raise GameCaptureError("can't get DC of game window")
-
-    if rect is None:
-        # get window client size
-        if _rect is None:
-            _rect = ctypes.wintypes.RECT()
-        if not winapi.GetClientRect(hwnd, ctypes.byref(_rect)):
-            raise GameCaptureError("can't get rect of game window")
-        x = y = 0
-        width = _rect.right - _rect.left
-        height = _rect.bottom - _rect.top
-        # fix window size if scaled
-        is_scaled = is_window_scaled(hwnd) if force_scaled is None else force_scaled
-        if is_scaled:
-            screen_dpi = winapi.GetDeviceCaps(game_hdc, winapi.LOGPIXELSX)
-            if screen_dpi != 96:
-                width = round(width * 96 / screen_dpi)
-                height = round(height * 96 / screen_dpi)
-    else:
-        x, y, width, height = rect
 
-    if _bmp_info_header is None:
-        _bmp_info_header = winapi.BITMAPINFOHEADER()
-        _bmp_info_header.biSize = 40  # ctypes.sizeof(hdr)
-        _bmp_info_header.biPlanes = 1
-        _bmp_info_header.biBitCount = 32
-        _bmp_info_header.biCompression = winapi.BI_RGB
-        _bmp_info_header.biClrUsed = 0
-        _bmp_info_header.biYPelsPerMeter = 0
-        _bmp_info_header.biClrImportant = 0
-    _bmp_info_header.biWidth = width
-    _bmp_info_header.biHeight = -height
-    _bmp_info_header.biSizeImage = width * height * 4
-
-    hbitmap = cdc = None
-    try:
+class GdiBackend:
+    """
+    Win32 GDI calls used for capture. A surface is (memory DC, DIB section handle, BGRA numpy view of DIB pixels).
+    Replaced by FakeGdiBackend in unit tests, so capture buffer logic runs without a game window.
+    """
+    def get_client_size(self, hwnd, force_scaled=None, hdc=None):
+        return get_client_size(hwnd, force_scaled, hdc)
+
+    def get_dc(self, hwnd):
+        dc = winapi.GetDC(hwnd)  # client area only, not GetWindowDC
+        if not dc:
+            raise GameCaptureError("can't get DC of game window")
+        return dc
+
+    def release_dc(self, hwnd, dc):
+        winapi.ReleaseDC(hwnd, dc)
+
+    def create_surface(self, dc, width, height):
+        global _bmp_info_header
+        if _bmp_info_header is None:
+            _bmp_info_header = winapi.BITMAPINFOHEADER()
+            _bmp_info_header.biSize = 40  # ctypes.sizeof(hdr)
+            _bmp_info_header.biPlanes = 1
+            _bmp_info_header.biBitCount = 32
+            _bmp_info_header.biCompression = winapi.BI_RGB
+            _bmp_info_header.biClrUsed = 0
+            _bmp_info_header.biYPelsPerMeter = 0
+            _bmp_info_header.biClrImportant = 0
+        _bmp_info_header.biWidth = width
+        _bmp_info_header.biHeight = -height
+        _bmp_info_header.biSizeImage = width * height * 4
+
         bitmap_ptr = ctypes.c_void_p()
-        hbitmap = winapi.CreateDIBSection(game_hdc, ctypes.byref(_bmp_info_header), winapi.DIB_RGB_COLORS, ctypes.byref(bitmap_ptr), None, 0)
+        hbitmap = winapi.CreateDIBSection(dc, ctypes.byref(_bmp_info_header), winapi.DIB_RGB_COLORS, ctypes.byref(bitmap_ptr), None, 0)
         if not hbitmap:
             raise GameCaptureError('CreateDIBSection error')
-        cdc = winapi.CreateCompatibleDC(game_hdc)
+        cdc = winapi.CreateCompatibleDC(dc)
         if not cdc or not winapi.SelectObject(cdc, hbitmap):  # selects bitmap into cdc
+            self.delete_surface((cdc, hbitmap, None))
             raise GameCaptureError()
-        if not winapi.BitBlt(cdc, 0, 0, width, height, game_hdc, x, y, winapi.SRCCOPY):  # copy game_dc to cdc
-            raise GameCaptureError('BitBlt error')
         bitmap_ptr = ctypes.cast(bitmap_ptr, ctypes.POINTER(ctypes.c_uint8))
         # highest byte of DWORD is not used... but can't set biBitCount to 24 instead of 32, because of stride
         # (https://stackoverflow.com/a/3688558/3737373)
-        arr = np.ctypeslib.as_array(bitmap_ptr, (height, width, 4))
-        return cv2.cvtColor(arr, cv2.COLOR_BGRA2BGR)
-    finally:
+        return cdc, hbitmap, np.ctypeslib.as_array(bitmap_ptr, (height, width, 4))
+
+    def delete_surface(self, surface):
+        cdc, hbitmap, _ = surface
         if cdc:
             winapi.DeleteDC(cdc)
-        if game_hdc:
-            winapi.ReleaseDC(0, game_hdc)
         if hbitmap:
             winapi.DeleteObject(hbitmap)
 
+    def blit(self, surface, dc, rect, dst_pos=(0, 0)):
+        """Copy rect (x, y, w, h) of window DC to dst_pos of surface"""
+        x, y, width, height = rect
+        if not winapi.BitBlt(surface[0], dst_pos[0], dst_pos[1], width, height, dc, x, y, winapi.SRCCOPY):  # copy game_dc to cdc
+            raise GameCaptureError('BitBlt error')
+
+
+class FakeGdiBackend(GdiBackend):
+    """For unit test. Window content is self.img (BGR), surfaces are plain numpy arrays"""
+    def __init__(self, img=None):
+        self.img = img
+        self.surfaces_created = 0
+        self.surfaces_deleted = 0
+        self.dc_count = 0
+
+    def get_client_size(self, hwnd, force_scaled=None, hdc=None):
+        return self.img.shape[1], self.img.shape[0]
+
+    def get_dc(self, hwnd):
+        self.dc_count += 1
+        return hwnd
+
+    def release_dc(self, hwnd, dc):
+        self.dc_count -= 1
+
+    def create_surface(self, dc, width, height):
+        self.surfaces_created += 1
+        return None, None, np.zeros((height, width, 4), np.uint8)
+
+    def delete_surface(self, surface):
+        self.surfaces_deleted += 1
+
+    def blit(self, surface, dc, rect, dst_pos=(0, 0)):
+        x, y, w, h = rect
+        surface[2][dst_pos[1]:dst_pos[1]+h, dst_pos[0]:dst_pos[0]+w, :3] = self.img[y:y+h, x:x+w]
+
+
+_gdi_backend = GdiBackend()
+
+
+def gdi_capture(hwnd, force_scaled=None, rect=None, dst=None):
+    """
+    Use Windows GDI API to capture singe window. Creates and deletes GDI objects every call, use CaptureSession for
+    repeated capture.
+    :param rect: (x, y, w, h) area of client to capture, default whole client area
+    :param dst: BGR numpy array (or view) of captured size to write into, default allocate new one
+    :return: BGR numpy array
+    """
+    if not hwnd:
+        raise ValueError('invalid hwnd')
+
+    game_hdc = _gdi_backend.get_dc(hwnd)
+    surface = None
+    try:
+        if rect is None:
+            width, height = _gdi_backend.get_client_size(hwnd, force_scaled, game_hdc)
+            rect = (0, 0, width, height)
+        surface = _gdi_backend.create_surface(game_hdc, rect[2], rect[3])
+        _gdi_backend.blit(surface, game_hdc, rect)
+        return cv2.cvtColor(surface[2], cv2.COLOR_BGRA2BGR, dst=dst)
+    finally:
+        if surface:
+            _gdi_backend.delete_surface(surface)
+        _gdi_backend.release_dc(hwnd, game_hdc)
+
+
+class CaptureSession:
+    """
+    Repeated capture of one window. Window DC, a client size DIB section and BGR output buffers are kept between
+    captures and rebuilt only when client size changes, so steady state capture makes no GDI object and no array.
+    Returned arrays are views of the session's buffers, valid until next capture.
+    """
+    def __init__(self, hwnd, force_scaled=None, backend=None):
+        if not hwnd:
+            raise ValueError('invalid hwnd')
+        self.hwnd = hwnd
+        self.force_scaled = force_scaled
+        self.backend = backend or _gdi_backend
+        self.size = None  # (w, h) of current buffers
+        self.rebuild_count = 0
+        self._dc = None
+        self._surface = None
+        self._bgr = None
+        self._partial_bgr = None  # frame of capture_regions, black outside regions
+        self._partial_rects = None
+        self._surface_rects = None  # regions blitted by last capture_regions, None if surface has other content
+
+    def get_client_size(self):
+        if self._dc is None:
+            self._dc = self.backend.get_dc(self.hwnd)
+        return self.backend.get_client_size(self.hwnd, self.force_scaled, self._dc)
+
+    def _prepare(self):
+        """Rebuild surface and buffers if client size changed"""
+        size = self.get_client_size()
+        if size == self.size:
+            return
+        self._release_surface()
+        width, height = size
+        self._surface = self.backend.create_surface(self._dc, width, height)
+        self._bgr = np.empty((height, width, 3), np.uint8)
+        self._partial_bgr = None
+        self._surface_rects = None
+        self.size = size
+        self.rebuild_count += 1
+
+    def _convert(self, rect, dst):
+        x, y, w, h = rect
+        cv2.cvtColor(self._surface[2][y:y+h, x:x+w], cv2.COLOR_BGRA2BGR, dst=dst[y:y+h, x:x+w])
+
+    def capture(self, rect=None, bgra=False):
+        """
+        :param rect: (x, y, w, h) area of client to capture, default whole client area
+        :param bgra: return BGRA view of DIB section itself, skipping BGRA->BGR conversion
+        :return: BGR (or BGRA) numpy array (view of session buffer)
+        """
+        try:
+            self._prepare()
+            rect = (0, 0) + self.size if rect is None else self._clip(rect)
+            self.backend.blit(self._surface, self._dc, rect, rect[:2])
+            self._surface_rects = None
+            if not bgra:
+                self._convert(rect, self._bgr)
+        except Exception:
+            self.close()  # rebuild everything next time
+            raise
+        x, y, w, h = rect
+        return (self._surface[2] if bgra else self._bgr)[y:y+h, x:x+w]
+
+    def capture_regions(self, rects, bgra=False):
+        """
+        :param rects: list of (x, y, w, h), e.g. from CapturePlan.resolve(session.get_client_size())
+        :param bgra: return BGRA view of DIB section itself, skipping BGRA->BGR conversion
+        :return: client size BGR (or BGRA) numpy array (session buffer), area outside rects is black
+        """
+        try:
+            self._prepare()
+            rects = [rect for rect in map(self._clip, rects) if rect[2] and rect[3]]
+            if bgra:
+                if rects != self._surface_rects:
+                    self._surface[2].fill(0)
+                self._surface_rects = rects
+                for rect in rects:
+                    self.backend.blit(self._surface, self._dc, rect, rect[:2])
+                return self._surface[2]
+
+            if self._partial_bgr is None:
+                self._partial_bgr = np.zeros_like(self._bgr)
+            elif rects != self._partial_rects:
+                self._partial_bgr.fill(0)  # clear regions of last plan
+            self._partial_rects = rects
+            for rect in rects:
+                self.backend.blit(self._surface, self._dc, rect, rect[:2])
+                self._convert(rect, self._partial_bgr)
+        except Exception:
+            self.close()
+            raise
+        return self._partial_bgr
+
+    def _clip(self, rect):
+        x, y, w, h = rect
+        x, y = max(0, x), max(0, y)
+        return x, y, max(0, min(w, self.size[0] - x)), max(0, min(h, self.size[1] - y))
 
-def read_alpha_as_mask(path):
-    image_4channel = cv2.imdecode(read_qt_resource(path, True), cv2.IMREAD_UNCHANGED)
-    alpha_channel = image_4channel[:,:,3]
-    return alpha_channel
+    def _release_surface(self):
+        if self._surface is not None:
+            self.backend.delete_surface(self._surface)
+            self._surface = None
+        self.size = None
+
+    def close(self):
+        self._release_surface()
+        if self._dc is not None:
+            self.backend.release_dc(self.hwnd, self._dc)
+            self._dc = None
+
+
+def disk_kernel(radius):
+    """
+    Kernel counting every pixel within euclidean distance radius of the center (center included).
+    Use with cv2.filter2D to get neighbour count of every pixel of a binary mask in one pass.
+    """
+    ys, xs = np.mgrid[-radius:radius+1, -radius:radius+1]
+    return (xs**2 + ys**2 <= radius**2).astype(np.float32)
+
+
+def build_color_lut(color_ranges):
+    """
+    Build a per channel lookup table for classifying BGR pixels of several color ranges in one cv2.LUT call.
+    Range n sets bit n of a channel value if the value is inside that channel's range, so AND of the three channels
+    of the LUT output has bit n set only when pixel is inside range n.
+    :param color_ranges: list of (lower BGR, upper BGR), at most 8 ranges. 4 element BGRA bounds make a 4 channel LUT
+    :return: uint8 array of shape (256, 1, channels)
+    """
+    channels = len(color_ranges[0][0])
+    lut = np.zeros((256, 1, channels), np.uint8)
+    values = np.arange(256)
+    for bit, (lower, upper) in enumerate(color_ranges):
+        for channel in range(channels):
+            lut[(lower[channel] <= values) & (values <= upper[channel]), 0, channel] |= 1 << bit
+    return lut
+
+
+def half_scale(gray):
+    """:return: image of 2x2 block means (rounded), input's odd last row and column are dropped"""
+    h, w = gray.shape[0] // 2, gray.shape[1] // 2
+    return cv2.resize(gray[:h*2, :w*2], (w, h), interpolation=cv2.INTER_AREA)
+
+
+def largest_true_rect(mask):
+    """:return: (y1, y2, x1, x2) of largest rectangle of a small boolean array which is True everywhere"""
+    h, w = mask.shape
+    best_area, best = 0, None
+    for y1 in range(h):
+        cols = np.ones(w, bool)
+        for y2 in range(y1 + 1, h + 1):
+            cols &= mask[y2 - 1]
+            run = 0
+            for x in range(w + 1):
+                if x < w and cols[x]:
+                    run += 1
+                    continue
+                if run * (y2 - y1) > best_area:
+                    best_area, best = run * (y2 - y1), (y1, y2, x - run, x)
+                run = 0
+    return best
+
+
+class CoarseToFineMatcher:
+    """
+    Finds every position where masked TM_SQDIFF_NORMED score of template is under threshold, same as matchTemplate
+    over whole image, but matches a half scale rectangle of template first and confirms candidates only.
+    Candidates never miss a match: score < threshold means sum of (T-I)^2 over pixels of mask 255 is less than
+    threshold * sum(M^2), and squared differences of 2x2 block means are at most 1/4 of that. So unmasked TM_SQDIFF of
+    a rectangle of full blocks at half scale is under threshold * sum(M^2) / 4 for every match (plus rounding of block
+    means, each block differs by 1 at most). Block grid depends on parity of match position, so there is one coarse
+    template per (y % 2, x % 2).
+    """
+    def __init__(self, template, mask, threshold):
+        self.template = template
+        self.mask = mask
+        self.threshold = threshold
+        limit = threshold * (mask.astype(np.float64) ** 2).sum() / 4
+        self.phases = []  # (py, px, coarse rectangle of template, y offset of rectangle, x offset, coarse limit)
+        for py in (0, 1):
+            for px in (0, 1):
+                h, w = (template.shape[0] - py) // 2, (template.shape[1] - px) // 2
+                full_blocks = (mask[py:py+h*2, px:px+w*2] == 255).reshape(h, 2, w, 2).all(axis=(1, 3))
+                y1, y2, x1, x2 = largest_true_rect(full_blocks)
+                coarse = half_scale(template[py:, px:])[y1:y2, x1:x2]
+                coarse_limit = (limit ** 0.5 + coarse.size ** 0.5) ** 2 * 1.01  # with rounding and float error
+                self.phases.append((py, px, np.ascontiguousarray(coarse), y1, x1, coarse_limit))
+
+    def find(self, gray, coarse_gray=None):
+        """
+        :param coarse_gray: half_scale(gray), pass it if shared by several matchers
+        :return: list of (y, x) of matches
+        """
+        if coarse_gray is None:
+            coarse_gray = half_scale(gray)
+        th, tw = self.template.shape
+        max_y, max_x = gray.shape[0] - th, gray.shape[1] - tw
+        matches = []
+        for py, px, coarse_tpl, y1, x1, coarse_limit in self.phases:
+            res = cv2.matchTemplate(coarse_gray, coarse_tpl, cv2.TM_SQDIFF)
+            for cy, cx in zip(*np.where(res < coarse_limit)):
+                y, x = (cy - y1) * 2 - py, (cx - x1) * 2 - px
+                if 0 <= y <= max_y and 0 <= x <= max_x:
+                    score = cv2.matchTemplate(gray[y:y+th, x:x+tw], self.template, cv2.TM_SQDIFF_NORMED, mask=self.mask)
+                    if score[0, 0] < self.threshold:
+                        matches.append((y, x))
+        return matches
+
+
+class CapturePlan:
+    """
+    Regions of game client area needed by analysis of a frame. ScreenProcessor.capture only grabs and converts these
+    regions, other area of returned frame is left black, so analysis works on views of the frame as usual.
+    """
+    def __init__(self, **regions):
+        """
+        :param regions: name -> (x, y, w, h), or callable taking client size (w, h) and returning one (or None if
+                        not available)
+        """
+        self.regions = regions
+
+    def add(self, name, region):
+        self.regions[name] = region
+
+    def resolve(self, client_size):
+        """:return: list of (x, y, w, h) clipped to client area"""
+        client_w, client_h = client_size
+        rects = []
+        for region in self.regions.values():
+            if callable(region):
+                region = region(client_size)
+            if not region:
+                continue
+            x, y, w, h = region
+            x, y = max(0, x), max(0, y)
+            w, h = min(w, client_w - x), min(h, client_h - y)
+            if w > 0 and h > 0:
+                rects.append((x, y, w, h))
+        return rects
+
+    def pixel_count(self, client_size):
+        """Captured pixel count, overlapped area is counted multiple times"""
+        return sum(w * h for (_, _, w, h) in self.resolve(client_size))
 
 
 class GameCaptureError(Exception):
@@ -121,6 +437,7 @@ class ScreenProcessor:
     def __init__(self):
         self.hwnd = None
         self.is_window_scaled = None
+        self._session = None
         if not winapi.IsProcessDPIAware():
             winapi.SetProcessDPIAware()
 
@@ -172,51 +489,303 @@ class ScreenProcessor:
             return False
         return True
 
-    def capture(self, hwnd=None, rect=None):
+    def get_client_size(self):
+        """:return: width, height of game client area"""
+        if not self.hwnd:
+            self.hwnd = self.get_game_hwnd()
+        return get_client_size(self.hwnd, self.is_window_scaled)
+
+    def capture(self, hwnd=None, rect=None, plan=None, reuse_buffer=False, bgra=False):
         """Capture game window content
         :param hwnd : Default: None win32 window handle. If None, sets and uses self.hwnd
+        :param rect : (x, y, w, h) capture this area only
+        :param plan : CapturePlan, capture its regions only and returns client size image with other area black
+        :param reuse_buffer : return buffer of CaptureSession instead of a copy, it's overwritten by next capture
+        :param bgra : return 4 channel BGRA image as captured (alpha channel is garbage), skipping conversion
         :return : numpy BGR Image"""
         if hwnd:
             self.hwnd = hwnd
         if not self.hwnd:
             self.hwnd = self.get_game_hwnd()
 
-        return gdi_capture(self.hwnd, self.is_window_scaled, rect)
+        session = self._session
+        if session is None or session.hwnd != self.hwnd or session.force_scaled != self.is_window_scaled:
+            if session:
+                session.close()
+            session = self._session = CaptureSession(self.hwnd, self.is_window_scaled)
+
+        if plan is None:
+            img = session.capture(rect, bgra)
+        else:
+            img = session.capture_regions(plan.resolve(session.get_client_size()), bgra)
+        return img if reuse_buffer else img.copy()
 
     def capture_pil(self, rect=None):
         img = self.capture(rect=rect)
         return None if img is None else Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
 
 
+class FrameGrabber:
+    """
+    Producer thread capturing continuously into a small ring of preallocated frames, each stamped with
+    time.perf_counter() at capture start. Consumer gets newest frame without waiting for capture.
+    Slot last returned by get_frame is never overwritten until next get_frame call, so only one consumer thread is
+    supported.
+    """
+    FRAME_INTERVAL = 1 / 60  # about one game frame, capturing more often only returns same frame
+
+    def __init__(self, source, ring_size=3, interval=FRAME_INTERVAL):
+        """
+        :param source: callable returning captured image, it's copied into ring so may return a reused buffer
+        :param ring_size: frame count of ring, at least 3 (newest, one being read and one being written)
+        :param interval: min seconds between capture starts, 0 to capture as fast as possible (busy loop)
+        """
+        if ring_size < 3:
+            raise ValueError('ring_size must be 3 or more')
+        self.source = source
+        self.interval = interval
+        self.ring = [None] * ring_size
+        self.timestamps = [0.0] * ring_size
+        self.frame_count = 0
+        self.error = None  # exception raised by source on last capture, None if it succeeded
+        self._latest = None  # ring index of newest frame
+        self._reading = None  # ring index of frame given to consumer
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='FrameGrabber', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def _next_slot(self):
+        with self._cond:
+            start = -1 if self._latest is None else self._latest
+            for i in range(1, len(self.ring) + 1):
+                idx = (start + i) % len(self.ring)
+                if idx != self._latest and idx != self._reading:
+                    return idx
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                img = self.source()
+                if img is None:
+                    raise GameCaptureError('failed to capture game window')
+            except Exception as e:
+                with self._cond:
+                    self.error = e
+                    self._cond.notify_all()
+                self._stop_event.wait(max(self.interval, 0.1))
+                continue
+
+            idx = self._next_slot()
+            slot = self.ring[idx]
+            if slot is None or slot.shape != img.shape:
+                slot = self.ring[idx] = np.empty_like(img)
+            np.copyto(slot, img)
+            with self._cond:
+                self.timestamps[idx] = start
+                self._latest = idx
+                self.error = None
+                self.frame_count += 1
+                self._cond.notify_all()
+
+            if self.interval:
+                self._stop_event.wait(self.interval - (time.perf_counter() - start))
+
+    def get_frame(self, newer_than=None, timeout=1.0):
+        """
+        :param newer_than: perf_counter timestamp, wait for a frame captured after it. Default: newest frame
+        :param timeout: max seconds to wait
+        :return: (frame, timestamp), frame is kept untouched until next call
+        :raise GameCaptureError: if no such frame in timeout, or last capture failed (exception of source is raised)
+        """
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while (self.error is not None or self._latest is None or
+                   (newer_than is not None and self.timestamps[self._latest] <= newer_than)):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self.running:
+                    if self.error is not None:
+                        raise self.error
+                    raise GameCaptureError('no new frame from capture thread')
+                self._cond.wait(remaining)
+            self._reading = self._latest
+            return self.ring[self._reading], self.timestamps[self._reading]
+
+
+class MinimapSnapshot:
+    """
+    Minimap of one captured frame. Every marker color is classified in one LUT pass into a palette image (one bit per
+    color, colors never overlap), and markers are found lazily from the palette on first access.
+    """
+    PLAYER = 1 << 0
+    RUNE = 1 << 1
+    STRANGER = 1 << 2
+    GUILD = 1 << 3
+    FRIEND = 1 << 4
+    OTHER_PLAYER_KINDS = ((STRANGER, 'stranger'), (GUILD, 'guild'), (FRIEND, 'friend'))  # in order of alert priority
+
+    def __init__(self, processor, rect):
+        """
+        :param processor: StaticImageProcessor which holds the frame and marker parameters
+        :param rect: [x,y,w,h] bounding box of minimap
+        """
+        self.processor = processor
+        self.rect = rect
+        self.frame = processor.bgr_img
+        self.image = self.frame[rect[1]:rect[1]+rect[3], rect[0]:rect[0]+rect[2]]
+        classified = cv2.LUT(self.image, processor.minimap_color_lut)
+        self.palette = np.bitwise_and(classified[:, :, 0], classified[:, :, 1])
+        np.bitwise_and(self.palette, classified[:, :, 2], out=self.palette)  # LUT of alpha channel (if any) is all ones
+        self._player_marker = self._rune_markers = _PENDING
+        self._other_player_markers = {}  # detect_friend -> markers
+
+    def rebind(self, frame):
+        """Move snapshot to a new frame which has identical minimap, keeping computed markers"""
+        rect = self.rect
+        self.frame = frame
+        self.image = frame[rect[1]:rect[1]+rect[3], rect[0]:rect[0]+rect[2]]
+
+    def color_mask(self, color):
+        """:return: 0 or 255 mask of one palette color"""
+        return cv2.inRange(self.palette, color, color)
+
+    @property
+    def player_marker(self):
+        if self._player_marker is _PENDING:
+            self._player_marker = self._find_player_marker()
+        return self._player_marker
+
+    @property
+    def rune_markers(self):
+        if self._rune_markers is _PENDING:
+            self._rune_markers = self._find_rune_markers()
+        return self._rune_markers
+
+    @property
+    def other_player_markers(self):
+        detect_friend = self.processor.detect_friend
+        if detect_friend not in self._other_player_markers:
+            self._other_player_markers[detect_friend] = self._find_other_player_markers(detect_friend)
+        return self._other_player_markers[detect_friend]
+
+    def _find_player_marker(self):
+        """
+        The player marker has exactly 12 pixels of the detection color to form a pixel circle(2,4,4,2 pixels). Therefore
+        before calculation the mean pixel value of the mask, we remove "false positives", which are not part of the
+        player color by finding pixels which do not have between 10 to 12 other pixels(including itself) of the same
+        color in a distance of 3.
+        """
+        mask = self.color_mask(self.PLAYER)
+        # mask is 0 or 255, so neighbour count is scaled by 255
+        neighbours = cv2.filter2D(mask, cv2.CV_32F, self.processor.player_marker_kernel, borderType=cv2.BORDER_CONSTANT)
+        valid = cv2.inRange(neighbours, 10 * 255, 13 * 255)
+        moments = cv2.moments(cv2.bitwise_and(mask, valid), binaryImage=True)
+        if moments['m00'] == 0:
+            return None
+
+        return int(moments['m10'] / moments['m00']), int(moments['m01'] / moments['m00'])
+
+    def _find_rune_markers(self):
+        """
+        Rune marker is a diamond of 25 pixels (7x7 bounding box). Each connected blob of rune color is a candidate if
+        its area and bounding box fit the diamond, so scattered noise can't drag the position off the rune. Area lower
+        bound allows rune partially covered by player marker.
+        """
+        min_area, max_area = self.processor.rune_marker_area
+        min_size, max_size = self.processor.rune_marker_size
+        count, _, stats, centroids = cv2.connectedComponentsWithStats(self.color_mask(self.RUNE), connectivity=8)
+        candidates = []
+        for i in range(1, count):  # label 0 is background
+            w, h, area = stats[i, cv2.CC_STAT_WIDTH], stats[i, cv2.CC_STAT_HEIGHT], stats[i, cv2.CC_STAT_AREA]
+            if min_area <= area <= max_area and min_size <= w <= max_size and min_size <= h <= max_size:
+                candidates.append((area, (int(centroids[i][0]), int(centroids[i][1]))))
+
+        candidates.sort(key=lambda i: i[0], reverse=True)
+        return [i[1] for i in candidates]
+
+    def _find_other_player_markers(self, detect_friend):
+        """Each connected blob of other player colors is one player"""
+        kinds = self.OTHER_PLAYER_KINDS if detect_friend else self.OTHER_PLAYER_KINDS[:2]
+        palette = np.bitwise_and(self.palette, sum(i[0] for i in kinds))
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(palette, connectivity=8)
+        if count == 1:  # background only
+            return []
+
+        # pixel count of every color in every blob, blobs of different colors may touch each other
+        color_count = np.bincount((labels * 32 + palette).ravel(), minlength=count * 32).reshape(count, 32)
+        kind_count = color_count[:, [i[0] for i in kinds]]
+        ret = []
+        for i in range(1, count):  # label 0 is background
+            if stats[i, cv2.CC_STAT_AREA] < self.processor.OTHER_PLAYER_MARKER_MIN_AREA:
+                continue
+            kind_idx = int(np.argmax(kind_count[i]))
+            ret.append((kind_idx, int(centroids[i][0]), int(centroids[i][1])))
+
+        ret.sort()
+        return [(x, y, kinds[kind_idx][1]) for (kind_idx, x, y) in ret]
+
+
 class StaticImageProcessor:
+    OTHER_PLAYER_MARKER_MIN_AREA = 5
+    MINIMAP_BORDER_BAND = 3  # pixels from minimap rect edge sampled for validating cached minimap rect
+    MINIMAP_BORDER_SAMPLE_STEP = 4
     DIALOG_W = 517
     DIALOG_H = 188
     EXP_COLOR_BGR = (0, 250, 243)  # bottom of exp bar
 
-    def __init__(self, img_handle=None):
+    def __init__(self, img_handle=None, bgra=False):
         """
 
         :param img_handle: handle to MapleScreenCapturer
+        :param bgra: analyze BGRA frame as captured, skipping BGRA->BGR copy of every frame. self.bgr_img has 4
+                     channels then
         """
         if not img_handle:
             raise Exception("img_handle must reference an MapleScreenCapturer class!!")
 
         self.img_handle = img_handle
         self.detect_friend = True
+        self.bgra = bgra
+        self._to_gray = cv2.COLOR_BGRA2GRAY if bgra else cv2.COLOR_BGR2GRAY
         self.bgr_img = None
         self._gray_img = None
+        self.is_partial_frame = False
+        self.frame_time = 0  # perf_counter timestamp of bgr_img capture
+        self.frame_grabber = None
+        self.recorder = None  # SessionRecorder, every frame is added to it
         self.minimap_area = 0
         self.minimap_rect = None
-
-        self.cv_templates = {}
-        for i in ('gm_cap', 'dialog_end_chat', 'hp0'):
-            path = ':/template/' + i + '_tpl.png'
-            self.cv_templates[i] = cv2.imdecode(read_qt_resource(path, True), cv2.IMREAD_GRAYSCALE)
-            if self.cv_templates[i] is None:
-                raise FileNotFoundError(path)
-        self.cv_templates['gm_cap_r'] = np.fliplr(self.cv_templates['gm_cap'])
-        self.cv_templates['gm_cap_mask'] = read_alpha_as_mask(':/template/gm_cap_tpl.png')
-        self.cv_templates['gm_cap_r_mask'] = np.fliplr(self.cv_templates['gm_cap_mask'])
+        self.minimap_border_tolerance = 16  # max mean difference of border pixels for cached minimap rect
+        self.minimap_rect_hits = 0  # cached minimap rect validated
+        self.minimap_rect_misses = 0  # cached minimap rect not exists or invalid, fall back to full search
+        self._minimap_border = None
+        self._minimap_miss_frame_time = None  # frame_time of last frame whose full search failed
+        self._minimap_fingerprint = None
+        self.minimap_changed = True  # False if minimap of current frame is identical to last frame
+        self.minimap_changed_time = time.perf_counter()
+
+        self.templates = get_template_bank()
+        gm_cap = self.templates['gm_cap']
+        self.gm_cap_matchers = [CoarseToFineMatcher(i.gray, i.mask, 0.001) for i in (gm_cap, gm_cap.mirrored)]
 
         self.maximum_minimap_area = 40000
 
@@ -227,46 +796,143 @@ class StaticImageProcessor:
         self.upper_player_marker = np.array([69, 222, 256])
         self.lower_rune_marker = np.array([254, 101, 220])  # B G R
         self.upper_rune_marker = np.array([255, 103, 222])
+        self.rune_marker_area = (12, 25)  # min, max pixel count of one rune marker blob
+        self.rune_marker_size = (4, 7)  # min, max width and height of one rune marker blob
+        self.lower_stranger_marker = np.array([0, 0, 255])  # B G R
+        self.upper_stranger_marker = np.array([0, 0, 255])
+        self.lower_guild_marker = np.array([255, 102, 102])  # B G R
+        self.upper_guild_marker = np.array([255, 153, 153])
+        self.lower_friend_marker = np.array([238, 204, 0])  # B G R
+        self.upper_friend_marker = np.array([255, 221, 17])
+        self.player_marker_kernel = disk_kernel(3)
+        # bit order must match MinimapSnapshot colors
+        self.minimap_color_lut = build_color_lut([self._color_bounds(lower, upper) for lower, upper in (
+            (self.lower_player_marker, self.upper_player_marker),
+            (self.lower_rune_marker, self.upper_rune_marker),
+            (self.lower_stranger_marker, self.upper_stranger_marker),
+            (self.lower_guild_marker, self.upper_guild_marker),
+            (self.lower_friend_marker, self.upper_friend_marker),
+        )])
+        self._minimap_snapshot = None
+        # regions used by movement loops, which only read player position and check dialog
+        self.minimap_capture_plan = CapturePlan(minimap=self.minimap_region, dialog=self.dialog_button_region)
 
         self.img_handle.get_game_hwnd()
         if not self.img_handle.hwnd:
             raise MapleWindowNotFoundError
 
+    def _color_bounds(self, lower, upper):
+        """Color range for frames of this processor, alpha channel accepts anything in BGRA mode"""
+        if self.bgra:
+            return np.append(lower, 0), np.append(upper, 255)
+        return lower, upper
+
     @property
     def gray_img(self):
         if self._gray_img is not None:
             return self._gray_img
         elif self.bgr_img is not None:
-            self._gray_img = cv2.cvtColor(self.bgr_img, cv2.COLOR_BGR2GRAY)
+            self._gray_img = cv2.cvtColor(self.bgr_img, self._to_gray)
             return self._gray_img
         else:
             return None
 
-    def update_image(self, src=None, set_focus=True):
+    def update_image(self, src=None, set_focus=True, plan=None, newer_than=None):
         """
         Calls ScreenCapturer's update function and updates images.
         :param src : rgb image data from PIL ImageGrab
-        :param set_focus : True if win32api setfocus shall be called before capturing"""
+        :param set_focus : True if win32api setfocus shall be called before capturing
+        :param plan : CapturePlan, capture its regions only (e.g. self.minimap_capture_plan). Checks need whole frame
+                      will capture again by themselves. If frame grabber is running, frame of self.minimap_capture_plan
+                      is taken from it instead of capturing
+        :param newer_than : perf_counter timestamp, frame from frame grabber must be captured after it"""
         if set_focus and not self.img_handle.is_foreground():
             self.img_handle.set_foreground()
 
         if src:
-            bgr_img = cv2.cvtColor(np.array(src), cv2.COLOR_RGB2BGR)
+            bgr_img = cv2.cvtColor(np.array(src), cv2.COLOR_RGB2BGRA if self.bgra else cv2.COLOR_RGB2BGR)
+            frame_time = time.perf_counter()
+            plan = None
+        elif self.frame_grabber is not None and plan is self.minimap_capture_plan:
+            bgr_img, frame_time = self.frame_grabber.get_frame(newer_than)
         else:
-            bgr_img = self.img_handle.capture()
+            frame_time = time.perf_counter()
+            bgr_img = self.img_handle.capture(plan=plan, reuse_buffer=True, bgra=self.bgra)
 
         if bgr_img is None:
             raise GameCaptureError('failed to capture game window')
 
         self.bgr_img = bgr_img
+        self.frame_time = frame_time
+        self.is_partial_frame = plan is not None
         self._gray_img = None
+        self._update_minimap_fingerprint()
+        if self.recorder is not None:  # minimap rect of last frame, searching here would capture again
+            self.recorder.add_frame(bgr_img, frame_time, self.minimap_rect, self.is_partial_frame)
+
+    def start_frame_grabber(self, source=None, ring_size=3, interval=FrameGrabber.FRAME_INTERVAL):
+        """
+        Capture self.minimap_capture_plan continuously in background, so update_image(plan=self.minimap_capture_plan)
+        doesn't wait for capture.
+        :param source: callable returning frame, default capture by a new ScreenProcessor (CaptureSession isn't thread
+                       safe, self.img_handle is still used for full frame captures of this thread)
+        """
+        self.stop_frame_grabber()
+        if source is None:
+            capturer = ScreenProcessor()
+            capturer.hwnd, capturer.is_window_scaled = self.img_handle.hwnd, self.img_handle.is_window_scaled
+            plan = self.minimap_capture_plan
+            source = lambda: capturer.capture(plan=plan, reuse_buffer=True, bgra=self.bgra)
+        self.frame_grabber = FrameGrabber(source, ring_size, interval)
+        self.frame_grabber.start()
+        return self.frame_grabber
+
+    def stop_frame_grabber(self):
+        if self.frame_grabber is not None:
+            self.frame_grabber.stop()
+            self.frame_grabber = None
+
+    def _update_minimap_fingerprint(self):
+        """
+        Minimap only refreshes about every 80ms, so most captures of a polling loop have identical minimap.
+        If CRC of subsampled minimap is unchanged, last frame's MinimapSnapshot (with its computed markers) is reused.
+        Subsample step is 2 because every marker is wider than 2 pixels, movement of it always changes sampled pixels.
+        """
+        fingerprint = None
+        rect = self.minimap_rect
+        if rect and rect[0] + rect[2] <= self.bgr_img.shape[1] and rect[1] + rect[3] <= self.bgr_img.shape[0]:
+            fingerprint = self.region_fingerprint(rect, 2)
+
+        self.minimap_changed = fingerprint is None or fingerprint != self._minimap_fingerprint
+        self._minimap_fingerprint = fingerprint
+        snapshot = self._minimap_snapshot
+        if self.minimap_changed or snapshot is None or snapshot.rect != rect:
+            self._minimap_snapshot = None
+            self.minimap_changed_time = time.perf_counter()
+        else:
+            snapshot.rebind(self.bgr_img)
+
+    def region_fingerprint(self, region, step=1):
+        """
+        :param region: (x, y, w, h) of current frame
+        :param step: subsample step
+        :return: CRC of region pixels, changes if content of region changed
+        """
+        x, y, w, h = region
+        return zlib.crc32(np.ascontiguousarray(self.bgr_img[y:y+h:step, x:x+w:step, :3]))
+
+    @property
+    def minimap_age(self):
+        """Seconds since minimap content last changed. Tells whether markers are fresh or reused from older frame"""
+        return time.perf_counter() - self.minimap_changed_time
 
     def get_minimap_rect(self):
         """
         Processes self.gray images, returns minimap bounding box
         :return: Array [x,y,w,h] bounding box of minimap if found, else 0
         """
-        cropped = self.gray_img[self.default_minimap_scan_area[1]:self.default_minimap_scan_area[3], self.default_minimap_scan_area[0]:self.default_minimap_scan_area[2]]
+        x1, y1, x2, y2 = self.default_minimap_scan_area
+        cropped = self._gray_crop(x1, y1, x2 - x1, y2 - y1)
         blurred_img = cv2.GaussianBlur(cropped, (3,3), 3)
         morphed_img = cv2.erode(blurred_img, (7,7))
         canny = cv2.Canny(morphed_img, threshold1=180, threshold2=255)  # canny edge detect
@@ -282,12 +948,51 @@ class StaticImageProcessor:
                     minimap_coords[0] += self.default_minimap_scan_area[0]
                     minimap_coords[1] += self.default_minimap_scan_area[1]
                     self.minimap_rect = minimap_coords
+                    self._minimap_border = self._sample_minimap_border(minimap_coords)
                     return minimap_coords
                 else:
                     pass
 
         return None
 
+    def find_minimap_rect(self):
+        """
+        Cached version of self.get_minimap_rect. Cached rect is validated by comparing pixels of minimap border with
+        the ones sampled when it was detected, and full search runs only when validation fails.
+        If full search also fails, cached rect is kept (minimap may be covered by dialog for a moment), and full search
+        isn't repeated for other find_* calls of the same frame.
+        :return: Array [x,y,w,h] bounding box of minimap if found, else None
+        """
+        if self.minimap_rect and self._minimap_border is not None:
+            current = self._sample_minimap_border(self.minimap_rect)
+            if current is not None and cv2.absdiff(current, self._minimap_border).mean() <= self.minimap_border_tolerance:
+                self.minimap_rect_hits += 1
+                return self.minimap_rect
+            if self._minimap_miss_frame_time == self.frame_time:
+                return self.minimap_rect
+
+        self.minimap_rect_misses += 1
+        self._ensure_full_frame()  # minimap may have moved out of captured regions
+        rect = self.get_minimap_rect()
+        if rect is None:
+            self._minimap_miss_frame_time = self.frame_time  # frame searched, may be a new full frame
+        return rect or self.minimap_rect
+
+    def _sample_minimap_border(self, rect):
+        """:return: BGR pixels sampled from the band along minimap border, None if rect is out of image"""
+        x, y, w, h = rect
+        if x + w > self.bgr_img.shape[1] or y + h > self.bgr_img.shape[0]:
+            return None
+
+        band = self.MINIMAP_BORDER_BAND
+        step = self.MINIMAP_BORDER_SAMPLE_STEP
+        return np.concatenate((
+            self.bgr_img[y:y+band, x:x+w:step, :3].reshape(-1, 3),  # top
+            self.bgr_img[y+h-band:y+h, x:x+w:step, :3].reshape(-1, 3),  # bottom
+            self.bgr_img[y:y+h:step, x:x+band, :3].reshape(-1, 3),  # left
+            self.bgr_img[y:y+h:step, x+w-band:x+w, :3].reshape(-1, 3),  # right
+        ))
+
     def reset_minimap_area(self):
         """
         Resets self.minimap_area which is used to reset self.get_minimap_rect search.
@@ -295,91 +1000,39 @@ class StaticImageProcessor:
         """
         self.minimap_area = 0
 
+    def get_minimap_snapshot(self, rect=None):
+        """
+        Get MinimapSnapshot of current frame. Snapshot is built once per frame (and minimap rect), so every marker
+        search of the frame shares one crop and one color classification pass.
+        :param rect: [x,y,w,h] bounding box of minimap. Default: cached rect from self.find_minimap_rect
+        :return: MinimapSnapshot
+        """
+        if not rect:
+            rect = self.find_minimap_rect()
+            if not rect:
+                raise MiniMapError('Invalid minimap coordinates')
+
+        snapshot = self._minimap_snapshot
+        if snapshot is None or snapshot.frame is not self.bgr_img or snapshot.rect != rect:
+            self._minimap_snapshot = MinimapSnapshot(self, rect)
+        return self._minimap_snapshot
+
     def find_player_minimap_marker(self, rect=None):
         """
         Processes self.bgr_image to return player coordinate on minimap.
-        The player marker has exactly 12 pixels of the detection color to form a pixel circle(2,4,4,2 pixels). Therefore
-        before calculation the mean pixel value of the mask, we remove "false positives", which are not part of the
-        player color by finding pixels which do not have between 10 to 12 other pixels(including itself) of the same color in a
-        distance of 3.
         :param rect: [x,y,w,h] bounding box of minimap in MapleStory screen. Call self.get_minimap_rect to obtain
-        :return: x,y coordinate of player relative to ms_screen_rect if found, else 0
+        :return: x,y coordinate of player relative to ms_screen_rect if found, else None
         """
-        if not rect and not self.minimap_rect:
-            rect = self.get_minimap_rect()
-        else:
-            rect = self.minimap_rect
-
-        if not rect:
-            raise MiniMapError('Invalid minimap coordinates')
-
-        cropped = self.bgr_img[rect[1]:rect[1]+rect[3], rect[0]:rect[0]+rect[2]]
-        mask = cv2.inRange(cropped, self.lower_player_marker, self.upper_player_marker)
-        td = np.transpose(np.where(mask > 0)).tolist()
-
-        if len(td) > 0:
-            avg_x = 0
-            avg_y = 0
-            totalpoints = 0
-            for coord in td:
-                nearest_points = 0  # Points which are close to coord pixel
-                for ref_coord in td:
-                    # Calculate the range between every single pixel
-                    if math.sqrt(abs(ref_coord[0]-coord[0])**2 + abs(ref_coord[1]-coord[1])**2) <= 3:
-                        nearest_points += 1
-
-                if 10 <= nearest_points <= 13:
-                    avg_y += coord[0]
-                    avg_x += coord[1]
-                    totalpoints += 1
-
-            if totalpoints == 0:
-                return None
-
-            avg_y = int(avg_y / totalpoints)
-            avg_x = int(avg_x / totalpoints)
-            return avg_x, avg_y
-
-        return None
+        return self.get_minimap_snapshot(rect).player_marker
 
     def find_other_player_marker(self, rect=None):
         """
-        Processes self.bgr_image to return coordinate of other players on minimap if exists.
-        Does not behave as expected when there are more than one other player on map. Use this function to just detect.
+        Processes self.bgr_image to return markers of other players on minimap.
         :param rect: [x,y,w,h] bounding box of minimap. Call self.get_minimap_rect
-        :return: x,y coord of marker if found, else 0
+        :return: list of (x, y, kind) where kind is 'stranger', 'guild' or 'friend', sorted by kind priority.
+                 Empty list if no other player
         """
-        if not rect and not self.minimap_rect:
-            rect = self.get_minimap_rect()
-        else:
-            rect = self.minimap_rect
-
-        if not rect:
-            raise MiniMapError('Invalid minimap coordinates')
-
-        cropped = self.bgr_img[rect[1]:rect[1]+rect[3], rect[0]:rect[0]+rect[2]]
-
-        stranger = (np.array((0, 0, 255)), np.array((0, 0, 255)))
-        guild = (np.array((255, 102, 102)), np.array((255, 153, 153)))
-        friend = (np.array((238, 204, 0)), np.array((255, 221, 17)))
-
-        for i in (stranger, guild, friend) if self.detect_friend else (stranger, guild):
-            mask = cv2.inRange(cropped, i[0], i[1])
-            td = np.transpose(np.where(mask > 0)).tolist()
-
-            if len(td) >= 5:
-                avg_x = 0
-                avg_y = 0
-                totalpoints = 0
-                for coord in td:
-                    avg_y += coord[0]
-                    avg_x += coord[1]
-                    totalpoints += 1
-                avg_y = int(avg_y / totalpoints)
-                avg_x = int(avg_x / totalpoints)
-                return avg_x, avg_y
-
-        return None
+        return self.get_minimap_snapshot(rect).other_player_markers
 
     def find_rune_marker(self, rect=None):
         """
@@ -387,70 +1040,63 @@ class StaticImageProcessor:
         :param rect: [x,y,w,h] bounding box of minimap. Call self.get_minimap_rect
         :return: x,y of rune minimap coordinates if found, else 0
         """
-        if not rect and not self.minimap_rect:
-            rect = self.get_minimap_rect()
-        else:
-            rect = self.minimap_rect
+        markers = self.find_rune_markers(rect)
+        return markers[0] if markers else 0
 
-        if not rect:
-            raise MiniMapError('Invalid minimap coordinates')
-
-        cropped = self.bgr_img[rect[1]:rect[1] + rect[3], rect[0]:rect[0] + rect[2]]
-        mask = cv2.inRange(cropped, self.lower_rune_marker, self.upper_rune_marker)
-        td = np.transpose(np.where(mask > 0)).tolist()
-        if len(td) > 0:
-            avg_x = 0
-            avg_y = 0
-            totalpoints = 0
-            for coord in td:
-                nearest_points = 0  # Points which are close to coord pixel
-                for ref_coord in td:
-                    # Calculate the range between every single pixel
-                    if math.sqrt(abs(ref_coord[0] - coord[0]) ** 2 + abs(ref_coord[1] - coord[1]) ** 2) <= 6:
-                        nearest_points += 1
-
-                if 20 <= nearest_points <= 25:
-                    avg_y += coord[0]
-                    avg_x += coord[1]
-                    totalpoints += 1
-
-            if totalpoints == 0:
-                return 0
-
-            avg_y = int(avg_y / totalpoints)
-            avg_x = int(avg_x / totalpoints)
-            return avg_x, avg_y
-
-        return 0
+    def find_rune_markers(self, rect=None):
+        """
+        Processes self.bgr_image to return coordinates of every rune marker candidate on minimap.
+        :param rect: [x,y,w,h] bounding box of minimap. Call self.get_minimap_rect
+        :return: list of x,y of rune minimap coordinates, largest candidate first
+        """
+        return self.get_minimap_snapshot(rect).rune_markers
 
-    def check_death(self):
-        h, w = self.gray_img.shape
-        # countdown area
+    def death_countdown_region(self, client_size):
+        """:return: (x, y, w, h) of death countdown area"""
+        w, h = client_size
         area_w = 174
         area_h = 17
-        x = (w // 2) - (area_w // 2) + 12
-        y = h - 54
+        return (w // 2) - (area_w // 2) + 12, h - 54, area_w, area_h
+
+    def dialog_button_region(self, client_size):
+        """:return: (x, y, w, h) of 'End Chat' button area of dialog"""
+        w, h = client_size
+        x = (w // 2) - (self.DIALOG_W // 2)
+        y = (h // 2) - (self.DIALOG_H // 2)
+        return x, y + self.DIALOG_H - 28, 103, 28
+
+    def minimap_region(self, _client_size=None):
+        """:return: (x, y, w, h) of minimap if located, else area to search minimap"""
+        if self.minimap_rect:
+            return tuple(self.minimap_rect)
+        x1, y1, x2, y2 = self.default_minimap_scan_area
+        return x1, y1, x2 - x1, y2 - y1
+
+    def frame_size(self):
+        """:return: width, height of current frame"""
+        return self.bgr_img.shape[1], self.bgr_img.shape[0]
+
+    def _gray_crop(self, x, y, w, h):
+        """Grayscale of an area. Converts only the area unless gray image of whole frame is already there"""
+        if self._gray_img is not None:
+            return self._gray_img[y:y+h, x:x+w]
+        return cv2.cvtColor(self.bgr_img[y:y+h, x:x+w], self._to_gray)
+
+    def _ensure_full_frame(self):
+        """Capture whole frame if current one is captured by CapturePlan"""
+        if self.is_partial_frame:
+            self.update_image(set_focus=False)
 
-        cropped = self.gray_img[y:y+area_h, x:x+area_w]
+    def check_death(self):
+        cropped = self._gray_crop(*self.death_countdown_region(self.frame_size()))
         # Image.fromarray(cropped).show()
-        match_res = cv2.matchTemplate(cropped, self.cv_templates['hp0'], cv2.TM_SQDIFF_NORMED)
+        match_res = cv2.matchTemplate(cropped, self.templates['hp0'].gray, cv2.TM_SQDIFF_NORMED)
         loc = np.where(match_res < 0.06)
         return len(loc[0]) == 1
 
     def check_monster(self, name, crop_dir=None):
-        tpl = self.cv_templates.get(name)
-        if tpl is None:  # lazy load
-            path = ':/template/monster/' + name + '_tpl.png'
-            tpl = self.cv_templates[name] = cv2.imdecode(read_qt_resource(path, True), cv2.IMREAD_GRAYSCALE)
-            if tpl is None:
-                raise FileNotFoundError(path)
-            tpl_mask = self.cv_templates[name + '_mask'] = read_alpha_as_mask(path)
-            tpl_r = self.cv_templates[name + '_r'] = np.fliplr(tpl)
-            tpl_r_mask = self.cv_templates[name + '_r_mask'] = np.fliplr(tpl_mask)
-        else:
-            tpl_mask = self.cv_templates[name + '_mask']
-            tpl_r = self.cv_templates[name + '_r']
-            tpl_r_mask = self.cv_templates[name + '_r_mask']
+        self._ensure_full_frame()
+        tpl = self.templates['monster/' + name]
 
         img_h, img_w = self.gray_img.shape[:2]
         img = self.gray_img
@@ -459,34 +1105,32 @@ class StaticImageProcessor:
         elif crop_dir == 'r':
             img = img[50:img_h-100, img_w//2:img_w]
 
-        res = cv2.matchTemplate(img, tpl, cv2.TM_SQDIFF_NORMED, mask=tpl_mask)
-        if len(np.where(res <= 0.04)[0]) > 0:
-            return True
-        res = cv2.matchTemplate(img, tpl_r, cv2.TM_SQDIFF_NORMED, mask=tpl_r_mask)
-        return len(np.where(res <= 0.04)[0]) > 0
+        for i in (tpl, tpl.mirrored):
+            res = cv2.matchTemplate(img, i.gray, cv2.TM_SQDIFF_NORMED, mask=i.mask)
+            if len(np.where(res <= 0.04)[0]) > 0:
+                return True
+        return False
 
     def check_white_room(self):
         """Assume in white room if 40% or more pixels are pure white. Percentage of sample in unittest is 79%"""
+        self._ensure_full_frame()
         area = self.bgr_img.shape[0] * self.bgr_img.shape[1]
-        return ((self.bgr_img == (255, 255, 255)).all(axis=-1).sum() / area) > 0.4
+        return ((self.bgr_img[:, :, :3] == (255, 255, 255)).all(axis=-1).sum() / area) > 0.4
 
     def check_gm_cap(self):
         """Check Game Master's white cap with letter 'W'"""
-        for i in ('gm_cap', 'gm_cap_r'):
-            match_res = cv2.matchTemplate(self.gray_img, self.cv_templates[i], cv2.TM_SQDIFF_NORMED, mask=self.cv_templates[i+'_mask'])
-            loc = np.where(match_res < 0.001)
-            if len(loc[0]) == 1:
+        self._ensure_full_frame()
+        coarse_gray = half_scale(self.gray_img)
+        for matcher in self.gm_cap_matchers:
+            if len(matcher.find(self.gray_img, coarse_gray)) == 1:
                 return True
         return False
 
     def check_dialog(self):
         """Match 'End Chat' button of dialog (at left bottom)"""
-        h, w = self.gray_img.shape
-        x = (w // 2) - (self.DIALOG_W // 2)
-        y = (h // 2) - (self.DIALOG_H // 2)
-        cropped = self.gray_img[y+self.DIALOG_H-28:y+self.DIALOG_H, x:x+103]
+        cropped = self._gray_crop(*self.dialog_button_region(self.frame_size()))
 
-        match_res = cv2.matchTemplate(cropped, self.cv_templates['dialog_end_chat'], cv2.TM_SQDIFF_NORMED)
+        match_res = cv2.matchTemplate(cropped, self.templates['dialog_end_chat'].gray, cv2.TM_SQDIFF_NORMED)
         loc = np.where(match_res < 0.015)
 
         return len(loc[0] == 1)
@@ -511,14 +1155,26 @@ class MockScreenProcessor(ScreenProcessor):
     def ms_get_screen_rect(self, _=None):
         return (0, 0, 500, 500)
 
-    def capture(self, hwnd=None, rect=None):
-        return self.img
+    def get_client_size(self):
+        return self.img.shape[1], self.img.shape[0]
+
+    def capture(self, hwnd=None, rect=None, plan=None, reuse_buffer=False, bgra=False):
+        img = cv2.cvtColor(self.img, cv2.COLOR_BGR2BGRA) if bgra else self.img
+        if rect is not None:
+            x, y, w, h = rect
+            return img[y:y+h, x:x+w].copy()
+        if plan is not None:
+            frame = np.zeros_like(img)
+            for x, y, w, h in plan.resolve(self.get_client_size()):
+                frame[y:y+h, x:x+w] = img[y:y+h, x:x+w]
+            return frame
+        return img
 
 
 class MockStaticImageProcessor(StaticImageProcessor):
     """For unit test"""
-    def __init__(self):
-        super().__init__(MockScreenProcessor())
+    def __init__(self, bgra=False):
+        super().__init__(MockScreenProcessor(), bgra)
 
     def set_test_img(self, path):
         self.img_handle.set_test_img(path)
@@ -0,0 +1,232 @@
+"""
+Compact recording of live sessions: minimap crop of every frame, periodic full frames and key events.
+
+A session is a directory of append-only files:
+ - meta.json: format version and tile size
+ - data.bin: PNG encoded tiles and tile tables
+ - frames.idx: one FRAME_DTYPE record per frame
+ - keys.idx: one KEY_DTYPE record per key event
+An image (minimap crop or full frame) is split into tiles, only tiles changed since previous image of same stream are
+encoded, and its tile table (data.bin location of newest PNG of every tile) is stored. Reading any frame is decoding
+its tile tables, independent of how many frames are before it. Index files are fixed size records, read by np.memmap.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+
+FORMAT_VERSION = 1
+FRAME_DTYPE = np.dtype([('timestamp', '<f8'), ('minimap_rect', '<i4', (4,)),
+                        ('minimap_table', '<u8'), ('minimap_table_size', '<u4'),
+                        ('full_table', '<u8'), ('full_table_size', '<u4'), ('full_timestamp', '<f8')])
+KEY_DTYPE = np.dtype([('timestamp', '<f8'), ('key', '<u2'), ('down', 'u1')])
+TABLE_HEADER_DTYPE = np.dtype([('h', '<i4'), ('w', '<i4'), ('c', '<i4'), ('tile', '<i4')])
+TABLE_ENTRY_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u4')])
+
+
+class _TileStream:
+    """Delta encoder of one image stream"""
+    def __init__(self, tile):
+        self.tile = tile
+        self.prev = None
+        self.entries = None
+
+    def encode(self, img, write):
+        """:return: (offset, size) of tile table of img, unchanged tiles refer to PNG of earlier images"""
+        h, w = img.shape[:2]
+        c = img.shape[2] if img.ndim == 3 else 1
+        ys, xs = np.arange(0, h, self.tile), np.arange(0, w, self.tile)
+        if self.prev is None or self.prev.shape != img.shape:
+            changed = np.ones((len(ys), len(xs)), bool)
+            self.entries = np.zeros(changed.size, TABLE_ENTRY_DTYPE)
+        else:
+            diff = cv2.absdiff(img, self.prev).reshape(h, w, -1).any(axis=2)
+            changed = np.logical_or.reduceat(np.logical_or.reduceat(diff, ys, axis=0), xs, axis=1)
+        for i in np.flatnonzero(changed):
+            y, x = ys[i // len(xs)], xs[i % len(xs)]
+            png = cv2.imencode('.png', img[y:y+self.tile, x:x+self.tile], (cv2.IMWRITE_PNG_COMPRESSION, 1))[1]
+            self.entries[i] = write(png.tobytes()), png.size
+        self.prev = img
+        header = np.array([(h, w, c, self.tile)], TABLE_HEADER_DTYPE)
+        table = header.tobytes() + self.entries.tobytes()
+        return write(table), len(table)
+
+
+class SessionRecorder:
+    """
+    Frames and key events are queued by the recording thread (e.g. macro loop) and encoded in a background thread, so
+    recording costs the loop only a copy. Frames are dropped instead of blocking when encoding falls behind.
+    """
+    def __init__(self, path, full_frame_interval=1.0, tile=32, queue_size=60):
+        """:param full_frame_interval: min seconds between recorded full frames"""
+        self.path = path
+        self.full_frame_interval = full_frame_interval
+        self.tile = tile
+        self.frames = 0
+        self.full_frames = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self._last_full_time = None
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._minimap_stream = _TileStream(tile)
+        self._full_stream = _TileStream(tile)
+        self._full_table = (0, 0, -1.0)  # offset, size, timestamp of newest full frame
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            with open(meta_path, 'w') as f:
+                json.dump({'format': 'msv-session', 'version': FORMAT_VERSION, 'tile': tile}, f)
+        self._data = open(os.path.join(path, 'data.bin'), 'ab')
+        self._offset = self._data.tell()
+        self._frames_file = open(os.path.join(path, 'frames.idx'), 'ab')
+        self._keys_file = open(os.path.join(path, 'keys.idx'), 'ab')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='SessionRecorder', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        for f in (self._data, self._frames_file, self._keys_file):
+            f.close()
+
+    def add_frame(self, frame, timestamp, minimap_rect=None, is_partial=False):
+        """
+        :param frame: captured frame, only minimap_rect region is used if is_partial
+        :param minimap_rect: (x, y, w, h), None if unknown
+        """
+        need_full = not is_partial and (self._last_full_time is None or
+                                        timestamp - self._last_full_time >= self.full_frame_interval)
+        if self._last_full_time is None and not need_full:
+            return  # replay needs a full frame before others
+        minimap = None
+        if minimap_rect:
+            x, y, w, h = minimap_rect
+            minimap = frame[y:y+h, x:x+w].copy()
+        full = frame.copy() if need_full else None
+        try:
+            self._queue.put_nowait(('frame', timestamp, minimap_rect, minimap, full))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if need_full:
+            self._last_full_time = timestamp
+
+    def add_key_event(self, key, down, timestamp=None):
+        # key events are never dropped, blocks if queue is full
+        self._queue.put(('key', time.perf_counter() if timestamp is None else timestamp, key, down))
+
+    def _write(self, data):
+        offset = self._offset
+        self._data.write(data)
+        self._offset += len(data)
+        self.bytes_written += len(data)
+        return offset
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if item[0] == 'key':
+                __, timestamp, key, down = item
+                self._keys_file.write(np.array([(timestamp, key, down)], KEY_DTYPE).tobytes())
+                continue
+
+            __, timestamp, minimap_rect, minimap, full = item
+            record = np.zeros(1, FRAME_DTYPE)
+            record['timestamp'] = timestamp
+            if minimap is not None and minimap.size:
+                record['minimap_rect'] = minimap_rect
+                record['minimap_table'], record['minimap_table_size'] = self._minimap_stream.encode(minimap,
+                                                                                                   self._write)
+            if full is not None:
+                self._full_table = self._full_stream.encode(full, self._write) + (timestamp,)
+                self.full_frames += 1
+            record['full_table'], record['full_table_size'], record['full_timestamp'] = self._full_table
+            # index record is written after its data, a reader never sees a frame whose data is incomplete
+            self._data.flush()
+            self._frames_file.write(record.tobytes())
+            self._frames_file.flush()
+            self.frames += 1
+
+
+class SessionReader:
+    """Random access to a recorded session. Also a frame source of msv.replay"""
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != 'msv-session' or self.meta.get('version') != FORMAT_VERSION:
+            raise ValueError('unsupported session format: %s' % self.meta)
+        self.data = self._memmap(os.path.join(path, 'data.bin'), np.uint8)
+        self.frames = self._memmap(os.path.join(path, 'frames.idx'), FRAME_DTYPE)
+        self.keys = self._memmap(os.path.join(path, 'keys.idx'), KEY_DTYPE)
+        self.timestamps = self.frames['timestamp']
+        self._table_cache = {}  # table offset -> decoded image, full frames are shared by many frames
+
+    @staticmethod
+    def _memmap(path, dtype):
+        dtype = np.dtype(dtype)
+        size = os.path.getsize(path)
+        if size < dtype.itemsize:  # np.memmap can't map empty file
+            return np.zeros(0, dtype)
+        return np.memmap(path, dtype, 'r', shape=(size // dtype.itemsize,))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _decode_table(self, offset, size):
+        if size == 0:
+            return None
+        img = self._table_cache.get(offset)
+        if img is not None:
+            return img
+        header = np.frombuffer(self.data[offset:offset+TABLE_HEADER_DTYPE.itemsize], TABLE_HEADER_DTYPE)[0]
+        h, w, c, tile = (int(i) for i in header)
+        entries = np.frombuffer(self.data[offset+TABLE_HEADER_DTYPE.itemsize:offset+size], TABLE_ENTRY_DTYPE)
+        img = np.empty((h, w, c) if c > 1 else (h, w), np.uint8)
+        cols = (w + tile - 1) // tile
+        for i, (tile_offset, tile_size) in enumerate(entries):
+            y, x = i // cols * tile, i % cols * tile
+            img[y:y+tile, x:x+tile] = cv2.imdecode(self.data[tile_offset:tile_offset+tile_size], cv2.IMREAD_UNCHANGED)
+        if len(self._table_cache) > 8:
+            self._table_cache.clear()
+        self._table_cache[offset] = img
+        return img
+
+    def minimap(self, index):
+        """:return: minimap crop of the frame, None if not recorded"""
+        record = self.frames[index]
+        return self._decode_table(int(record['minimap_table']), int(record['minimap_table_size']))
+
+    def full_frame(self, index):
+        """:return: newest full frame recorded at or before the frame"""
+        record = self.frames[index]
+        return self._decode_table(int(record['full_table']), int(record['full_table_size']))
+
+    def frame(self, index):
+        """:return: BGR frame, newest full frame with minimap of this frame drawn over it"""
+        img = self.full_frame(index)
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR) if img.shape[2] == 4 else img.copy()
+        minimap = self.minimap(index)
+        if minimap is not None:
+            x, y, w, h = (int(i) for i in self.frames[index]['minimap_rect'])
+            img[y:y+h, x:x+w] = minimap[:, :, :3]
+        return img
+
+    def key_events(self, start=None, end=None):
+        """:return: KEY_DTYPE records with timestamp in [start, end)"""
+        ts = self.keys['timestamp']
+        lo = 0 if start is None else np.searchsorted(ts, start)
+        hi = len(ts) if end is None else np.searchsorted(ts, end)
+        return self.keys[lo:hi]
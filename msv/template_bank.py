@@ -0,0 +1,145 @@
+"""Templates under resources/template, loaded once and preprocessed for matchTemplate"""
+import cv2
+import numpy as np
+from msv.util import read_qt_resource, list_qt_resource
+
+
+TEMPLATE_DIR = ':/template/'
+
+
+class Template:
+    def __init__(self, name, image, gray=None, mask=None, pyramid_levels=0):
+        """
+        :param image: BGR or BGRA image
+        :param gray: default converted from image
+        :param mask: 0/255 mask, default alpha channel of BGRA image, or non-black pixels of BGR image
+        :param pyramid_levels: count of half scale levels to precompute
+        """
+        self.name = name
+        self.bgr = np.ascontiguousarray(image[:, :, :3])
+        self.gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY) if gray is None else gray
+        self.has_alpha = image.shape[2] == 4
+        if mask is None:
+            if self.has_alpha:
+                mask = np.ascontiguousarray(image[:, :, 3])
+            else:
+                __, mask = cv2.threshold(self.gray, 1, 255, cv2.THRESH_BINARY)
+        self.mask = mask
+        self._mirrored = None
+        self.pyramid = [(self.gray, self.mask)]  # (gray, mask) of level 0, 1, ...
+        for _ in range(pyramid_levels):
+            gray, mask = self.pyramid[-1]
+            h, w = gray.shape[0] // 2, gray.shape[1] // 2
+            if h == 0 or w == 0:
+                break
+            self.pyramid.append((cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA),
+                                 cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)))
+
+    @property
+    def shape(self):
+        return self.gray.shape
+
+    @property
+    def mirrored(self):
+        """Template flipped horizontally (e.g. monster facing the other side)"""
+        if self._mirrored is None:
+            self._mirrored = Template(self.name + '_r', *(np.ascontiguousarray(np.fliplr(i)) for i in
+                                                          (self.bgr, self.gray, self.mask)),
+                                      pyramid_levels=len(self.pyramid) - 1)
+        return self._mirrored
+
+    def rotated(self, k, name=None, mask=None):
+        """
+        Template rotated by 90 degrees k times counter-clockwise (like np.rot90)
+        :param mask: mask of this template to rotate instead of self.mask
+        """
+        mask = self.mask if mask is None else mask
+        return Template(name or '%s_rot%d' % (self.name, k % 4), *(np.ascontiguousarray(np.rot90(i, k)) for i in
+                                                                   (self.bgr, self.gray, mask)),
+                        pyramid_levels=len(self.pyramid) - 1)
+
+
+class TemplateBank:
+    """
+    Every template image under resources/template, named by path relative to it without extension and '_tpl' suffix
+    (e.g. 'gm_cap', 'monster/ascendion'). Use get_template_bank() to share the loaded one.
+    """
+    def __init__(self, pyramid_levels=0):
+        self.pyramid_levels = pyramid_levels
+        self.templates = {}
+        self._load_dir('')
+
+    def _load_dir(self, sub_dir):
+        for file, is_dir in sorted(list_qt_resource(TEMPLATE_DIR + sub_dir)):
+            if is_dir:
+                self._load_dir(sub_dir + file + '/')
+                continue
+            stem, ext = file.rsplit('.', 1)
+            if ext.lower() != 'png':
+                continue
+            path = TEMPLATE_DIR + sub_dir + file
+            data = read_qt_resource(path, True)
+            image = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise FileNotFoundError(path)
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            # decoder's own gray conversion differs from cvtColor by a few levels, keep the one templates are tuned with
+            gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+            if stem.endswith('_tpl'):
+                stem = stem[:-4]
+            self.templates[sub_dir + stem] = Template(sub_dir + stem, image, gray, pyramid_levels=self.pyramid_levels)
+
+    def add(self, template):
+        """Add a template (e.g. derived one). :return: template"""
+        self.templates[template.name] = template
+        return template
+
+    def __getitem__(self, name):
+        return self.templates[name]
+
+    def __contains__(self, name):
+        return name in self.templates
+
+    def score_maps(self, img, templates, method=cv2.TM_SQDIFF_NORMED, color=False, masked=True):
+        """
+        Match several templates on one source image, converted to gray only once.
+        :param templates: names or Template objects
+        :param color: match BGR templates on BGR image instead of gray
+        :param masked: use mask of templates
+        :return: list of matchTemplate results in order of templates
+        """
+        if color:
+            src = img[:, :, :3] if img.shape[2] == 4 else img
+        elif img.ndim == 3:
+            src = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+        else:
+            src = img
+        results = []
+        for template in templates:
+            if isinstance(template, str):
+                template = self.templates[template]
+            tpl = template.bgr if color else template.gray
+            results.append(cv2.matchTemplate(src, tpl, method, mask=template.mask if masked else None))
+        return results
+
+    def match_many(self, img, names, threshold, method=cv2.TM_SQDIFF_NORMED, color=False, masked=True):
+        """
+        :param threshold: max score of SQDIFF methods, min score of others
+        :return: dict name -> (ys, xs) of matched positions, like np.where
+        """
+        sqdiff = method in (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED)
+        ret = {}
+        for name, res in zip(names, self.score_maps(img, names, method, color, masked)):
+            ret[name if isinstance(name, str) else name.name] = np.where(res <= threshold if sqdiff else res >= threshold)
+        return ret
+
+
+_bank = None
+
+
+def get_template_bank():
+    global _bank
+    if _bank is None:
+        _bank = TemplateBank()
+    return _bank
@@ -3,7 +3,10 @@ import math
 import os
 import pickle
 import enum
+import heapq
 import random
+import numpy as np
+from msv import terrain_format
 from msv.util import read_qt_resource
 
 """
@@ -76,27 +79,43 @@ class Solution:
         self.upper_bound = upper_bound
         self.method = method
         self.visited = visited
+        self.attempts = 0
+        self.successes = 0
+        self.mean_duration = 0.0  # seconds, over all attempts
+
+    def record(self, duration, success):
+        """Add an observed execution of this move to its running statistics"""
+        self.attempts += 1
+        self.successes += bool(success)
+        self.mean_duration += (duration - self.mean_duration) / self.attempts
 
     def __repr__(self):
         return 'Solution(%s -> %s by %s)' % (self.from_hash, self.to_hash, self.method)
 
 
-class AstarNode:
-    def __init__(self, x=None, y=None, g=None, h=None, path=None):
-        self.x = x
-        self.y = y
-        self.g = g
-        self.h = h
-        self.f = 0
-        self.path = [] if path is None else path
-        if self.g:
-            self.f = self.g + self.h
-
-
 class PathAnalyzer:
     """Converts minimap player coordinates to terrain information like ladders and platforms."""
     TELEPORT_VERTICAL_RANGE = 24
     JUMP_RANGE = 8  # horizontal jump distance is about 9~10
+    # expected seconds of _player_move of moves never executed yet, drop and jumps wait until player lands
+    MOVE_DURATION_PRIOR = {
+        MoveMethod.DROP: 0.6,
+        MoveMethod.JUMPL: 0.6,
+        MoveMethod.JUMPR: 0.6,
+        MoveMethod.TELEPORTL: 0.3,
+        MoveMethod.TELEPORTR: 0.3,
+        MoveMethod.TELEPORTUP: 0.3,
+        MoveMethod.TELEPORTDOWN: 0.3,
+        MoveMethod.MOVEL: 0.4,
+        MoveMethod.MOVER: 0.4,
+        MoveMethod.JUMPTELEPORTUP: 0.5,
+    }
+    # seconds every move costs outside _player_move: moving into position by horizontal_move_goal, key up waits and
+    # checking the landing platform. A detour pays it once per hop
+    MOVE_HOP_OVERHEAD = 0.6
+    MOVE_SUCCESS_PRIOR = 0.9
+    MOVE_PRIOR_WEIGHT = 2  # prior counts as this many observed attempts
+    RETRY_PENALTY = 1.0  # seconds lost by a failed move, wait of navigate_to_platform and moving back into position
 
     def __init__(self):
         self.platforms = {}  # Format: hash, Platform()
@@ -120,32 +139,53 @@ class PathAnalyzer:
         # below constants are used for path related algorithms.
         self.subplatform_length = 2  # length of subdivided platform
 
-        self.astar_map_grid = []  # maap grid representation for a star graph search. reinitialized  on every call
-        self.astar_open_val_grid = []  # 2d array to keep track of "open" values in a star search.
+        self.astar_map_grid = None  # uint8 grid of minimap, 1 where a platform is. built by load(), None if outdated
+        self.astar_g_grid = None  # float32 grid of best g value found for each pixel, reset by every search
+        self.astar_below_grid = None  # row of nearest platform pixel below each pixel, number of rows if none
+        self.astar_above_grid = None  # 1 where a platform pixel is above in teleport range (rows >= 1)
         self.astar_minimap_rect = []  # minimap rect (x,y,w,h) for use in generating astar data
 
+        self.route_table = {}  # from hash -> {to hash: (cost, first Solution of route)}, for every reachable platform
+        self.platform_index = {}  # (above, below, side) -> (platforms, count, int16 label raster, hash of labels)
+
         self.set_skill_coord = {}
         self.other_attrs = {}
 
     def save(self, filename="mapdata.platform", other_attrs=None):
-        """Save platforms, minimap to a file"""
-        data = {"platforms": self.platforms}
-        if other_attrs:
-            data.update(other_attrs)
+        """
+        Save platforms, minimap to a file in msv.terrain_format
+        :param other_attrs: minimap rect, set skill coords etc., must be JSON serializable
+        """
+        platforms = np.array([(p.hash.encode(), p.start_x, p.start_y, p.end_x, p.end_y, p.no_monster)
+                              for p in self.platforms.values()], terrain_format.PLATFORM_DTYPE)
         with open(filename, "wb") as f:
-            pickle.dump(data, f)
+            f.write(terrain_format.dumps(dict(other_attrs or {}), {'platforms': platforms}))
+
+    def _read(self, filename):
+        """:return: dict of attributes and platforms, from terrain file or legacy pickle"""
+        if filename.startswith(':'):
+            buffer = np.frombuffer(read_qt_resource(filename, False), np.uint8)
+        else:
+            buffer = terrain_format.read_file(filename)
+        if not terrain_format.is_terrain_file(buffer):
+            return pickle.loads(bytes(buffer))
+
+        attrs, arrays = terrain_format.loads(buffer)
+        data = {k: tuple(v) if k.endswith('_coord') and isinstance(v, list) else v for k, v in attrs.items()}
+        data['platforms'] = {}
+        for record in arrays['platforms']:
+            platform = Platform(int(record['start_x']), int(record['start_y']), int(record['end_x']),
+                                int(record['end_y']), record['hash'].decode())
+            platform.no_monster = bool(record['no_monster'])
+            data['platforms'][platform.hash] = platform
+        return data
 
     def load(self, filename="mapdata.platform"):
         """Open a map data file and load data from file. Also sets class variables platform and minimap.
+        Solutions, routes and A* grids are computed from platforms, so they always follow current code.
         :param filename: Path to map data file
         :return boundingRect tuple of minimap as stored on file (defaults to (x, y, w, h) if file is valid else 0"""
-        if filename.startswith(':'):
-            content = read_qt_resource(filename, False)
-        else:
-            with open(filename, "rb") as f:
-                content = f.read()
-
-        data = pickle.loads(content)
+        data = self._read(filename)
         self.platforms = data['platforms']
         minimap_coords = data['minimap']
         self.astar_minimap_rect = minimap_coords
@@ -155,19 +195,57 @@ class PathAnalyzer:
         self.other_attrs = {k: v for (k, v) in data.items() if k != 'platforms' and not k.endswith('_coord')}
 
         self.generate_solution_dict()
-        self.astar_map_grid = []
-        self.astar_open_val_grid = []
-        map_width, map_height = self.astar_minimap_rect[2], self.astar_minimap_rect[3]
+        self.build_astar_grids()
+        self.platform_index = {}
+        return minimap_coords
 
-        # Reinitialize map grid data
-        for height in range(map_height + 1):
-            self.astar_map_grid.append([0 for x in range(map_width + 1)])
-            self.astar_open_val_grid.append([0 for x in range(map_width + 1)])
-        for key, platform in self.platforms.items():
+    def build_astar_grids(self):
+        """Build A* grids of self.platforms, call again after platforms or self.astar_minimap_rect changed"""
+        map_width, map_height = self.astar_minimap_rect[2], self.astar_minimap_rect[3]
+        self.astar_map_grid = np.zeros((map_height + 1, map_width + 1), np.uint8)
+        self.astar_g_grid = np.empty((map_height + 1, map_width + 1), np.float32)
+        for platform in self.platforms.values():
             # currently this only uses the platform's start x and y coords and traces them until end x coords.
-            for platform_coord in range(platform.start_x, platform.end_x + 1):
-                self.astar_map_grid[platform.start_y][platform_coord] = 1
-        return minimap_coords
+            self.astar_map_grid[platform.start_y, platform.start_x:platform.end_x + 1] = 1
+
+        # column scans of astar_find_available_moves, precomputed so each is one lookup
+        rows = map_height + 1
+        ys = np.arange(rows)
+        below = np.where(self.astar_map_grid == 1, ys[:, None], rows).astype(np.int32)
+        self.astar_below_grid = np.full((rows, map_width + 1), rows, np.int32)
+        self.astar_below_grid[:-1] = np.minimum.accumulate(below[:0:-1], axis=0)[::-1]  # nearest in rows > y
+        count_above = np.zeros((rows + 1, map_width + 1), np.int32)  # count_above[y] is platform pixels in rows < y
+        np.cumsum(self.astar_map_grid, axis=0, out=count_above[1:])
+        top = np.maximum(ys - self.TELEPORT_VERTICAL_RANGE, 1)
+        self.astar_above_grid = (count_above[ys] - count_above[top] > 0).astype(np.uint8)
+
+    def find_platform(self, x, y, above=0, below=0, side=0):
+        """
+        Locate platform at a minimap coordinate by one read of a label raster, built once for every tolerance
+        :param above, below: a platform matches if start_y - above <= y <= start_y + below
+        :param side: and start_x - side <= x <= end_x + side
+        :return: hash of first matching platform in order of self.platforms, None if none
+        """
+        if x is None or y is None:
+            return None
+        index = self.platform_index.get((above, below, side))
+        if index is None or index[0] is not self.platforms or index[1] != len(self.platforms):  # input() adds directly
+            index = self.platform_index[(above, below, side)] = self._build_platform_raster(above, below, side)
+        raster = index[2]
+        if 0 <= y < raster.shape[0] and 0 <= x < raster.shape[1]:
+            return index[3][raster.item(y, x)]
+        return None
+
+    def _build_platform_raster(self, above, below, side):
+        platforms = list(self.platforms.values())
+        height = max([p.start_y + below + 1 for p in platforms] + [0])
+        width = max([p.end_x + side + 1 for p in platforms] + [0])
+        raster = np.full((height, width), -1, np.int16)
+        for label in range(len(platforms) - 1, -1, -1):  # painted in reverse, first platform wins where they overlap
+            p = platforms[label]
+            raster[max(p.start_y - above, 0):p.start_y + below + 1, max(p.start_x - side, 0):p.end_x + side + 1] = label
+        # label -1 (no platform) indexes the trailing None
+        return self.platforms, len(self.platforms), raster, [p.hash for p in platforms] + [None]
 
     def verify_data_file(self, filename):
         """
@@ -176,13 +254,12 @@ class PathAnalyzer:
         :return: minimap coords if valid, 0 if corrupt or errored
         """
         if os.path.exists(filename):
-            with open(filename, "rb") as f:
-                try:
-                    data = pickle.load(f)
-                    platforms = data["platforms"]
-                    minimap_coords = data["minimap"]
-                except:
-                    return 0
+            try:
+                data = self._read(filename)
+                platforms = data["platforms"]
+                minimap_coords = data["minimap"]
+            except:
+                return 0
             return minimap_coords
         else:
             return 0
@@ -199,34 +276,125 @@ class PathAnalyzer:
 
     def pathfind(self, start_hash, goal_hash):
         """
-        Simple BFS algorithm to find a path from start platform to goal platform.
+        Look up route from start platform to goal platform in self.route_table.
         :param start_hash: hash of starting platform
         :param goal_hash:  hash of goal platform
-        :return: list, in order of solutions to reach goal, 0 if no path
+        :return: list, in order of solutions to reach goal, None if no path
         """
+        if start_hash not in self.route_table:  # platforms changed without add_platform()
+            self.route_table[start_hash] = self._shortest_routes(start_hash)
+        if goal_hash not in self.route_table[start_hash]:
+            return None
 
-        start_platform = self.platforms[start_hash]
-        calculated_paths = []
-        bfs_queue = []
-        for solution in start_platform.solutions:
-            bfs_queue.append([solution, [solution]])
+        path = []
+        while start_hash != goal_hash:  # cost strictly decreases along next hops, so it ends
+            solution = self.route_table[start_hash][goal_hash][1]
+            path.append(solution)
+            start_hash = solution.to_hash
+        return path
 
-        while bfs_queue:
-            current_solution, paths = bfs_queue.pop()
-            if current_solution.to_hash == goal_hash:
-                calculated_paths.append(paths)
+    def solution_cost(self, solution):
+        """
+        Expected seconds to complete a move in route table, must be positive. Observed duration and success rate are
+        blended with MOVE_DURATION_PRIOR and MOVE_SUCCESS_PRIOR, weighted as MOVE_PRIOR_WEIGHT attempts. Every attempt
+        costs duration and MOVE_HOP_OVERHEAD, a failure also RETRY_PENALTY, so expected time of geometric retries is
+        (duration + overhead + (1-p) * penalty) / p.
+        """
+        n = self.MOVE_PRIOR_WEIGHT + solution.attempts
+        duration = (self.MOVE_DURATION_PRIOR[solution.method] * self.MOVE_PRIOR_WEIGHT +
+                    solution.mean_duration * solution.attempts) / n
+        success = max((self.MOVE_SUCCESS_PRIOR * self.MOVE_PRIOR_WEIGHT + solution.successes) / n, 0.05)
+        return (duration + self.MOVE_HOP_OVERHEAD + (1 - success) * self.RETRY_PENALTY) / success
 
-            next_solution = self.platforms[current_solution.to_hash].solutions
-            for solution in next_solution:
-                if not any(solution.to_hash == i.from_hash for i in paths):
-                    cv = paths.copy()
-                    cv.append(solution)
-                    bfs_queue.append([solution, cv])
+    def record_move(self, solution, duration, success):
+        """
+        Record an executed move, routes through it are rebuilt when its cost changed
+        :param duration: seconds from start of the move until landing was checked
+        :param success: whether player landed on solution.to_hash
+        """
+        cost = self.solution_cost(solution)
+        solution.record(duration, success)
+        if abs(self.solution_cost(solution) - cost) > 0.01:
+            self.update_route_table({solution.from_hash})
+
+    def _shortest_routes(self, start_hash):
+        """Dijkstra from one platform, :return: {to hash: (cost, first Solution of route)}"""
+        routes = {}
+        best = {start_hash: 0}
+        heap = [(0, 0, start_hash, None)]  # cost, push order (tie breaker), hash, first solution
+        pushed = 1
+        while heap:
+            cost, __, platform_hash, first = heapq.heappop(heap)
+            if platform_hash in routes:
+                continue
+            routes[platform_hash] = (cost, first)
+            for solution in self.platforms[platform_hash].solutions:
+                to_hash = solution.to_hash
+                if to_hash in routes or to_hash not in self.platforms:
+                    continue
+                to_cost = cost + self.solution_cost(solution)
+                if to_cost < best.get(to_hash, math.inf):
+                    best[to_hash] = to_cost
+                    heapq.heappush(heap, (to_cost, pushed, to_hash, first or solution))
+                    pushed += 1
+        return routes
+
+    def build_route_table(self):
+        """Precompute routes between all pairs of platforms, so pathfind is a table lookup"""
+        self.route_table = {key: self._shortest_routes(key) for key in self.platforms}
+
+    def update_route_table(self, changed):
+        """
+        Rebuild routes affected by changed platforms. Routes from a platform depend only on moves of platforms
+        reachable from it, so only the rows which reach a changed platform are rebuilt.
+        :param changed: hashes of platforms added, removed or whose solutions changed
+        """
+        changed = set(changed)
+        for key in list(self.route_table):
+            if key not in self.platforms:
+                del self.route_table[key]
+            elif not changed.isdisjoint(self.route_table[key]):
+                self.route_table[key] = self._shortest_routes(key)
+        for key in self.platforms:
+            if key not in self.route_table:
+                self.route_table[key] = self._shortest_routes(key)
+
+    def _refresh_solutions(self):
+        """
+        Recalculate solutions of all platforms after terrain changed. Solutions of platforms whose moves stay the same
+        are kept as they are.
+        :return: set of hashes of platforms whose solutions changed
+        """
+        if not self.platforms:
+            return set()
+        min_y = min(i.end_y for i in self.platforms.values())
+        max_y = max(i.end_y for i in self.platforms.values())
+        changed = set()
+        for key, platform in self.platforms.items():
+            old = platform.solutions
+            self.calculate_interplatform_solutions(key, min_y, max_y)
+            if [(i.to_hash, i.method) for i in old] == [(i.to_hash, i.method) for i in platform.solutions]:
+                platform.solutions = old
+            else:
+                changed.add(key)
+        return changed
 
-        if calculated_paths:
-            return sorted(calculated_paths, key=lambda x: len(x))[0]
-        else:
-            return None
+    def add_platform(self, platform):
+        """
+        Add a platform. Solutions of all platforms are recalculated, only rows of route table which reach a platform
+        whose solutions changed are rebuilt. A* grids are rebuilt by next astar_pathfind
+        """
+        self.platforms[platform.hash] = platform
+        self.platform_index = {}
+        self.astar_map_grid = None
+        self.update_route_table(self._refresh_solutions() | {platform.hash})
+
+    def remove_platform(self, platform_hash):
+        """Remove a platform, solutions, routes and A* grids are updated like add_platform"""
+        del self.platforms[platform_hash]
+        self.platform_index = {}
+        self.astar_map_grid = None
+        self.update_route_table(self._refresh_solutions() | {platform_hash})
 
     def generate_solution_dict(self):
         """Generates a solution dictionary, which is a dictionary with platform as keys and a dictionary of a list[strategy, 0]
@@ -237,6 +405,14 @@ class PathAnalyzer:
         for key, platform in self.platforms.items():
             platform.last_visit = 0
             self.calculate_interplatform_solutions(key, min_y, max_y)
+        self.build_route_table()
+
+    def reset_navmap(self):
+        """Reset visit counters of navigation map, solutions and their learned move costs are kept"""
+        for platform in self.platforms.values():
+            platform.last_visit = 0
+            for solution in platform.solutions:
+                solution.visited = False
 
     def move_platform(self, from_platform, to_platform):
         """Update navigation map visit counter to keep track of visited platforms when moded
@@ -288,7 +464,7 @@ class PathAnalyzer:
             platform_end = max(self.current_platform_coords, key=lambda x: x[0])
 
             d_hash = self.hash(str(platform_start))
-            self.platforms[d_hash] = Platform(platform_start[0], platform_start[1], platform_end[0], platform_end[1], d_hash)
+            self.add_platform(Platform(platform_start[0], platform_start[1], platform_end[0], platform_end[1], d_hash))
             self.current_platform_coords = []
 
     def input(self, inp_x, inp_y):
@@ -411,62 +587,60 @@ class PathAnalyzer:
         Uses A* pathfinding to calculate a action map from start coord to goal.
         :param start_coord: start coordinate tuple for generating path
         :param goal_coords: goal coordinate
-        :return: list of action tuple (g, a) where g is action goal coordinate tuple, a an action METHOD
+        :return: list of action tuple (g, a) where g is action goal coordinate tuple, a an action METHOD. None if goal
+                 is unreachable or start or goal is off the minimap grid
+        Node g is cost from start_coord along the path (parent g + astar_g). Old implementation added parent g twice,
+        so paths of many moves were overpriced.
         """
-        self.astar_map_grid = []
-        self.astar_open_val_grid = []
-        map_width, map_height = self.astar_minimap_rect[2], self.astar_minimap_rect[3]
-
-        # Reinitialize map grid data
-        for height in range(map_height+1):
-            self.astar_map_grid.append([0 for x in range(map_width+1)])
-            self.astar_open_val_grid.append([0 for x in range(map_width+1)])
-
-        for key, platform in self.platforms.items():
-            # currently this only uses the platform's start x and y coords and traces them until end x coords.
-            for platform_coord in range(platform.start_x, platform.end_x + 1):
-                self.astar_map_grid[platform.start_y][platform_coord] = 1
-
-        open_list = set()
+        if self.astar_map_grid is None:
+            self.build_astar_grids()
+        g_grid = self.astar_g_grid
+        grid_h, grid_w = g_grid.shape
+        start_coord, goal_coords = tuple(start_coord), tuple(goal_coords)
+        goal_x, goal_y = goal_coords
+        for cx, cy in (start_coord, goal_coords):
+            if not (0 <= cx < grid_w and 0 <= cy < grid_h):  # negative index would wrap around
+                return None
+
+        g_grid.fill(np.inf)
+        g_grid[start_coord[1], start_coord[0]] = 0
+        parents = {start_coord: None}  # coordinate -> (parent coordinate, method), path is rebuilt from these
+        open_heap = [(0.0, 0.0, start_coord)]  # f, g, coordinate
         closed_set = set()
-        open_set = set()
-        open_list.add(AstarNode(start_coord[0], start_coord[1], g=0, h=0))
-        open_set.add(start_coord)
-
-        while open_list:
-            selection = min(open_list, key=lambda x: x.g + x.h)
-
-            if selection.x == goal_coords[0] and selection.y == goal_coords[1]:
-                return self.astar_optimize_path(selection.path)
-
-            open_list.remove(selection)
-            open_set.remove((selection.x, selection.y))
-            closed_set.add((selection.x, selection.y))
-            for coordinate, method in self.astar_find_available_moves(selection.x, selection.y, goal_coords):
-                if coordinate in closed_set:
+        while open_heap:
+            __, g, coordinate = heapq.heappop(open_heap)
+            if coordinate in closed_set:  # outdated entry, a better g was pushed later
+                continue
+            x, y = coordinate
+            if coordinate == goal_coords:
+                path = []
+                while parents[coordinate] is not None:
+                    parent, method = parents[coordinate]
+                    path.append((coordinate, method))
+                    coordinate = parent
+                path.reverse()
+                return self.astar_optimize_path(path)
+
+            closed_set.add(coordinate)
+            for successor, method in self.astar_find_available_moves(x, y, goal_coords):
+                sx, sy = successor
+                if successor in closed_set or not (0 <= sx < grid_w and 0 <= sy < grid_h):
                     continue
-                successor_g = selection.g + self.astar_g(selection.x, selection.y, coordinate[0], coordinate[1], method)
-                successor_h = self.astar_h(coordinate[0], coordinate[1], goal_coords[0], goal_coords[1])
-                successor_path = selection.path + [(coordinate, method)]
-                if coordinate in open_set:
-                    if self.astar_open_val_grid[coordinate[1]][coordinate[0]] < successor_g:
-                        continue
-
-                successor_node = AstarNode(coordinate[0], coordinate[1], g=selection.g + successor_g, h=successor_h, path=successor_path)
-                open_list.add(successor_node)
-                open_set.add(coordinate)
-                if self.astar_open_val_grid[coordinate[1]][coordinate[0]] > successor_g:
-                    self.astar_open_val_grid[coordinate[1]][coordinate[0]] = successor_g
+                successor_g = g + self.astar_g(x, y, sx, sy, method)
+                if successor_g < g_grid[sy, sx]:
+                    g_grid[sy, sx] = successor_g
+                    parents[successor] = (coordinate, method)
+                    heapq.heappush(open_heap, (successor_g + self.astar_h(sx, sy, goal_x, goal_y), successor_g, successor))
+        return None
 
     def astar_optimize_path(self, path):
         """
         Optimizes astar generated paths. This will take horizontal movement methods and combine them into one if on
-        the same height.
+        the same height. A horizontal movement which runs to the end of path is kept as last action (it used to be
+        dropped, leaving the path short of goal).
         :param path: A* path list
         :return: optimized A* path list
         """
-        print("input")
-        print(path)
         new_path = []
         current_index = 0
         while current_index <= len(path)-1:
@@ -480,13 +654,13 @@ class PathAnalyzer:
                     else:
                         new_path.append(path[current_index+increment])
                         break
+                else:  # movement runs to the end of path
+                    new_path.append(path[current_index+increment])
                 current_index += increment+1
             else:
                 new_path.append(path[current_index])
                 current_index += 1
 
-        print("output")
-        print(new_path)
         return new_path
 
     def astar_g(self, current_x, current_y, goal_x, goal_y, method):
@@ -527,6 +701,10 @@ class PathAnalyzer:
         :return: list of tuples (coord, method) where coord is a coordinate tuple, method
         """
         map_width, map_height = self.astar_minimap_rect[2], self.astar_minimap_rect[3]
+        grid = self.astar_map_grid
+        below_y = int(self.astar_below_grid[y, x])
+        has_below = below_y <= map_height
+        above = self.astar_above_grid[y]
         return_list = []
         # check horizontally touching pixels.
         for x_increment in [1, -1]:
@@ -541,22 +719,15 @@ class PathAnalyzer:
                 if x+x_increment > map_width:
                     return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
                     break
-                if self.astar_map_grid[y][x + x_increment] == 1:
-                    drop_distance = 1
-                    while y+drop_distance <= map_height:
-                        if self.astar_map_grid[y + drop_distance][x] == 1:
-                            return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
-                            contiunue_check = False
-                            break
-                        drop_distance += 1
-
-                    for jmpheight in range(1, self.TELEPORT_VERTICAL_RANGE + 1):
-                        if y - jmpheight <= 0:
-                            break
-                        if self.astar_map_grid[y - jmpheight][x + x_increment] == 1:
-                            return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
-                            contiunue_check = False
-                            break
+                if grid[y, x + x_increment] == 1:
+                    # a platform below, or one above in teleport range, makes this pixel a place to change platform
+                    if has_below:
+                        return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                        contiunue_check = False
+
+                    if above[x + x_increment]:
+                        return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                        contiunue_check = False
                 else:
                     if x_increment != 1:
                         return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
@@ -567,21 +738,13 @@ class PathAnalyzer:
                 else:
                     x_increment += 1
 
-        for jmpheight in range(1, self.TELEPORT_VERTICAL_RANGE):
-            if y - jmpheight == 0:
-                break
-            if self.astar_map_grid[y - jmpheight][x] == 1:
-                return_list.append(((x, y - jmpheight), MoveMethod.TELEPORTUP))
-
-        drop_distance = 1
-        while True:
-            if y + drop_distance > map_height:
-                break
-            if self.astar_map_grid[y + drop_distance][x] == 1:
-                return_list.append(((x, y + drop_distance), MoveMethod.DROP))
-                break
+        # platforms above in teleport range, nearest first
+        top = max(y - self.TELEPORT_VERTICAL_RANGE + 1, 1)
+        for row in np.flatnonzero(grid[top:y, x])[::-1]:
+            return_list.append(((x, top + int(row)), MoveMethod.TELEPORTUP))
 
-            drop_distance += 1
+        if has_below:
+            return_list.append(((x, below_y), MoveMethod.DROP))
 
         # check if horizontal doublejump leads us to another platform
         jump_height = 6
@@ -611,6 +774,8 @@ class PathAnalyzer:
         :return: None
         """
         self.platforms = {}
+        self.route_table = {}
+        self.platform_index = {}
         self.visited_coordinates = []
         self.current_platform_coords = []
         self.current_ladder_coords = []
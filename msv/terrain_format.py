@@ -0,0 +1,108 @@
+"""
+Versioned terrain file format of .platform files, replaces pickled Platform and Solution objects.
+
+A file is MAGIC, little endian uint32 format version and uint32 header size, a JSON header padded to 8 bytes and
+arrays. The header holds attributes of the map (minimap rect, set skill coords...) and offset and shape of every array:
+ - platforms: PLATFORM_DTYPE records in order of PathAnalyzer.platforms
+Only the terrain is stored. Solutions, routes and A* grids depend on code and learned move costs, PathAnalyzer.load
+computes them in a few milliseconds.
+The file is read by one np.memmap, arrays are views of it. Legacy pickles are still loaded by PathAnalyzer.load,
+python -m msv.terrain_format converts them.
+"""
+import json
+import os
+import struct
+import numpy as np
+
+
+MAGIC = b'MSVTERR\0'
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct('<8sII')  # magic, version, header size
+PLATFORM_DTYPE = np.dtype([('hash', 'S16'), ('start_x', '<i4'), ('start_y', '<i4'), ('end_x', '<i4'),
+                           ('end_y', '<i4'), ('no_monster', 'u1')])
+ARRAY_DTYPES = {
+    'platforms': PLATFORM_DTYPE,
+}
+
+
+def is_terrain_file(buffer):
+    return bytes(buffer[:len(MAGIC)]) == MAGIC
+
+
+def dumps(attrs, arrays):
+    """
+    :param attrs: JSON serializable attributes of the map, tuples are read back as lists
+    :param arrays: name in ARRAY_DTYPES -> array
+    :return: bytes of file
+    """
+    index = {}
+    blobs = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, ARRAY_DTYPES[name])
+        index[name] = {'offset': offset, 'shape': list(array.shape)}
+        blob = array.tobytes()
+        blobs.append(blob + b'\0' * (-len(blob) % 8))  # keep every array aligned
+        offset += len(blobs[-1])
+    header = json.dumps({'format': 'msv-terrain', 'attrs': attrs, 'arrays': index}).encode()
+    header += b' ' * (-(_PREAMBLE.size + len(header)) % 8)
+    return _PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)) + header + b''.join(blobs)
+
+
+def loads(buffer):
+    """
+    :param buffer: np.uint8 array of whole file, e.g. np.memmap
+    :return: (attrs, arrays), arrays are views of buffer
+    """
+    if len(buffer) < _PREAMBLE.size:
+        raise ValueError('not a terrain file')
+    magic, version, header_size = _PREAMBLE.unpack(bytes(buffer[:_PREAMBLE.size]))
+    if magic != MAGIC:
+        raise ValueError('not a terrain file')
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported terrain format version %d' % version)
+    header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size+header_size]).decode())
+    data_start = _PREAMBLE.size + header_size
+    arrays = {}
+    for name, location in header['arrays'].items():
+        dtype = ARRAY_DTYPES[name]
+        shape = tuple(location['shape'])
+        start = data_start + location['offset']
+        size = dtype.itemsize * int(np.prod(shape))
+        arrays[name] = buffer[start:start+size].view(dtype).reshape(shape)
+    return header['attrs'], arrays
+
+
+def read_file(filename):
+    """:return: np.uint8 array mapping whole file"""
+    if os.path.getsize(filename) == 0:  # np.memmap can't map empty file
+        return np.zeros(0, np.uint8)
+    return np.memmap(filename, np.uint8, 'r')
+
+
+def convert(src, dst=None):
+    """
+    Convert a legacy pickled terrain file
+    :param dst: output path, default overwrite src
+    :return: False if src is already in this format
+    """
+    from msv.terrain_analyzer import PathAnalyzer
+    with open(src, 'rb') as f:
+        if is_terrain_file(f.read(len(MAGIC))):
+            return False
+    analyzer = PathAnalyzer()
+    analyzer.load(src)
+    attrs = dict(analyzer.other_attrs)
+    attrs.update({k + '_coord': v for k, v in analyzer.set_skill_coord.items()})
+    analyzer.save(dst or src, attrs)
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert pickled terrain files to versioned terrain format')
+    parser.add_argument('files', nargs='+', help='.platform files, converted in place')
+    args = parser.parse_args()
+    for i in args.files:
+        print('%s: %s' % (i, 'converted' if convert(i) else 'already converted'))
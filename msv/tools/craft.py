@@ -4,7 +4,8 @@ import cv2
 import numpy as np
 import msv.directinput_constants as dc
 from msv.tools import ToolBase
-from msv.util import read_qt_resource, random_number
+from msv.util import random_number
+from msv.template_bank import get_template_bank
 from msv.screen_processor import ScreenProcessor, GameCaptureError
 
 
@@ -12,8 +13,9 @@ class Craft(ToolBase):
     def __init__(self, screen_processor, conn=None):
         super().__init__(screen_processor, None, conn)
 
-        self.craft_btn_tpl = cv2.imdecode(read_qt_resource(':/template/craft_btn.png', True), cv2.IMREAD_COLOR)
-        self.craft_ok_btn_tpl = cv2.imdecode(read_qt_resource(':/template/craft_ok_btn.png', True), cv2.IMREAD_COLOR)
+        templates = get_template_bank()
+        self.craft_btn_tpl = templates['craft_btn'].bgr
+        self.craft_ok_btn_tpl = templates['craft_ok_btn'].bgr
 
     def run(self, args):
         self.logger.info('start crafting')
@@ -181,7 +181,7 @@ class TerrainEditorWindow(QWidget):
                 QMessageBox.warning(self, "Terrain Editor", "Please close the ongoing record first")
             else:
                 for i in selected:
-                    del self.terrain_analyzer.platforms[i.data(Qt.UserRole)]
+                    self.terrain_analyzer.remove_platform(i.data(Qt.UserRole))
                 self.update_listbox()
 
     def _on_toggle_no_monster(self):
@@ -263,7 +263,7 @@ class TerrainEditorWindow(QWidget):
             playerpos = self.image_processor.find_player_minimap_marker(self.minimap_rect)
             if not playerpos:
                 self.image_label.setText('Player location not found')
-                self.find_minimap_coords()
+                self.minimap_rect = self.image_processor.find_minimap_rect()  # full search only if minimap moved
                 time.sleep(0.1)
                 continue
 
@@ -10,7 +10,7 @@ import random
 import numpy as np
 from multiprocessing.connection import Connection
 from ctypes import c_buffer, windll
-from PyQt5.QtCore import QFile, QAbstractNativeEventFilter, QTimer
+from PyQt5.QtCore import QFile, QDir, QAbstractNativeEventFilter, QTimer
 from msv import winapi
 
 _config = None
@@ -40,6 +40,17 @@ def read_qt_resource(path, numpy=False):
             return ret
 
 
+def list_qt_resource(path):
+    """:return: list of (name, is_dir) in a resource directory"""
+    if is_compiled():
+        return [(i.fileName(), i.isDir()) for i in QDir(path).entryInfoList(QDir.AllEntries | QDir.NoDotAndDotDot)]
+    else:
+        if not path.startswith(':/'):
+            raise Exception('path not starts with ":/"')
+        dir_path = resource_path + path[2:].replace('/', '\\')
+        return [(i, os.path.isdir(os.path.join(dir_path, i))) for i in os.listdir(dir_path)]
+
+
 def _winmm_command(*command):
     buf = c_buffer(255)
     command = ' '.join(command).encode(sys.getfilesystemencoding())
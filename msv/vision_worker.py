@@ -0,0 +1,218 @@
+"""Run slow full frame checks of StaticImageProcessor in worker processes, off the control loop"""
+import logging
+import multiprocessing
+import queue
+import time
+import traceback
+import numpy as np
+from multiprocessing import shared_memory
+from msv.screen_processor import StaticImageProcessor
+from msv.util import is_compiled
+
+
+HEADER_SIZE = 64  # float64 fields: seq, timestamp, height, width, channels
+DEFAULT_CHECKS = ('gm_cap', 'death', 'dialog')
+
+
+class SharedFrameReader:
+    """
+    Used as img_handle of StaticImageProcessor in worker process. Capture returns newest frame published to shared
+    memory by VisionWorkerPool, copied out so the publisher is never blocked by analysis.
+    """
+    def __init__(self, shm, lock, wakeup):
+        """
+        :param lock: held while frame in shared memory is written or read
+        :param wakeup: semaphore released by every publish. Unlike Condition.notify_all, releasing it never blocks on
+                       a waiter which was killed
+        """
+        self.hwnd = 1  # no window, StaticImageProcessor only checks it's set
+        self.header = np.ndarray((HEADER_SIZE // 8,), np.float64, shm.buf)
+        self.data = np.ndarray((shm.size - HEADER_SIZE,), np.uint8, shm.buf, HEADER_SIZE)
+        self.lock = lock
+        self.wakeup = wakeup
+        self.seq = 0
+        self.frame = None
+        self.frame_time = 0
+
+    def get_game_hwnd(self):
+        return self.hwnd
+
+    def is_foreground(self):
+        return True
+
+    def wait_frame(self, timeout):
+        """:return: True if a frame newer than last one is copied in"""
+        if self.header[0] == self.seq:
+            self.wakeup.acquire(timeout=timeout)
+        while self.wakeup.acquire(False):  # publishes while busy
+            pass
+        with self.lock:
+            if self.header[0] == self.seq:
+                return False
+            seq, timestamp, h, w, c = self.header[:5]
+            shape = (int(h), int(w), int(c))
+            if self.frame is None or self.frame.shape != shape:
+                self.frame = np.empty(shape, np.uint8)
+            np.copyto(self.frame, self.data[:self.frame.size].reshape(shape))
+            self.seq, self.frame_time = seq, timestamp
+        return True
+
+    def capture(self, hwnd=None, rect=None, plan=None, reuse_buffer=False, bgra=False):
+        if rect is not None:
+            x, y, w, h = rect
+            return self.frame[y:y+h, x:x+w].copy()
+        return self.frame
+
+
+def _worker_main(shm_name, lock, wakeup, stop_event, results, checks, bgra, interval):
+    if is_compiled():
+        # noinspection PyUnresolvedReferences
+        import msv.resources_rc  # for reading qt resource in child process
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        reader = SharedFrameReader(shm, lock, wakeup)
+        processor = StaticImageProcessor(reader, bgra)
+        while not stop_event.is_set():
+            if not reader.wait_frame(0.1):
+                continue
+            start = time.perf_counter()
+            # errors are reported as verdicts and worker keeps running, e.g. cv2 error of an unexpected frame size
+            try:
+                processor.update_image(set_focus=False)
+                frame_error = None
+            except Exception:
+                frame_error = traceback.format_exc()
+            for name in checks:
+                result, error = None, frame_error
+                if not error:
+                    try:
+                        result = bool(getattr(processor, 'check_' + name)())
+                    except Exception:
+                        error = traceback.format_exc()
+                results.put((name, result, reader.frame_time, error))
+            if interval:
+                stop_event.wait(interval - (time.perf_counter() - start))
+    finally:
+        shm.close()
+
+
+class VisionWorkerPool:
+    """
+    Frames are published into shared memory, worker processes run StaticImageProcessor.check_<name> on newest frame
+    whenever they are free, and the control loop only reads latest verdicts.
+    Checks are distributed among workers round robin, every worker skips frames published while it's busy.
+    If a worker process dies, the pool is stopped and failed is set, caller should run the checks by itself.
+    """
+    def __init__(self, checks=DEFAULT_CHECKS, workers=1, interval=0.0, bgra=False, mp_context=None):
+        """
+        :param checks: names of StaticImageProcessor check_<name> methods
+        :param interval: min seconds between analysis starts of a worker
+        :param bgra: published frames are BGRA
+        :param mp_context: multiprocessing start method, default platform default
+        """
+        self.checks = tuple(checks)
+        self.workers = min(workers, len(self.checks))
+        self.interval = interval
+        self.bgra = bgra
+        self.ctx = multiprocessing.get_context(mp_context)
+        self.capacity = 0  # frame bytes of shared memory
+        self.seq = 0
+        self.processes = []
+        self.failed = False  # a worker died, pool won't be started again
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._shm = None
+        self._header = None
+        self._data = None
+        self._lock = None
+        self._wakeups = []  # semaphore of every worker
+        self._stop_event = None
+        self._results = None
+        self._verdicts = {}  # name -> (result, timestamp of analyzed frame)
+
+    @property
+    def running(self):
+        return bool(self.processes) and all(i.is_alive() for i in self.processes)
+
+    def start(self, capacity):
+        """:param capacity: max frame size in bytes"""
+        self.stop()
+        self._shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity)
+        self._header = np.ndarray((HEADER_SIZE // 8,), np.float64, self._shm.buf)
+        self._header[:] = 0
+        self._data = np.ndarray((capacity,), np.uint8, self._shm.buf, HEADER_SIZE)
+        self.capacity = capacity
+        self._lock = self.ctx.Lock()
+        self._wakeups = [self.ctx.Semaphore(0) for _ in range(self.workers)]
+        self._stop_event = self.ctx.Event()
+        self._results = self.ctx.Queue()
+        for i in range(self.workers):
+            process = self.ctx.Process(target=_worker_main, name='VisionWorker-%d' % i, daemon=True, args=(
+                self._shm.name, self._lock, self._wakeups[i], self._stop_event, self._results,
+                self.checks[i::self.workers], self.bgra, self.interval))
+            process.start()
+            self.processes.append(process)
+
+    def stop(self, timeout=2):
+        if not self._shm:
+            return
+        self._stop_event.set()
+        for wakeup in self._wakeups:
+            wakeup.release()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self._results.close()
+        self._results = None
+        self._wakeups = []
+        self._header = self._data = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        self._verdicts.clear()
+
+    def publish(self, frame, timestamp):
+        """Copy frame into shared memory for workers. Workers are (re)started if frame doesn't fit"""
+        if self.failed or self._check_workers():
+            return
+        if frame.nbytes > self.capacity or not self.processes:
+            self.start(max(frame.nbytes, self.capacity))
+        with self._lock:
+            self.seq += 1
+            np.copyto(self._data[:frame.nbytes].reshape(frame.shape), frame)
+            self._header[:5] = self.seq, timestamp, frame.shape[0], frame.shape[1], frame.shape[2]
+        for wakeup in self._wakeups:
+            wakeup.release()
+
+    def _check_workers(self):
+        """:return: True if a worker died, pool is then stopped and marked failed"""
+        dead = [i for i in self.processes if not i.is_alive()]
+        if not dead:
+            return False
+        self.logger.error('%s exited with code %s, running checks in control loop' % (dead[0].name, dead[0].exitcode))
+        self.stop()
+        self.failed = True
+        return True
+
+    def poll(self):
+        """Collect verdicts published by workers"""
+        if not self._results:
+            return
+        while True:
+            try:
+                name, result, timestamp, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if error:
+                self.logger.error('check_%s failed in vision worker\n%s' % (name, error))
+            self._verdicts[name] = (result, timestamp)
+        self._check_workers()
+
+    def take(self, name):
+        """
+        Latest verdict of a check. Every verdict is returned only once, so one positive result isn't acted on twice.
+        :return: (result, timestamp of analyzed frame), None if no new verdict. result is None if check raised
+        """
+        self.poll()
+        return self._verdicts.pop(name, None)
@@ -0,0 +1,24 @@
+"""
+Export trained keras model to ONNX, so RuneSolverCnn can run it by cv2.dnn without TensorFlow.
+Requires tf2onnx (pip install tf2onnx) in training environment only.
+"""
+import sys
+import numpy as np
+import cv2
+import tensorflow as tf
+import tf2onnx
+from keras.models import load_model
+
+model_name = sys.argv[1] if len(sys.argv) > 1 else "arrow_classifier_keras_gray.h5"
+onnx_name = model_name.rsplit('.', 1)[0] + '.onnx'
+
+model = load_model(model_name)
+spec = (tf.TensorSpec((None, 60, 60, 1), tf.float32, name="input"),)
+tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=onnx_name)
+
+# verify exported model gives same result
+tensor = np.random.uniform(0, 255, (4, 60, 60, 1)).astype(np.float32)
+net = cv2.dnn.readNet(onnx_name)
+net.setInput(tensor)
+diff = np.abs(net.forward() - model.predict(tensor)).max()
+print("exported %s, max difference %g" % (onnx_name, diff))
@@ -0,0 +1,187 @@
+"""
+Compare A* of PathAnalyzer with the old one (set open list, copied paths, list grids rebuilt on every call) on every
+shipped terrain file, between random points of different platforms
+"""
+import glob, os, random, time
+from msv.terrain_analyzer import PathAnalyzer, MoveMethod
+
+PLATFORM_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'msv', 'resources', 'platform')
+PAIRS = 30
+
+
+class AstarNode:
+    def __init__(self, x=None, y=None, g=None, h=None, path=None):
+        self.x = x
+        self.y = y
+        self.g = g
+        self.h = h
+        self.f = 0
+        self.path = [] if path is None else path
+        if self.g:
+            self.f = self.g + self.h
+
+
+class OldPathAnalyzer(PathAnalyzer):
+    def astar_pathfind(self, start_coord, goal_coords):
+        """
+        Uses A* pathfinding to calculate a action map from start coord to goal.
+        :param start_coord: start coordinate tuple for generating path
+        :param goal_coords: goal coordinate
+        :return: list of action tuple (g, a) where g is action goal coordinate tuple, a an action METHOD
+        """
+        self.astar_map_grid = []
+        self.astar_open_val_grid = []
+        map_width, map_height = self.astar_minimap_rect[2], self.astar_minimap_rect[3]
+
+        # Reinitialize map grid data
+        for height in range(map_height+1):
+            self.astar_map_grid.append([0 for x in range(map_width+1)])
+            self.astar_open_val_grid.append([0 for x in range(map_width+1)])
+
+        for key, platform in self.platforms.items():
+            # currently this only uses the platform's start x and y coords and traces them until end x coords.
+            for platform_coord in range(platform.start_x, platform.end_x + 1):
+                self.astar_map_grid[platform.start_y][platform_coord] = 1
+
+        open_list = set()
+        closed_set = set()
+        open_set = set()
+        open_list.add(AstarNode(start_coord[0], start_coord[1], g=0, h=0))
+        open_set.add(start_coord)
+
+        while open_list:
+            selection = min(open_list, key=lambda x: x.g + x.h)
+
+            if selection.x == goal_coords[0] and selection.y == goal_coords[1]:
+                return self.astar_optimize_path(selection.path)
+
+            open_list.remove(selection)
+            open_set.remove((selection.x, selection.y))
+            closed_set.add((selection.x, selection.y))
+            for coordinate, method in self.astar_find_available_moves(selection.x, selection.y, goal_coords):
+                if coordinate in closed_set:
+                    continue
+                successor_g = selection.g + self.astar_g(selection.x, selection.y, coordinate[0], coordinate[1], method)
+                successor_h = self.astar_h(coordinate[0], coordinate[1], goal_coords[0], goal_coords[1])
+                successor_path = selection.path + [(coordinate, method)]
+                if coordinate in open_set:
+                    if self.astar_open_val_grid[coordinate[1]][coordinate[0]] < successor_g:
+                        continue
+
+                successor_node = AstarNode(coordinate[0], coordinate[1], g=selection.g + successor_g, h=successor_h, path=successor_path)
+                open_list.add(successor_node)
+                open_set.add(coordinate)
+                if self.astar_open_val_grid[coordinate[1]][coordinate[0]] > successor_g:
+                    self.astar_open_val_grid[coordinate[1]][coordinate[0]] = successor_g
+
+    def astar_find_available_moves(self, x, y, goal_coordinate):
+        """
+        Finds all the pixels which can be reached from (x,y). Methods include horizontal movement, jump and dropping
+        :param x: x coord
+        :param y: y coord
+        :param goal_coordinate: goal coordinate tuple
+        :return: list of tuples (coord, method) where coord is a coordinate tuple, method
+        """
+        map_width, map_height = self.astar_minimap_rect[2], self.astar_minimap_rect[3]
+        return_list = []
+        # check horizontally touching pixels.
+        for x_increment in [1, -1]:
+            contiunue_check = True
+            while contiunue_check:
+                if x + x_increment == 0:
+                    return_list.append(((x + x_increment - 1, y), MoveMethod.MOVER if x_increment > 0 else "l"))
+                    break
+                if (x + x_increment, y) == goal_coordinate:
+                    return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                    break
+                if x+x_increment > map_width:
+                    return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                    break
+                if self.astar_map_grid[y][x + x_increment] == 1:
+                    drop_distance = 1
+                    while y+drop_distance <= map_height:
+                        if self.astar_map_grid[y + drop_distance][x] == 1:
+                            return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                            contiunue_check = False
+                            break
+                        drop_distance += 1
+
+                    for jmpheight in range(1, self.TELEPORT_VERTICAL_RANGE + 1):
+                        if y - jmpheight <= 0:
+                            break
+                        if self.astar_map_grid[y - jmpheight][x + x_increment] == 1:
+                            return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                            contiunue_check = False
+                            break
+                else:
+                    if x_increment != 1:
+                        return_list.append(((x + x_increment, y), MoveMethod.MOVER if x_increment > 0 else MoveMethod.MOVEL))
+                    break
+
+                if x_increment < 0:
+                    x_increment -= 1
+                else:
+                    x_increment += 1
+
+        for jmpheight in range(1, self.TELEPORT_VERTICAL_RANGE):
+            if y - jmpheight == 0:
+                break
+            if self.astar_map_grid[y - jmpheight][x] == 1:
+                return_list.append(((x, y - jmpheight), MoveMethod.TELEPORTUP))
+
+        drop_distance = 1
+        while True:
+            if y + drop_distance > map_height:
+                break
+            if self.astar_map_grid[y + drop_distance][x] == 1:
+                return_list.append(((x, y + drop_distance), MoveMethod.DROP))
+                break
+
+            drop_distance += 1
+
+        # check if horizontal doublejump leads us to another platform
+        jump_height = 6
+
+        return return_list
+
+
+def path_cost(analyzer, start, path):
+    cost = 0
+    for coord, method in path or ():
+        cost += analyzer.astar_g(start[0], start[1], coord[0], coord[1], method)
+        start = coord
+    return cost
+
+
+def bench(func, pairs):
+    t = time.perf_counter()
+    results = []
+    for start, goal in pairs:
+        try:
+            results.append(func(start, goal))
+        except IndexError:  # old A* walks off grid at some map edges
+            results.append(IndexError)
+    return results, (time.perf_counter() - t) / len(pairs)
+
+
+rng = random.Random(0)
+total_old = total_new = 0
+for path in sorted(glob.glob(os.path.join(PLATFORM_DIR, '*.platform'))):
+    new, old = PathAnalyzer(), OldPathAnalyzer()
+    new.load(path)
+    old.load(path)
+    old.astar_optimize_path = lambda p: p  # old one printed the path twice
+    platforms = list(new.platforms.values())
+    pairs = []
+    for _ in range(PAIRS):
+        a, b = rng.sample(platforms, 2)
+        pairs.append(((rng.randint(a.start_x, a.end_x), a.start_y), (rng.randint(b.start_x, b.end_x), b.start_y)))
+    old_paths, old_t = bench(old.astar_pathfind, pairs)
+    new_paths, new_t = bench(new.astar_pathfind, pairs)
+    total_old += old_t
+    total_new += new_t
+    found = sum(i is not None for i in new_paths)
+    old_found = sum(i is not None and i is not IndexError for i in old_paths)
+    print('%-32s old=%.2fms (%d found) new=%.2fms (%d found) speedup=%.1fx' % (
+        os.path.basename(path), old_t * 1000, old_found, new_t * 1000, found, old_t / new_t))
+print('all maps: old=%.2fms new=%.2fms speedup=%.1fx' % (total_old * 1000, total_new * 1000, total_old / total_new))
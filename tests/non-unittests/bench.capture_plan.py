@@ -0,0 +1,41 @@
+"""Compare pixels converted by full frame capture and by capture of CapturePlan regions (minimap + dialog button)"""
+import os, time
+import cv2, numpy as np
+from msv.screen_processor import MockStaticImageProcessor
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'unittest_data')
+
+
+def bench(func, times):
+    t = time.perf_counter()
+    for _ in range(times):
+        func()
+    return (time.perf_counter() - t) / times
+
+
+def convert_full(bgra):
+    return cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR)
+
+
+def convert_plan(bgra, rects):
+    frame = np.zeros((bgra.shape[0], bgra.shape[1], 3), np.uint8)
+    for x, y, w, h in rects:
+        cv2.cvtColor(bgra[y:y+h, x:x+w], cv2.COLOR_BGRA2BGR, dst=frame[y:y+h, x:x+w])
+    return frame
+
+
+processor = MockStaticImageProcessor()
+for name in ('bounty_hunter_dialog', 'white_room', 'dead'):
+    processor.set_test_img(os.path.join(DATA_DIR, name + '.png'))
+    processor.minimap_rect = None
+    processor.find_minimap_rect()  # if not found, plan captures area to search minimap
+    client_size = processor.img_handle.get_client_size()
+    rects = processor.minimap_capture_plan.resolve(client_size)
+    bgra = cv2.cvtColor(processor.bgr_img, cv2.COLOR_BGR2BGRA)  # what BitBlt leaves in DIB section
+
+    full_px = client_size[0] * client_size[1]
+    plan_px = processor.minimap_capture_plan.pixel_count(client_size)
+    full_t = bench(lambda: convert_full(bgra), 300)
+    plan_t = bench(lambda: convert_plan(bgra, rects), 300)
+    print('%-20s %dx%d full=%dpx %.3fms plan=%dpx (%.1f%%) %.3fms' % (
+        name, client_size[0], client_size[1], full_px, full_t*1000, plan_px, plan_px/full_px*100, plan_t*1000))
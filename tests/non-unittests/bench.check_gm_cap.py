@@ -0,0 +1,40 @@
+"""Compare full frame masked matchTemplate of check_gm_cap with CoarseToFineMatcher at 1366x768 and 1920x1080"""
+import glob, os, time
+import cv2, numpy as np
+from msv.screen_processor import MockStaticImageProcessor, half_scale
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'unittest_data')
+
+
+def old_find(processor, gray):
+    ret = []
+    gm_cap = processor.templates['gm_cap']
+    for i in (gm_cap, gm_cap.mirrored):
+        match_res = cv2.matchTemplate(gray, i.gray, cv2.TM_SQDIFF_NORMED, mask=i.mask)
+        ret.append(sorted(zip(*np.where(match_res < 0.001))))
+    return ret
+
+
+def new_find(processor, gray):
+    coarse_gray = half_scale(gray)
+    return [sorted(i.find(gray, coarse_gray)) for i in processor.gm_cap_matchers]
+
+
+def bench(func, times):
+    t = time.perf_counter()
+    for _ in range(times):
+        ret = func()
+    return ret, (time.perf_counter() - t) / times
+
+
+processor = MockStaticImageProcessor()
+for path in sorted(glob.glob(os.path.join(DATA_DIR, 'white_room*.png')) + glob.glob(os.path.join(DATA_DIR, 'dead.png'))):
+    gray = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2GRAY)
+    # 1920x1080: original frame at center, border filled by mirrored frame
+    big = cv2.copyMakeBorder(gray, 156, 156, 277, 277, cv2.BORDER_REFLECT)
+    for img in (gray, big):
+        old, old_t = bench(lambda: old_find(processor, img), 5)
+        new, new_t = bench(lambda: new_find(processor, img), 20)
+        assert [[(int(y), int(x)) for y, x in i] for i in old] == new, (old, new)
+        print('%-15s %dx%d matches=%s old=%.1fms new=%.1fms speedup=%.1fx' % (
+            os.path.basename(path), img.shape[1], img.shape[0], [len(i) for i in new], old_t*1000, new_t*1000, old_t/new_t))
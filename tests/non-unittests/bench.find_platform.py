@@ -0,0 +1,51 @@
+"""Compare label raster lookup of PathAnalyzer.find_platform with the old linear scans, over every minimap pixel"""
+import glob, os, time
+from msv.terrain_analyzer import PathAnalyzer
+
+PLATFORM_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'msv', 'resources', 'platform')
+PLATFORM_ERROR = 3
+
+
+class Player:
+    x = y = None
+
+    def is_on_platform(self, platform, offset=0):  # same as PlayerController
+        return ((platform.start_y-offset) <= self.y <= platform.start_y
+                and (platform.start_x-offset) <= self.x <= (platform.end_x+offset))
+
+
+player = Player()
+
+
+def old_find_current_platform(analyzer, x, y):
+    player.x, player.y = x, y
+    for p in analyzer.platforms.values():
+        if player.is_on_platform(p):
+            return p.hash
+    for p in analyzer.platforms.values():
+        if player.is_on_platform(p, PLATFORM_ERROR):
+            return p.hash
+    return None
+
+
+def new_find_current_platform(analyzer, x, y):
+    ret = analyzer.find_platform(x, y)
+    return ret if ret is not None else analyzer.find_platform(x, y, above=PLATFORM_ERROR, side=PLATFORM_ERROR)
+
+
+def bench(func, coords):
+    t = time.perf_counter()
+    ret = [func(*i) for i in coords]
+    return ret, (time.perf_counter() - t) / len(coords)
+
+
+for path in sorted(glob.glob(os.path.join(PLATFORM_DIR, '*.platform'))):
+    analyzer = PathAnalyzer()
+    analyzer.load(path)
+    w, h = analyzer.astar_minimap_rect[2:]
+    coords = [(x, y) for y in range(h) for x in range(w)]
+    old, old_t = bench(lambda x, y: old_find_current_platform(analyzer, x, y), coords)
+    new, new_t = bench(lambda x, y: new_find_current_platform(analyzer, x, y), coords)
+    assert old == new
+    print('%-32s %2d platforms, old=%.2fus new=%.2fus speedup=%.1fx' % (
+        os.path.basename(path), len(analyzer.platforms), old_t * 1e6, new_t * 1e6, old_t / new_t))
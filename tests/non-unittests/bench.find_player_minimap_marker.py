@@ -0,0 +1,51 @@
+"""Compare vectorized find_player_minimap_marker with the old pure python neighbour count loop"""
+import math, os, time
+import cv2, numpy as np
+from msv.screen_processor import MockStaticImageProcessor, MinimapSnapshot
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'unittest_data')
+
+
+def old_find_player_minimap_marker(mask):
+    td = np.transpose(np.where(mask > 0)).tolist()
+    if len(td) > 0:
+        avg_x = 0
+        avg_y = 0
+        totalpoints = 0
+        for coord in td:
+            nearest_points = 0
+            for ref_coord in td:
+                if math.sqrt(abs(ref_coord[0]-coord[0])**2 + abs(ref_coord[1]-coord[1])**2) <= 3:
+                    nearest_points += 1
+            if 10 <= nearest_points <= 13:
+                avg_y += coord[0]
+                avg_x += coord[1]
+                totalpoints += 1
+        if totalpoints == 0:
+            return None
+        return int(avg_x / totalpoints), int(avg_y / totalpoints)
+    return None
+
+
+def bench(func, times):
+    t = time.perf_counter()
+    for _ in range(times):
+        ret = func()
+    return ret, (time.perf_counter() - t) / times
+
+
+processor = MockStaticImageProcessor()
+for name in ('minimap_guild', 'minimap_friend', 'minimap_stranger', 'minimap_none'):
+    processor.set_test_img(os.path.join(DATA_DIR, name + '.png'))
+    processor.minimap_rect = None
+    rect = processor.get_minimap_rect()
+    cropped = processor.bgr_img[rect[1]:rect[1]+rect[3], rect[0]:rect[0]+rect[2]]
+    # sprinkle noise of player color to simulate busy minimap
+    noise = np.random.default_rng(0).random(cropped.shape[:2]) < 0.05
+    cropped[noise] = (68, 221, 255)
+    mask = cv2.inRange(cropped, processor.lower_player_marker, processor.upper_player_marker)
+
+    old_pos, old_t = bench(lambda: old_find_player_minimap_marker(mask), 3)
+    new_pos, new_t = bench(lambda: MinimapSnapshot(processor, rect).player_marker, 300)
+    assert old_pos == new_pos, (old_pos, new_pos)
+    print('%-18s pos=%s old=%.3fms new=%.3fms speedup=%.0fx' % (name, new_pos, old_t*1000, new_t*1000, old_t/new_t))
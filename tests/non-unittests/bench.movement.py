@@ -0,0 +1,27 @@
+"""Compare horizontal movement strategies of PlayerController in the game simulator, on random start and goal"""
+import glob, os, random, time
+from msv.game_simulator import Simulation
+
+PLATFORM_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'msv', 'resources', 'platform')
+RUNS = 200
+STRATEGIES = ('horizontal_move_goal', 'optimized_horizontal_move', 'shikigami_haunting_sweep_move')
+
+
+rng = random.Random(0)
+for path in sorted(glob.glob(os.path.join(PLATFORM_DIR, '*.platform')))[:4]:
+    sim = Simulation(path)
+    platform = max(sim.simulator.platforms, key=lambda p: p.end_x - p.start_x)
+    cases = [(rng.randint(platform.start_x, platform.end_x), rng.randint(platform.start_x, platform.end_x))
+             for _ in range(RUNS)]
+    for strategy in STRATEGIES:
+        virtual = real = error = 0
+        t = time.perf_counter()
+        for start, goal in cases:
+            sim.reset((start, platform.start_y))
+            res = sim.run(strategy, goal)
+            virtual += res.virtual_time
+            real += res.real_time
+            error += abs(res.end[0] - goal)
+        total = time.perf_counter() - t
+        print('%-32s %-30s avg %.2fs game time, avg x error %.1f, %.1fms real (%.0fx real time), total %.1fs' % (
+            os.path.basename(path), strategy, virtual / RUNS, error / RUNS, real / RUNS * 1000, virtual / real, total))
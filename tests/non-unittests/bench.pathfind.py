@@ -0,0 +1,38 @@
+"""Compare route table lookup of PathAnalyzer.pathfind with the old BFS, for every pair of platforms of shipped maps"""
+import glob, os, time
+from msv.terrain_analyzer import PathAnalyzer
+
+PLATFORM_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'msv', 'resources', 'platform')
+
+
+def old_pathfind(analyzer, start_hash, goal_hash):
+    calculated_paths = []
+    bfs_queue = [[solution, [solution]] for solution in analyzer.platforms[start_hash].solutions]
+    while bfs_queue:
+        current_solution, paths = bfs_queue.pop()
+        if current_solution.to_hash == goal_hash:
+            calculated_paths.append(paths)
+        for solution in analyzer.platforms[current_solution.to_hash].solutions:
+            if not any(solution.to_hash == i.from_hash for i in paths):
+                bfs_queue.append([solution, paths + [solution]])
+    return sorted(calculated_paths, key=len)[0] if calculated_paths else None
+
+
+def bench(func, pairs):
+    t = time.perf_counter()
+    ret = [func(*i) for i in pairs]
+    return ret, (time.perf_counter() - t) / len(pairs)
+
+
+for path in sorted(glob.glob(os.path.join(PLATFORM_DIR, '*.platform'))):
+    analyzer = PathAnalyzer()
+    analyzer.load(path)
+    t = time.perf_counter()
+    analyzer.build_route_table()
+    build_t = time.perf_counter() - t
+    pairs = [(a, b) for a in analyzer.platforms for b in analyzer.platforms if a != b]
+    old, old_t = bench(lambda a, b: old_pathfind(analyzer, a, b), pairs)
+    new, new_t = bench(analyzer.pathfind, pairs)
+    assert [i is None for i in old] == [i is None for i in new]  # routes minimize expected time, not hops
+    print('%-32s %2d platforms, table built in %.2fms, old=%.3fms new=%.4fms speedup=%.0fx' % (
+        os.path.basename(path), len(analyzer.platforms), build_t * 1000, old_t * 1000, new_t * 1000, old_t / new_t))
@@ -0,0 +1,28 @@
+"""Replay a recorded session through MacroController and print per-stage timing of the report"""
+import os, shutil, sys, tempfile
+from msv.replay import ReplayEngine
+from msv.terrain_analyzer import Platform
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'unittest_data')
+
+
+def make_session(directory, count=30):
+    """png frames of a dialog, player marker at (129, 17) of minimap"""
+    for i in range(count):
+        shutil.copy(os.path.join(DATA_DIR, 'bounty_hunter_dialog.png'), os.path.join(directory, '%03d.png' % i))
+
+
+if len(sys.argv) > 1:  # recorded session given
+    engine = ReplayEngine(sys.argv[1], platform_file=sys.argv[2] if len(sys.argv) > 2 else None)
+    print(engine.run())
+else:
+    tmp = tempfile.mkdtemp()
+    try:
+        make_session(tmp)
+        engine = ReplayEngine(tmp)
+        analyzer = engine.macro.terrain_analyzer
+        analyzer.platforms = {'a': Platform(100, 17, 160, 17, 'a'), 'b': Platform(170, 17, 200, 17, 'b')}
+        analyzer.generate_solution_dict()
+        print(engine.run())
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,51 @@
+"""Compare per direction matching of RuneSolverSimple with batched FFT matching on rune images"""
+import glob, os, time
+import cv2
+import numpy as np
+from msv.screen_processor import MockScreenProcessor
+from msv.rune_solver.rune_solver_simple import RuneSolverSimple
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'unittest_data', 'rune')
+
+
+def match_one_direction(solver, img, direction):
+    locs = [np.where(cv2.matchTemplate(img, tpl.bgr, cv2.TM_SQDIFF_NORMED, mask=tpl.mask) <= solver.THRESHOLD)
+            for tpl in (solver.templates[direction], solver.templates_small[direction])]
+    ret = []
+    for pt in zip(np.concatenate([i[1] for i in locs]), np.concatenate([i[0] for i in locs])):
+        if any(abs(i[0]-pt[0]) < 12 and abs(i[1]-pt[1]) < 12 for i in ret):
+            continue
+        ret.append(pt)
+    return ret
+
+
+def old_solve(solver, img):
+    result = []
+    for direction in solver.DIRECTIONS:
+        for pos in match_one_direction(solver, img, direction):
+            result.append({'dir': direction, 'pos': pos})
+    if len(result) != 4:
+        return None
+    result.sort(key=lambda i: i['pos'][0])
+    return tuple(i['dir'] for i in result)
+
+
+def bench(func, times):
+    t = time.perf_counter()
+    for _ in range(times):
+        ret = func()
+    return ret, (time.perf_counter() - t) / times
+
+
+processor = MockScreenProcessor()
+solver = RuneSolverSimple(processor)
+for path in sorted(glob.glob(os.path.join(DATA_DIR, '*.png'))):
+    processor.set_test_img(path)
+    img = solver.capture_roi()
+    fresh_solver = RuneSolverSimple(processor)
+    __, first_t = bench(lambda: fresh_solver.try_solve(img), 1)
+    old, old_t = bench(lambda: old_solve(solver, img), 20)
+    new, new_t = bench(lambda: solver.try_solve(img), 20)
+    assert old == new, (old, new)
+    print('%-12s %s old=%.1fms new=%.1fms (first %.1fms) speedup=%.1fx' % (
+        os.path.basename(path), new, old_t*1000, new_t*1000, first_t*1000, old_t/new_t))
@@ -0,0 +1,27 @@
+"""Compare PathAnalyzer.load of shipped terrain files with load of same terrain saved as legacy pickle"""
+import glob, os, pickle, tempfile, time
+from msv.terrain_analyzer import PathAnalyzer
+
+PLATFORM_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'msv', 'resources', 'platform')
+REPEAT = 50
+
+
+def bench(path):
+    t = time.perf_counter()
+    for i in range(REPEAT):
+        PathAnalyzer().load(path)
+    return (time.perf_counter() - t) / REPEAT
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    for path in sorted(glob.glob(os.path.join(PLATFORM_DIR, '*.platform'))):
+        analyzer = PathAnalyzer()
+        analyzer.load(path)
+        legacy_path = os.path.join(tmp, os.path.basename(path))
+        data = {k + '_coord': v for k, v in analyzer.set_skill_coord.items()}
+        data.update(analyzer.other_attrs, platforms=analyzer.platforms)
+        with open(legacy_path, 'wb') as f:
+            pickle.dump(data, f)
+        old_t, new_t = bench(legacy_path), bench(path)
+        print('%-32s %2d platforms, pickle=%.2fms new=%.2fms speedup=%.1fx' % (
+            os.path.basename(path), len(analyzer.platforms), old_t * 1000, new_t * 1000, old_t / new_t))
@@ -0,0 +1,52 @@
+from unittest import TestCase
+import time
+import types
+from msv.check_scheduler import CheckScheduler
+from msv.macro_script import MacroController
+
+
+class TestCheckScheduler(TestCase):
+    def test_budget(self):
+        scheduler = CheckScheduler(budget=0.015)
+        scheduler.register('slow1', lambda: time.sleep(0.01) or 1, cost=0.01)
+        scheduler.register('slow2', lambda: time.sleep(0.01) or 2, cost=0.01, max_interval=0.05)
+        scheduler.register('fast', lambda: 3)
+
+        self.assertEqual(scheduler.tick(), {'slow1': 1, 'slow2': 2})  # slow2 never run, fast over budget
+        self.assertEqual(scheduler.tick(), {'slow1': 1, 'fast': 3})  # slow2 over budget
+        time.sleep(0.05)
+        self.assertEqual(scheduler.tick(), {'slow1': 1, 'slow2': 2})  # slow2 overdue
+        self.assertEqual([(i.runs, i.skips) for i in scheduler.checks], [(3, 0), (2, 1), (1, 2)])
+        report = scheduler.report().splitlines()
+        self.assertEqual(report[0], '3 ticks, budget 15.0ms')
+        self.assertEqual([i.split(',')[:3] for i in report[1:]], [['slow1: 3 runs', ' 0 skips', ' 0 idle'],
+                                                                  ['slow2: 2 runs', ' 1 skips', ' 0 idle'],
+                                                                  ['fast: 1 runs', ' 2 skips', ' 0 idle']])
+
+    def test_interval_and_watch(self):
+        state = [0]
+        scheduler = CheckScheduler()
+        scheduler.register('interval', lambda: True, min_interval=0.05)
+        watched = scheduler.register('watch', lambda: state[0], watch=lambda: state[0])
+
+        self.assertEqual(scheduler.tick(), {'interval': True, 'watch': 0})
+        self.assertEqual(scheduler.tick(), {})
+        state[0] = 1
+        self.assertEqual(scheduler.tick(), {'watch': 1})
+        time.sleep(0.05)
+        self.assertEqual(scheduler.tick(), {'interval': True})
+        self.assertEqual(watched.idle, 2)
+
+    def test_macro_checks(self):
+        # checks of MacroController with measured costs, gm_cap at 1366x768
+        macro = types.SimpleNamespace(check_scheduler=CheckScheduler(0.05), screen_processor=None)
+        MacroController._register_checks(macro)
+        scheduler = macro.check_scheduler
+        for check in scheduler.checks:
+            check.func = (lambda: time.sleep(0.034)) if check.name == 'gm_cap' else (lambda: None)
+            check.watch = None
+        for _ in range(10):
+            scheduler.tick()
+        self.assertEqual([(i.name, i.runs, i.skips) for i in scheduler.checks],
+                         [('other_player', 10, 0), ('death', 10, 0), ('dialog', 10, 0), ('gm_cap', 10, 0)])
+        self.assertTrue(scheduler.report().startswith('10 ticks, budget 50.0ms'))
@@ -0,0 +1,101 @@
+from unittest import TestCase
+import random
+import time
+from msv.directinput_constants import DIK_LEFT, DIK_RIGHT
+from msv.game_simulator import GameSimulator, Simulation
+from msv.terrain_analyzer import Platform
+
+PLATFORM_FILE = '../msv/resources/platform/corridor_h01.platform'
+
+
+class TestGameSimulator(TestCase):
+    def setUp(self):
+        # ground, a platform above it and one above that
+        self.platforms = {'ground': Platform(10, 40, 150, 40, 'ground'), 'mid': Platform(40, 25, 90, 25, 'mid'),
+                          'top': Platform(50, 12, 80, 12, 'top')}
+
+    def test_physics(self):
+        sim = GameSimulator(platforms=self.platforms, start=(60, 40))
+        sim.key_event(DIK_RIGHT, True, 0)
+        sim.key_event(DIK_RIGHT, False, 1)
+        self.assertEqual(sim.position, (60 + GameSimulator.WALK_SPEED, 40))
+
+        sim.key_event(sim.jump_key, True, 1)
+        sim.advance(1.1)
+        self.assertLess(sim.y, 40)
+        sim.advance(3)
+        self.assertEqual(sim.position, (74, 40))  # jumped in place, too low to reach mid platform
+        sim.key_event(sim.jump_key, False, 3)
+
+        sim.key_event(sim.teleport_key, True, 3)  # facing right
+        sim.key_event(sim.teleport_key, False, 3.05)
+        self.assertEqual(sim.position, (74 + GameSimulator.TELEPORT_HORIZONTAL_RANGE, 40))
+
+        sim.key_event(DIK_LEFT, True, 4)
+        sim.key_event(DIK_LEFT, False, 5)
+        sim.advance(5)
+        x = sim.position[0]
+        self.assertEqual(x, 92 - GameSimulator.WALK_SPEED)
+
+    def test_render(self):
+        sim = Simulation(platforms=self.platforms, start=(45, 25))
+        sim.run('update')
+        self.assertEqual(sim.screen_processor.minimap_rect, sim.simulator.minimap_rect)
+        self.assertEqual((sim.player.x, sim.player.y), (45, 25))
+        sim.reset((100, 40))
+        sim.run('update')
+        self.assertEqual((sim.player.x, sim.player.y), (100, 40))
+
+    def test_movement(self):
+        sim = Simulation(PLATFORM_FILE, start=(30, 33))
+        res = sim.run('horizontal_move_goal', 100)
+        self.assertTrue(res.ret)
+        self.assertEqual(res.start, (30, 33))
+        self.assertEqual(res.end, (sim.player.x, sim.player.y))
+        self.assertGreater(res.key_events, 0)
+        self.assertGreater(res.captures, 0)
+        self.assertLessEqual(abs(sim.player.x - 100), sim.player.horizontal_goal_offset)
+        self.assertLess(res.real_time, res.virtual_time)
+
+        sim.run('teleport_up')
+        res = sim.run(lambda player: time.sleep(1))
+        self.assertEqual(res.end, (98, 12))  # fell on highest platform in teleport range
+
+        sim.run('horizontal_move_goal', 110)
+        res = sim.run('drop')
+        self.assertEqual(res.end[1], 23)
+        self.assertGreater(res.start[1], 0)
+        self.assertLess(res.start[1], 23)
+        self.assertGreater(res.virtual_time, 0)
+
+        res = sim.run('shikigami_haunting_sweep_move', 130)
+        self.assertTrue(res.ret)
+        self.assertGreater(res.key_events, 0)
+        self.assertLessEqual(abs(res.end[0] - 130), sim.player.horizontal_goal_offset)
+
+    def test_fall_after_teleport(self):
+        sim = Simulation(PLATFORM_FILE, start=(70, 11))
+        sim.run('teleport_right')  # off the platform, falls to ground
+        sim.run(lambda player: (time.sleep(0.08), player.update()))
+        self.assertLess(sim.player.y, 33)  # still in air when minimap shows the teleport
+        sim.run(lambda player: (time.sleep(1), player.update()))
+        self.assertEqual(sim.player.y, 33)
+
+    def test_random_state_kept(self):
+        random.seed(1)
+        expected = [random.random() for _ in range(2)]
+        random.seed(1)
+        random.random()
+        Simulation(PLATFORM_FILE, start=(30, 33)).run('horizontal_move_goal', 100)
+        self.assertEqual(random.random(), expected[1])
+
+    def test_deterministic(self):
+        results = []
+        for _ in range(2):
+            sim = Simulation(PLATFORM_FILE, start=(140, 33))
+            t = time.perf_counter()
+            sim.run('shiki_exo_shiki', 40)
+            print('shiki_exo_shiki took %.3fs real time, %.2fs virtual' % (time.perf_counter() - t,
+                                                                          sim.clock.elapsed))
+            results.append((sim.key_mgr.events, sim.simulator.position))
+        self.assertEqual(results[0], results[1])
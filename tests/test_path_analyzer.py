@@ -1,8 +1,11 @@
 from unittest import TestCase
-from msv.terrain_analyzer import PathAnalyzer
+from msv.terrain_analyzer import PathAnalyzer, MoveMethod
+import numpy as np
 import random
+import time
 TEST_VALID_PLATFORM__DIR = r"unittest_data/test_valid_data.platform"
 TEST_CORRUPT_PLATFORM_DIR = r"unittest_data/test_corrupt_data.platform"
+SHIPPED_PLATFORM_DIR = r"../msv/resources/platform/corridor_h01.platform"
 
 
 class TestPathAnalyzer(TestCase):
@@ -78,4 +81,133 @@ class TestPathAnalyzer(TestCase):
             if not analyzer.select_move(key):
                 error = True
 
-        self.assertFalse(error)
\ No newline at end of file
+        self.assertFalse(error)
+
+    def test_astar_pathfind(self):
+        analyzer = PathAnalyzer()
+        analyzer.load(SHIPPED_PLATFORM_DIR)
+        self.assertEqual(analyzer.astar_map_grid.dtype, np.uint8)
+        self.assertEqual(analyzer.astar_g_grid.dtype, np.float32)
+        grid = analyzer.astar_map_grid
+        for y in range(grid.shape[0]):
+            for x in range(grid.shape[1]):
+                below = np.flatnonzero(grid[y+1:, x])
+                self.assertEqual(analyzer.astar_below_grid[y, x], y + 1 + below[0] if below.size else grid.shape[0])
+
+        t = time.perf_counter()
+        count = 0
+        for a in analyzer.platforms.values():
+            for b in analyzer.platforms.values():
+                if a is b:
+                    continue
+                goal = ((b.start_x + b.end_x) // 2, b.start_y)
+                path = analyzer.astar_pathfind(((a.start_x + a.end_x) // 2, a.start_y), goal)
+                self.assertTrue(path)
+                self.assertEqual(path[-1][0], goal)
+                count += 1
+        print('astar_pathfind took %.2fms avg' % ((time.perf_counter() - t) / count * 1000))
+
+        w, h = analyzer.astar_minimap_rect[2:]
+        self.assertIsNone(analyzer.astar_pathfind((-1, 0), goal))
+        self.assertIsNone(analyzer.astar_pathfind((w + 1, h + 1), goal))
+        self.assertIsNone(analyzer.astar_pathfind(goal, (w + 1, 0)))
+
+    def test_astar_optimize_path(self):
+        path = [((1, 5), MoveMethod.MOVER), ((2, 5), MoveMethod.MOVER), ((2, 9), MoveMethod.DROP),
+                ((3, 9), MoveMethod.MOVER), ((4, 9), MoveMethod.MOVER)]
+        self.assertEqual(PathAnalyzer().astar_optimize_path(path),
+                         [((2, 5), MoveMethod.MOVER), ((2, 9), MoveMethod.DROP), ((4, 9), MoveMethod.MOVER)])
+
+    def test_route_table(self):
+        analyzer = PathAnalyzer()
+        analyzer.load(SHIPPED_PLATFORM_DIR)
+        for start in analyzer.platforms:
+            for goal in analyzer.platforms:
+                path = analyzer.pathfind(start, goal)
+                self.assertAlmostEqual(sum(map(analyzer.solution_cost, path)), analyzer.route_table[start][goal][0])
+                if path:
+                    self.assertEqual(path[0].from_hash, start)
+                    self.assertEqual(path[-1].to_hash, goal)
+                    for a, b in zip(path, path[1:]):
+                        self.assertEqual(a.to_hash, b.from_hash)
+
+        def costs(route_table):
+            return {k: {to: cost for to, (cost, __) in routes.items()} for k, routes in route_table.items()}
+
+        removed = analyzer.platforms['37b99a5f']
+        analyzer.remove_platform(removed.hash)
+        rebuilt = PathAnalyzer()
+        rebuilt.platforms = analyzer.platforms
+        rebuilt.build_route_table()
+        self.assertEqual(costs(analyzer.route_table), costs(rebuilt.route_table))
+        self.assertNotIn(removed.hash, analyzer.route_table)
+
+        analyzer.add_platform(removed)
+        rebuilt.build_route_table()
+        self.assertEqual(costs(analyzer.route_table), costs(rebuilt.route_table))
+        self.assertEqual(len(analyzer.pathfind('f5f7cb3f', 'c6d0b625')), 2)  # up, then right
+
+    def test_edit_platform_astar(self):
+        analyzer = PathAnalyzer()
+        analyzer.load(SHIPPED_PLATFORM_DIR)
+        removed = analyzer.platforms['37b99a5f']
+        goal = ((removed.start_x + removed.end_x) // 2, removed.start_y)
+        start = next(i for i in analyzer.platforms.values() if i is not removed)
+        start = ((start.start_x + start.end_x) // 2, start.start_y)
+        self.assertEqual(analyzer.astar_pathfind(start, goal)[-1][0], goal)
+        analyzer.remove_platform(removed.hash)
+        self.assertIsNone(analyzer.astar_map_grid)
+        self.assertIsNone(analyzer.astar_pathfind(start, goal))  # grids don't have removed platform
+        self.assertEqual(analyzer.astar_map_grid[goal[1], goal[0]], 0)
+        analyzer.add_platform(removed)
+        self.assertEqual(analyzer.astar_pathfind(start, goal)[-1][0], goal)
+
+    def test_route_cost_learning(self):
+        analyzer = PathAnalyzer()
+        analyzer.load(SHIPPED_PLATFORM_DIR)
+        # no direct move, down then up and right then up are teleports of equal prior cost
+        path = analyzer.pathfind('37b99a5f', 'c6d0b625')
+        self.assertEqual(len(path), 2)
+        self.assertEqual(path[1].method, MoveMethod.TELEPORTUP)
+
+        first = next(i for i in analyzer.platforms['37b99a5f'].solutions if i.method == MoveMethod.TELEPORTDOWN)
+        cost = analyzer.solution_cost(first)
+        analyzer.record_move(first, 0.2, True)
+        self.assertEqual((first.attempts, first.successes), (1, 1))
+        self.assertLess(analyzer.solution_cost(first), cost)
+        self.assertIs(analyzer.pathfind('37b99a5f', 'c6d0b625')[0], first)
+
+        for i in range(5):  # slow and failing, route around it
+            analyzer.record_move(first, 2.0, False)
+        self.assertEqual([i.method for i in analyzer.pathfind('37b99a5f', 'c6d0b625')],
+                         [MoveMethod.TELEPORTR, MoveMethod.TELEPORTUP])
+
+        rebuilt = PathAnalyzer()
+        rebuilt.platforms = analyzer.platforms
+        rebuilt.build_route_table()
+        for key, routes in rebuilt.route_table.items():
+            for to, (cost, __) in routes.items():
+                self.assertAlmostEqual(analyzer.route_table[key][to][0], cost)
+
+    def test_find_platform(self):
+        analyzer = PathAnalyzer()
+        analyzer.load(SHIPPED_PLATFORM_DIR)
+
+        def scan(x, y, above=0, below=0, side=0):
+            for p in analyzer.platforms.values():
+                if p.start_y - above <= y <= p.start_y + below and p.start_x - side <= x <= p.end_x + side:
+                    return p.hash
+            return None
+
+        w, h = analyzer.astar_minimap_rect[2:]
+        removed = analyzer.platforms['37b99a5f']
+        for step in ('loaded', 'removed', 'added'):
+            if step == 'removed':
+                analyzer.remove_platform(removed.hash)
+            elif step == 'added':
+                analyzer.add_platform(removed)
+            for tolerance in ((0, 0, 0), (3, 0, 3), (2, 2, 0)):
+                for y in range(-3, h + 3):
+                    for x in range(-3, w + 3):
+                        self.assertEqual(analyzer.find_platform(x, y, *tolerance), scan(x, y, *tolerance))
+        self.assertIsNone(analyzer.find_platform(None, None))
@@ -0,0 +1,95 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import msv.directinput_constants as dc
+import msv.replay as replay
+from msv.replay import ReplayEngine, NpzArchiveSource
+from msv.terrain_analyzer import Platform, Solution, MoveMethod
+import cv2
+import time
+
+
+class TestReplay(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        # dialog frame, player marker at (129, 17) of minimap
+        for i in range(3):
+            shutil.copy('unittest_data/bounty_hunter_dialog.png', os.path.join(self.dir, '%03d.png' % i))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _engine(self, source, **kwargs):
+        engine = ReplayEngine(source, **kwargs)
+        analyzer = engine.macro.terrain_analyzer
+        analyzer.platforms = {'a': Platform(100, 17, 160, 17, 'a'), 'b': Platform(170, 17, 200, 17, 'b')}
+        analyzer.generate_solution_dict()
+        return engine
+
+    def test_png_directory(self):
+        engine = self._engine(self.dir)
+        t = time.time()
+        report = engine.run()
+        self.assertLess(time.time() - t, 30)  # sleeps are virtual
+        self.assertIs(time.sleep, replay._real_sleep)  # restored
+        self.assertEqual(report.reason, 'finished')
+        self.assertGreaterEqual(report.virtual_time, 0.3)  # 3 frames at 10 fps
+        self.assertLess(report.real_time, report.virtual_time)
+        self.assertEqual(set(report.stages), {'capture', 'checks', 'platform', 'common_job', 'pathfind',
+                                              'select_move', 'loop'})
+        self.assertGreater(report.stages['capture'][0], 0)
+        self.assertGreaterEqual(report.stages['capture'][0], report.captures)
+        self.assertGreater(report.captures, 0)
+        self.assertEqual(report.decisions, report.stages['pathfind'][0] + report.stages['select_move'][0])
+        self.assertGreater(report.decisions, 0)
+        self.assertEqual(report.key_events, len(engine.keyhandler.events))
+        # dialog is closed by escape
+        self.assertIn((dc.DIK_ESCAPE, 'press'), [(i[2], i[1]) for i in engine.keyhandler.events])
+
+    def test_npz_archive(self):
+        path = os.path.join(self.dir, 'session.npz')
+        frame = cv2.imread('unittest_data/bounty_hunter_dialog.png')
+        NpzArchiveSource.save(path, [frame, frame], [10.0, 40.0])
+        engine = self._engine(path, max_loops=1)
+        report = engine.run()
+        self.assertEqual(report.reason, 'finished')
+        self.assertEqual(report.loops, 1)
+        self.assertEqual(report.stages['loop'][0], 1)
+        self.assertLess(report.virtual_time, 30)
+        self.assertEqual(report.captures, engine.screen_capturer.captures)
+        self.assertGreater(report.captures, 0)
+        self.assertEqual(report.key_events, len(engine.keyhandler.events))
+        self.assertTrue(all(calls >= 0 and total >= 0 for calls, total in report.stages.values()))
+
+    def test_navmap_reset_keeps_move_stats(self):
+        engine = self._engine(self.dir, max_loops=1)
+        macro = engine.macro
+        macro.loop_count = macro.reset_navmap_loop_count  # first loop resets navigation map
+        analyzer = macro.terrain_analyzer
+        solution = analyzer.platforms['a'].solutions[0]
+        analyzer.record_move(solution, 0.5, False)
+        solution.visited = True
+        report = engine.run()
+        self.assertGreater(report.stages['loop'][0], 0)  # recording may end inside loop
+        self.assertIs(analyzer.platforms['a'].solutions[0], solution)
+        self.assertEqual((solution.attempts, solution.successes, solution.mean_duration), (1, 0, 0.5))
+
+    def test_move_result_recorded_when_landed(self):
+        macro = self._engine(self.dir).macro
+        analyzer = macro.terrain_analyzer
+        solution = Solution('a', 'b', method=MoveMethod.TELEPORTUP)
+        platforms = iter([None, None, 'b'])  # in air after teleport, lands on next updates
+        macro.find_current_platform = lambda: next(platforms)
+        macro.player_manager.update = lambda *args, **kwargs: None
+        macro.player_manager.wait_teleport_cd = macro.player_manager.teleport_up = lambda *args, **kwargs: None
+        macro.MINIMAP_DELAY = 0
+        t = time.time()
+        macro._player_move(MoveMethod.TELEPORTUP, solution)
+        self.assertLess(time.time() - t, 0.05)  # no wait for landing
+        self.assertEqual(solution.attempts, 0)
+        macro.update()
+        self.assertEqual(solution.attempts, 0)
+        macro.update()
+        self.assertEqual((solution.attempts, solution.successes), (1, 1))
+        self.assertIsNone(macro.pending_move)
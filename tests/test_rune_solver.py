@@ -1,7 +1,24 @@
 from unittest import TestCase
 from msv.screen_processor import MockScreenProcessor
 from msv.rune_solver.rune_solver_simple import RuneSolverSimple
+from msv.rune_solver.rune_solver_cnn import RuneSolverCnn
 import time
+import cv2
+import numpy as np
+
+
+def reference_match(solver, img):
+    """Per template matching of RuneSolverSimple before batched matching, :return: sorted list of (x, y, dir)"""
+    ret = []
+    for direction in solver.DIRECTIONS:
+        found = []
+        for tpl in (solver.templates[direction], solver.templates_small[direction]):
+            ys, xs = np.where(cv2.matchTemplate(img, tpl.bgr, cv2.TM_SQDIFF_NORMED, mask=tpl.mask) <= solver.THRESHOLD)
+            for pt in zip(xs, ys):
+                if not any(abs(i[0]-pt[0]) < 12 and abs(i[1]-pt[1]) < 12 for i in found):
+                    found.append(pt)
+        ret.extend((int(x), int(y), direction) for x, y in found)
+    return sorted(ret)
 
 
 class TestRuneSolver(TestCase):
@@ -19,3 +36,82 @@ class TestRuneSolver(TestCase):
         self.processor.set_test_img('unittest_data/rune/limina2.png')
         self.assertEqual(self.solver.solve(), ('left', 'left', 'right', 'down'))
 
+    def test_score_maps(self):
+        """Batched FFT scores equal masked matchTemplate of every template"""
+        self.processor.set_test_img('unittest_data/rune/limina2.png')
+        img = self.solver.capture_roi()
+        t = time.perf_counter()
+        maps = self.solver.score_maps(img)
+        print('score_maps took %.3fs' % (time.perf_counter() - t,))
+        for tpl, scores in zip(self.solver.batch_templates, maps):
+            h, w = tpl.shape
+            expected = cv2.matchTemplate(img, tpl.bgr, cv2.TM_SQDIFF_NORMED, mask=tpl.mask)
+            actual = scores[h//2:h//2+expected.shape[0], w//2:w//2+expected.shape[1]]
+            self.assertLess(float(np.abs(actual - expected).max()), 1e-4)
+
+        result = self.solver.match_all(img)
+        self.assertEqual(len(result), 4)
+        self.assertTrue(all(i['score'] <= self.solver.THRESHOLD for i in result))
+        # NMS keeps best match instead of first one over threshold, so it's the same arrow but not the same pixel
+        expected = reference_match(self.solver, img)
+        actual = sorted(i['pos'] + (i['dir'],) for i in result)
+        self.assertEqual([i[2] for i in actual], [i[2] for i in expected])
+        for a, e in zip(actual, expected):
+            self.assertLess(max(abs(a[0] - e[0]), abs(a[1] - e[1])), self.solver.NMS_DISTANCE, (actual, expected))
+
+
+class TestRuneSolverCnn(TestCase):
+    MODEL = 'unittest_data/rune/tiny_arrow_classifier.onnx'  # avg pool 10x10 -> dense 4 -> softmax
+
+    def test_hue_gray(self):
+        solver = RuneSolverCnn(self.MODEL, screen_capturer=MockScreenProcessor())
+        for path in ('unittest_data/rune/limina1.png', 'unittest_data/white_room1.png'):
+            img = cv2.imread(path)
+            t = time.perf_counter()
+            gray = solver.hue_gray(img)
+            print('hue_gray took %.4fs' % (time.perf_counter() - t,))
+            hsv_img = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            hsv_img[:, :, 1:] = 255
+            expected = cv2.cvtColor(cv2.cvtColor(hsv_img, cv2.COLOR_HSV2BGR), cv2.COLOR_BGR2GRAY)
+            # converting back from HSV differs by 1 on last columns of rows (scalar tail of SIMD loop) in OpenCV itself
+            diff = np.abs(gray.astype(np.int16) - expected)
+            self.assertLessEqual(int(diff.max()), 1)
+            self.assertLess(np.count_nonzero(diff), diff.size * 0.001)
+
+    def test_preprocess(self):
+        solver = RuneSolverCnn(self.MODEL, screen_capturer=MockScreenProcessor())
+        img = np.zeros((110, 500, 3), np.uint8)
+        centers = [(260, 50), (80, 55), (380, 52), (170, 58)]
+        for (x, y), color in zip(centers, ((0, 255, 0), (255, 0, 0), (0, 255, 255), (255, 255, 0))):
+            cv2.circle(img, (x, y), 24, color, 3)
+        crops = solver.preprocess(img)
+        self.assertEqual(len(crops), 4)
+        tensor = solver.images2tensor(crops)
+        self.assertIs(tensor.base, solver.tensor)  # no copy
+        self.assertEqual(tensor.shape, (4, 60, 60, 1))
+        gray = solver.hue_gray(img)
+        for crop, (x, y) in zip(tensor, sorted(centers)):  # detected center is near the drawn one
+            self.assertTrue(any(np.array_equal(crop[:, :, 0], gray[y+dy-30:y+dy+30, x+dx-30:x+dx+30])
+                                for dy in range(-3, 4) for dx in range(-3, 4)))
+
+    def test_onnx_backend(self):
+        labels = {'down': 0, 'left': 1, 'right': 2, 'up': 3}
+        solver = RuneSolverCnn(self.MODEL, labels, MockScreenProcessor())
+        self.assertEqual(solver.backend.name, 'cv2.dnn')
+        self.assertIsNotNone(solver.backend.load_time)
+
+        rng = np.random.RandomState(0)
+        crops = [rng.uniform(0, 255, (60, 60)).astype(np.float32) for _ in range(4)]
+        tensor = solver.images2tensor(crops)
+        probs = solver.backend.predict(tensor)
+        self.assertEqual(probs.shape, (4, 4))
+        self.assertEqual(solver.backend.runs, 1)  # whole batch in one forward pass
+        print(solver.backend.report())
+
+        result = solver.classify(tensor)
+        self.assertEqual(len(result), 4)
+        class_names = {v: k for k, v in labels.items()}
+        self.assertEqual(result, [class_names[i] for i in np.argmax(probs, axis=-1)])
+
+        del solver.class_names[int(np.argmax(probs[0]))]  # model and labels don't match
+        self.assertIsNone(solver.classify(tensor))
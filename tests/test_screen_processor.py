@@ -1,6 +1,11 @@
 from unittest import TestCase
-from msv.screen_processor import MockStaticImageProcessor
+import glob
+from msv.screen_processor import MockStaticImageProcessor, CaptureSession, FakeGdiBackend, FrameGrabber, \
+    GameCaptureError
+from msv.player_controller import PlayerController
+import numpy as np
 import time
+import cv2
 
 
 class TestScreenProcessor(TestCase):
@@ -16,27 +21,220 @@ class TestScreenProcessor(TestCase):
         self.assertIsNotNone(self.processor.get_minimap_rect())
         print('find_minimap_rect took %.3fs' % (time.perf_counter() - t,))
 
+    def test_find_minimap_rect_cache(self):
+        self.processor.set_test_img('unittest_data/minimap_guild.png')
+        rect = self.processor.find_minimap_rect()
+        self.assertEqual((self.processor.minimap_rect_hits, self.processor.minimap_rect_misses), (0, 1))
+
+        self.processor.set_test_img('unittest_data/minimap_stranger.png')
+        t = time.perf_counter()
+        self.assertEqual(self.processor.find_minimap_rect(), rect)
+        print('find_minimap_rect (cached) took %.3fs' % (time.perf_counter() - t,))
+        self.assertEqual((self.processor.minimap_rect_hits, self.processor.minimap_rect_misses), (1, 1))
+
+        self.processor.set_test_img('unittest_data/minimap_none.png')  # minimap moved
+        rect = self.processor.find_minimap_rect()
+        self.assertEqual(rect, [12, 64, 171, 87])
+        self.assertEqual((self.processor.minimap_rect_hits, self.processor.minimap_rect_misses), (1, 2))
+
+        self.processor.img_handle.img = np.zeros_like(self.processor.img_handle.img)  # minimap covered
+        self.processor.update_image()
+        for _ in range(3):  # searched once per frame, cached rect is kept
+            self.assertEqual(self.processor.find_minimap_rect(), rect)
+        self.assertEqual((self.processor.minimap_rect_hits, self.processor.minimap_rect_misses), (1, 3))
+        self.processor.update_image()
+        self.processor.find_minimap_rect()
+        self.assertEqual(self.processor.minimap_rect_misses, 4)
+
     def test_find_player(self):
         self.processor.set_test_img('unittest_data/minimap_guild.png')
         t = time.perf_counter()
-        self.assertIsNotNone(self.processor.find_player_minimap_marker())
+        self.assertEqual(self.processor.find_player_minimap_marker(), (24, 57))
         print('find_player took %.3fs' % (time.perf_counter() - t,))
 
-    def test_find_other_player(self):
-        self.processor.set_test_img('unittest_data/minimap_none.png')
-        self.assertIsNone(self.processor.find_other_player_marker(), 'false positive')
+        for i in ('friend', 'stranger'):
+            self.processor.set_test_img('unittest_data/minimap_%s.png' % i)
+            self.assertEqual(self.processor.find_player_minimap_marker(), (24, 57))
+
+    def test_minimap_snapshot(self):
+        self.processor.set_test_img('unittest_data/minimap_stranger.png')
+        snapshot = self.processor.get_minimap_snapshot()
+        self.assertIs(self.processor.get_minimap_snapshot(), snapshot, 'snapshot not shared in one frame')
+        self.assertEqual(snapshot.player_marker, (24, 57))
+        self.assertEqual(snapshot.other_player_markers, [(127, 28, 'stranger')])
+        self.assertEqual(snapshot.rune_markers, [])
+
+        self.processor.update_image()
+        self.assertIsNot(self.processor.get_minimap_snapshot(), snapshot, 'snapshot not rebuilt for new frame')
 
+    def test_minimap_frame_dedup(self):
         self.processor.set_test_img('unittest_data/minimap_guild.png')
-        self.assertIsNotNone(self.processor.find_other_player_marker(), 'guild not found')
+        self.processor.find_minimap_rect()
+        self.processor.set_test_img('unittest_data/minimap_guild.png')  # first fingerprint after minimap located
+        snapshot = self.processor.get_minimap_snapshot()
+        self.assertEqual(snapshot.player_marker, (24, 57))
+
+        self.processor.set_test_img('unittest_data/minimap_guild.png')
+        self.assertFalse(self.processor.minimap_changed)
+        self.assertIs(self.processor.get_minimap_snapshot(), snapshot, 'snapshot not reused for identical minimap')
+        self.assertIs(snapshot.frame, self.processor.bgr_img)
+
+        self.processor.set_test_img('unittest_data/minimap_stranger.png')
+        self.assertTrue(self.processor.minimap_changed)
+        self.assertLess(self.processor.minimap_age, 0.1)
+        self.assertEqual(self.processor.get_minimap_snapshot().other_player_markers, [(127, 28, 'stranger')])
+
+    def test_capture_plan(self):
+        self.processor.set_test_img('unittest_data/bounty_hunter_dialog.png')
+        self.processor.find_minimap_rect()
+        full = self.processor.bgr_img
+        white_room = self.processor.check_white_room()
+        plan = self.processor.minimap_capture_plan
+        client_size = self.processor.img_handle.get_client_size()
+        self.assertLess(plan.pixel_count(client_size), full.shape[0] * full.shape[1] // 10)
+
+        t = time.perf_counter()
+        self.processor.update_image(plan=plan)
+        print('update_image (plan) took %.3fs' % (time.perf_counter() - t,))
+        self.assertTrue(self.processor.is_partial_frame)
+        x, y, w, h = self.processor.minimap_rect
+        self.assertTrue((self.processor.bgr_img[y:y+h, x:x+w] == full[y:y+h, x:x+w]).all())
+        self.assertEqual(self.processor.find_player_minimap_marker(), (129, 17))
+        self.assertTrue(self.processor.check_dialog())
+
+        # checks need whole frame capture it again
+        self.assertEqual(self.processor.check_white_room(), white_room)
+        self.assertFalse(self.processor.is_partial_frame)
+
+    def test_capture_session(self):
+        backend = FakeGdiBackend(cv2.imread('unittest_data/dead.png'))
+        session = CaptureSession(1, backend=backend)
+        frame = session.capture()
+        self.assertTrue((frame == backend.img).all())
+        t = time.perf_counter()
+        for _ in range(10):
+            self.assertIs(session.capture().base, frame.base, 'buffer not reused')
+        print('CaptureSession.capture took %.3fs' % ((time.perf_counter() - t) / 10,))
+        self.assertEqual((session.rebuild_count, backend.surfaces_created, backend.dc_count), (1, 1, 1))
+
+        x, y, w, h = 450, 165, 500, 110
+        self.assertTrue((session.capture((x, y, w, h)) == backend.img[y:y+h, x:x+w]).all())
+        self.assertEqual(session.capture((1300, 700, 100, 100)).shape, (68, 66, 3))  # clipped to client area
+
+        partial = session.capture_regions([(x, y, w, h)])
+        self.assertTrue((partial[y:y+h, x:x+w] == backend.img[y:y+h, x:x+w]).all())
+        self.assertEqual(partial.sum() - partial[y:y+h, x:x+w].sum(), 0)
+        partial = session.capture_regions([(0, 0, 10, 10)])  # region of last call must be cleared
+        self.assertEqual(partial[y:y+h, x:x+w].sum(), 0)
+
+        backend.img = cv2.imread('unittest_data/minimap_guild.png')  # window resized
+        self.assertEqual(session.capture().shape, backend.img.shape)
+        self.assertEqual((session.rebuild_count, backend.surfaces_deleted), (2, 1))
+        session.close()
+        self.assertEqual((backend.surfaces_created - backend.surfaces_deleted, backend.dc_count), (0, 0))
+
+    def test_bgra_mode(self):
+        """Every detector gives same result on BGRA frame"""
+        bgra_processor = MockStaticImageProcessor(bgra=True)
+        for path in sorted(glob.glob('unittest_data/*.png') + glob.glob('unittest_data/rune/*.png')):
+            results = []
+            for processor in (self.processor, bgra_processor):
+                processor.set_test_img(path)
+                rect = processor.find_minimap_rect()
+                ret = [rect]
+                if processor.bgr_img.shape[1] >= 800:  # not a minimap crop
+                    ret += [processor.check_death(), processor.check_white_room(), processor.check_dialog(),
+                            processor.check_gm_cap()]
+                if rect:
+                    ret += [processor.find_player_minimap_marker(), processor.find_other_player_marker(),
+                            processor.find_rune_markers()]
+                results.append(ret)
+            self.assertEqual(bgra_processor.bgr_img.shape[2], 4)
+            self.assertEqual(results[0], results[1], path)
+
+    def test_frame_grabber(self):
+        count = 0
+
+        def source():  # synthetic frame, every pixel is capture count
+            nonlocal count
+            count += 1
+            time.sleep(0.002)
+            return np.full((4, 4, 3), count % 256, np.uint8)
+
+        grabber = FrameGrabber(source, ring_size=3)
+        grabber.start()
+        try:
+            frame, timestamp = grabber.get_frame()
+            t = time.perf_counter()
+            newer, newer_timestamp = grabber.get_frame(newer_than=t)
+            self.assertGreater(newer_timestamp, t)
+            self.assertGreater(newer_timestamp, timestamp)
+
+            while grabber.frame_count < 20:  # ring wraps many times
+                time.sleep(0.005)
+            self.assertTrue((newer == newer[0, 0, 0]).all(), 'frame being read is overwritten')
+            t = time.perf_counter()
+            grabber.get_frame()
+            print('FrameGrabber.get_frame took %.6fs' % (time.perf_counter() - t,))
+        finally:
+            grabber.stop()
+        self.assertFalse(grabber.running)
+        self.assertRaises(GameCaptureError, grabber.get_frame, newer_than=time.perf_counter(), timeout=0.1)
+
+        self.processor.set_test_img('unittest_data/bounty_hunter_dialog.png')
+        self.processor.find_minimap_rect()
+        plan = self.processor.minimap_capture_plan
+        self.processor.start_frame_grabber(lambda: self.processor.img_handle.capture(plan=plan))
+        try:
+            t = time.perf_counter()
+            self.processor.update_image(plan=plan, newer_than=t)
+            self.assertGreater(self.processor.frame_time, t)
+            self.assertTrue(any(i is self.processor.bgr_img for i in self.processor.frame_grabber.ring))
+            self.assertEqual(self.processor.find_player_minimap_marker(), (129, 17))
+
+            player = PlayerController(None, self.processor)
+            for _ in range(3):  # every update waits for a frame it hasn't seen
+                t = self.processor.frame_time
+                player.update()
+                self.assertGreater(self.processor.frame_time, t)
+            self.assertEqual((player.x, player.y), (129, 17))
+        finally:
+            self.processor.stop_frame_grabber()
+
+    def test_find_rune(self):
+        self.processor.set_test_img('unittest_data/rune/limina1.png')
+        self.assertEqual(self.processor.find_rune_marker(), 0)
+
+        self.processor.set_test_img('unittest_data/rune/limina2.png')  # partially covered by player marker
+        t = time.perf_counter()
+        self.assertEqual(self.processor.find_rune_marker(), (137, 56))
+        print('find_rune took %.3fs' % (time.perf_counter() - t,))
+        self.assertEqual(self.processor.find_rune_markers(), [(137, 56)])
+
+    def test_find_other_player(self):
+        self.processor.set_test_img('unittest_data/minimap_guild.png')
+        self.assertEqual(self.processor.find_other_player_marker(), [(127, 28, 'guild')], 'guild not found')
 
         self.processor.set_test_img('unittest_data/minimap_friend.png')
-        self.assertIsNotNone(self.processor.find_other_player_marker(), 'friend not found')
+        self.assertEqual(self.processor.find_other_player_marker(), [(127, 28, 'friend')], 'friend not found')
+        self.processor.detect_friend = False
+        self.assertEqual(self.processor.find_other_player_marker(), [])
+        self.processor.detect_friend = True
 
         self.processor.set_test_img('unittest_data/minimap_stranger.png')
         t = time.perf_counter()
-        self.assertIsNotNone(self.processor.find_other_player_marker(), 'stranger not found')
+        self.assertEqual(self.processor.find_other_player_marker(), [(127, 28, 'stranger')], 'stranger not found')
         print('find_other_player took %.3fs' % (time.perf_counter() - t,))
 
+        # copy guild marker to another place of minimap
+        guild_marker = cv2.imread('unittest_data/minimap_guild.png')[88:101, 132:145]
+        self.processor.img_handle.img[108:121, 62:75] = guild_marker
+        self.processor.update_image()
+        self.assertEqual(self.processor.find_other_player_marker(), [(127, 28, 'stranger'), (57, 48, 'guild')])
+
+        self.processor.set_test_img('unittest_data/minimap_none.png')
+        self.assertEqual(self.processor.find_other_player_marker(), [], 'false positive')
+
     def test_check_elite_boss(self):
         self.processor.set_test_img('unittest_data/dead.png')
         self.assertTrue(self.processor.check_death())
@@ -68,3 +266,14 @@ class TestScreenProcessor(TestCase):
         t = time.perf_counter()
         self.assertTrue(self.processor.check_gm_cap())
         print('check_gm_cap took %.3fs' % (time.perf_counter() - t,))
+
+    def test_gm_cap_matcher(self):
+        """Coarse to fine matching finds same positions as masked matchTemplate over whole frame"""
+        for path in ('white_room.png', 'white_room1.png', 'white_room2.png', 'dead.png', 'bounty_hunter_dialog.png'):
+            self.processor.set_test_img('unittest_data/' + path)
+            gray = self.processor.gray_img
+            gm_cap = self.processor.templates['gm_cap']
+            for tpl, matcher in zip((gm_cap, gm_cap.mirrored), self.processor.gm_cap_matchers):
+                res = cv2.matchTemplate(gray, tpl.gray, cv2.TM_SQDIFF_NORMED, mask=tpl.mask)
+                expected = sorted((int(y), int(x)) for y, x in zip(*np.where(res < 0.001)))
+                self.assertEqual(sorted(matcher.find(gray)), expected, path)
@@ -0,0 +1,90 @@
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+import msv.directinput_constants as dc
+from msv.session_recorder import SessionRecorder, SessionReader
+from msv.replay import open_source
+
+
+class TestSessionRecorder(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.img = cv2.imread('unittest_data/bounty_hunter_dialog.png')
+        self.minimap_rect = (8, 30, 180, 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _frames(self, n):
+        """frames with a moving marker in minimap and a changing dialog region"""
+        for i in range(n):
+            img = self.img.copy()
+            cv2.circle(img, (20 + i * 3, 60), 2, (0, 255, 255), -1)
+            if i % 5 == 0:
+                cv2.rectangle(img, (400, 300), (450, 350), (i * 10, 0, 0), -1)
+            yield img
+
+    def _record(self, frames, full_frame_interval=0.5):
+        recorder = SessionRecorder(self.dir, full_frame_interval, queue_size=len(frames) * 2).start()
+        t = time.perf_counter()
+        for i, img in enumerate(frames):
+            recorder.add_frame(img, i * 0.1, self.minimap_rect)
+            recorder.add_key_event(dc.DIK_LEFT, i % 2 == 0, i * 0.1)
+        print('recording %d frames took %.3fs' % (len(frames), time.perf_counter() - t))
+        recorder.close()
+        return recorder
+
+    def test_round_trip(self):
+        frames = list(self._frames(20))
+        recorder = self._record(frames)
+        self.assertEqual(recorder.frames, 20)
+        self.assertEqual(recorder.full_frames, 4)  # 0, 0.5, 1.0, 1.5s
+        print('%d bytes, raw frames are %d bytes' % (recorder.bytes_written, sum(i.nbytes for i in frames)))
+        self.assertLess(recorder.bytes_written, sum(i.nbytes for i in frames) / 10)
+
+        reader = SessionReader(self.dir)
+        self.assertEqual(len(reader), 20)
+        x, y, w, h = self.minimap_rect
+        for i in (0, 7, 19, 3):
+            self.assertTrue(np.array_equal(reader.minimap(i), frames[i][y:y+h, x:x+w]))
+            self.assertTrue(np.array_equal(reader.full_frame(i), frames[i // 5 * 5]))
+            expected = frames[i // 5 * 5].copy()
+            expected[y:y+h, x:x+w] = frames[i][y:y+h, x:x+w]
+            self.assertTrue(np.array_equal(reader.frame(i), expected))
+        self.assertEqual(reader.timestamps[7], 7 * 0.1)
+
+        keys = reader.key_events(0.5, 1.0)
+        self.assertEqual(len(keys), 5)
+        self.assertTrue(np.all(keys['key'] == dc.DIK_LEFT))
+        self.assertEqual(list(keys['down']), [0, 1, 0, 1, 0])
+
+    def test_partial_frames(self):
+        recorder = SessionRecorder(self.dir, 0.5).start()
+        recorder.add_frame(self.img, 0, self.minimap_rect, is_partial=True)  # skipped, no full frame yet
+        recorder.add_frame(self.img, 0.1, self.minimap_rect)
+        recorder.add_frame(self.img, 1.0, self.minimap_rect, is_partial=True)  # never full frame
+        recorder.close()
+        reader = SessionReader(self.dir)
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(recorder.full_frames, 1)
+        self.assertEqual(int(reader.frames[1]['full_table']), int(reader.frames[0]['full_table']))
+
+    def test_seek(self):
+        frames = list(self._frames(5))
+        self._record(frames * 40, full_frame_interval=100)
+        reader = open_source(self.dir)
+        self.assertIsInstance(reader, SessionReader)
+        t = time.perf_counter()
+        first = reader.frame(0)
+        t_first = time.perf_counter() - t
+        t = time.perf_counter()
+        last = reader.frame(len(reader) - 1)
+        t_last = time.perf_counter() - t
+        print('frame 0 took %.2fms, frame %d took %.2fms' % (t_first * 1000, len(reader) - 1, t_last * 1000))
+        self.assertTrue(np.array_equal(first, frames[0]))
+        x, y, w, h = self.minimap_rect
+        self.assertTrue(np.array_equal(last[y:y+h, x:x+w], frames[4][y:y+h, x:x+w]))
@@ -0,0 +1,56 @@
+from unittest import TestCase
+import cv2
+import numpy as np
+import time
+from msv.template_bank import TemplateBank, Template
+
+
+class TestTemplateBank(TestCase):
+    bank = None
+
+    @classmethod
+    def setUpClass(cls):
+        t = time.perf_counter()
+        cls.bank = TemplateBank(pyramid_levels=1)
+        print('loading %d templates took %.3fs' % (len(cls.bank.templates), time.perf_counter() - t))
+
+    def test_load(self):
+        for name in ('gm_cap', 'hp0', 'dialog_end_chat', 'down_arrow_template', 'craft_btn', 'monster/ascendion'):
+            self.assertIn(name, self.bank)
+        path = '../msv/resources/template/gm_cap_tpl.png'
+        gm_cap = self.bank['gm_cap']
+        self.assertTrue(gm_cap.has_alpha)
+        self.assertTrue(np.array_equal(gm_cap.gray, cv2.imread(path, cv2.IMREAD_GRAYSCALE)))
+        self.assertTrue(np.array_equal(gm_cap.mask, cv2.imread(path, cv2.IMREAD_UNCHANGED)[:, :, 3]))
+        self.assertTrue(np.array_equal(gm_cap.bgr, cv2.imread(path, cv2.IMREAD_COLOR)))
+        h, w = gm_cap.shape
+        self.assertEqual(gm_cap.pyramid[1][0].shape, (h // 2, w // 2))
+
+    def test_derived(self):
+        tpl = self.bank['down_arrow_template']
+        self.assertIs(tpl.mirrored, tpl.mirrored)
+        self.assertTrue(np.array_equal(tpl.mirrored.gray, np.fliplr(tpl.gray)))
+        right = tpl.rotated(1)
+        self.assertTrue(np.array_equal(right.bgr, np.rot90(tpl.bgr)))
+        self.assertTrue(np.array_equal(right.mask, np.rot90(tpl.mask)))
+        self.assertTrue(right.bgr.flags['C_CONTIGUOUS'])
+
+    def test_match_many(self):
+        img = cv2.imread('unittest_data/white_room1.png')
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gm_cap = self.bank['gm_cap']
+        templates = [gm_cap, gm_cap.mirrored, self.bank['hp0']]
+        t = time.perf_counter()
+        maps = self.bank.score_maps(img, templates)
+        print('score_maps took %.3fs' % (time.perf_counter() - t,))
+        for tpl, res in zip(templates, maps):
+            expected = cv2.matchTemplate(gray, tpl.gray, cv2.TM_SQDIFF_NORMED, mask=tpl.mask)
+            self.assertTrue(np.array_equal(res, expected, equal_nan=True))
+
+        found = self.bank.match_many(gray, templates, 0.001)
+        self.assertEqual(len(found['gm_cap'][0]) + len(found['gm_cap_r'][0]), 1)
+
+    def test_add(self):
+        tpl = self.bank.add(Template('test_square', np.full((4, 4, 3), 255, np.uint8)))
+        self.assertIs(self.bank['test_square'], tpl)
+        self.assertEqual(int(tpl.mask.min()), 255)
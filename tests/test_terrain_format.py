@@ -0,0 +1,80 @@
+from unittest import TestCase
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import numpy as np
+from msv import terrain_format
+from msv.terrain_analyzer import PathAnalyzer
+SHIPPED_PLATFORM_PATH = r"../msv/resources/platform/labyrinth_interior1.platform"
+
+
+def analyzer_state(analyzer):
+    platforms = [(p.hash, p.start_x, p.start_y, p.end_x, p.end_y, p.no_monster) for p in analyzer.platforms.values()]
+    solutions = [(s.from_hash, s.to_hash, s.lower_bound, s.upper_bound, s.method)
+                 for p in analyzer.platforms.values() for s in p.solutions]
+    routes = {k: {to: (cost, first and (first.from_hash, first.to_hash, first.method))
+                  for to, (cost, first) in r.items()} for k, r in analyzer.route_table.items()}
+    return platforms, solutions, routes, analyzer.other_attrs, analyzer.set_skill_coord
+
+
+class TestTerrainFormat(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        analyzer = PathAnalyzer()
+        t = time.perf_counter()
+        analyzer.load(SHIPPED_PLATFORM_PATH)
+        print('load took %.2fms' % ((time.perf_counter() - t) * 1000,))
+        self.assertIsInstance(analyzer.set_skill_coord['kishin_shoukan'], tuple)
+        for platform in analyzer.platforms.values():  # routes refer to solutions of platforms
+            for to, (cost, first) in analyzer.route_table[platform.hash].items():
+                self.assertTrue(first is None or any(first is i for i in platform.solutions))
+
+        path = os.path.join(self.tmp, 'a.platform')
+        attrs = dict(analyzer.other_attrs, **{k + '_coord': v for k, v in analyzer.set_skill_coord.items()})
+        analyzer.save(path, attrs)
+        loaded = PathAnalyzer()
+        self.assertEqual(loaded.load(path), analyzer.astar_minimap_rect)
+        self.assertEqual(analyzer_state(loaded), analyzer_state(analyzer))
+        self.assertTrue(np.array_equal(loaded.astar_map_grid, analyzer.astar_map_grid))
+        self.assertTrue(np.array_equal(loaded.astar_below_grid, analyzer.astar_below_grid))
+        self.assertEqual(loaded.verify_data_file(path), analyzer.astar_minimap_rect)
+
+    def test_convert(self):
+        analyzer = PathAnalyzer()
+        analyzer.load(SHIPPED_PLATFORM_PATH)
+        path = os.path.join(self.tmp, 'legacy.platform')
+        data = {k + '_coord': v for k, v in analyzer.set_skill_coord.items()}
+        data.update(analyzer.other_attrs, platforms=analyzer.platforms)
+        with open(path, 'wb') as f:
+            pickle.dump(data, f)
+
+        legacy = PathAnalyzer()
+        legacy.load(path)  # computes solutions and routes
+        self.assertTrue(terrain_format.convert(path))
+        self.assertFalse(terrain_format.convert(path))
+        converted = PathAnalyzer()
+        converted.load(path)
+        self.assertEqual(analyzer_state(converted), analyzer_state(legacy))
+
+    def test_version(self):
+        path = os.path.join(self.tmp, 'a.platform')
+        platforms = np.array([(b'a12ed5e3', 1, 5, 8, 5, 0)], terrain_format.PLATFORM_DTYPE)
+        with open(path, 'wb') as f:  # without optional arrays
+            f.write(terrain_format.dumps({'minimap': [0, 0, 10, 10]}, {'platforms': platforms}))
+        analyzer = PathAnalyzer()
+        self.assertEqual(analyzer.load(path), [0, 0, 10, 10])
+        self.assertEqual(analyzer.pathfind('a12ed5e3', 'a12ed5e3'), [])
+
+        with open(path, 'r+b') as f:
+            f.seek(len(terrain_format.MAGIC))
+            f.write(np.uint32(terrain_format.FORMAT_VERSION + 1).tobytes())
+        with self.assertRaises(ValueError):
+            PathAnalyzer().load(path)
+        self.assertEqual(PathAnalyzer().verify_data_file(path), 0)
@@ -0,0 +1,90 @@
+from unittest import TestCase
+import multiprocessing
+import shutil
+import tempfile
+import time
+from msv.screen_processor import MockStaticImageProcessor
+from msv.replay import ReplayEngine
+from msv.vision_worker import VisionWorkerPool
+
+
+# fork keeps resource reading of test process
+MP_CONTEXT = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+
+
+def wait_verdict(pool, name, timestamp, timeout=30):
+    """timeout includes start of worker processes"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        verdict = pool.take(name)
+        if verdict is not None and verdict[1] == timestamp:
+            return verdict
+        time.sleep(0.01)
+
+
+class TestVisionWorker(TestCase):
+    def test_verdicts(self):
+        pool = VisionWorkerPool(workers=2, mp_context=MP_CONTEXT)
+        processor = MockStaticImageProcessor()
+        try:
+            for path in ('unittest_data/bounty_hunter_dialog.png', 'unittest_data/dead.png'):
+                processor.set_test_img(path)
+                expected = {i: bool(getattr(processor, 'check_' + i)()) for i in pool.checks}
+                t = time.perf_counter()
+                pool.publish(processor.bgr_img, processor.frame_time)
+                print('publish took %.3fs' % (time.perf_counter() - t,))
+
+                verdicts = {}
+                deadline = time.perf_counter() + 30  # includes start of worker processes
+                while len(verdicts) < len(pool.checks) and time.perf_counter() < deadline:
+                    for i in pool.checks:
+                        verdict = pool.take(i)
+                        if verdict is not None and verdict[1] == processor.frame_time:
+                            verdicts[i] = verdict[0]
+                    time.sleep(0.01)
+                self.assertEqual(verdicts, expected, path)
+                self.assertIsNone(pool.take('dialog'), 'verdict returned twice')
+        finally:
+            pool.stop()
+        self.assertFalse(pool.running)
+
+    def test_check_error(self):
+        pool = VisionWorkerPool(checks=('dialog', 'not_exist'), mp_context=MP_CONTEXT)
+        processor = MockStaticImageProcessor()
+        processor.set_test_img('unittest_data/bounty_hunter_dialog.png')
+        try:
+            pool.publish(processor.bgr_img, processor.frame_time)
+            with self.assertLogs('VisionWorkerPool', 'ERROR'):
+                self.assertEqual(wait_verdict(pool, 'not_exist', processor.frame_time), (None, processor.frame_time))
+            self.assertTrue(pool.running)  # worker survived
+
+            processor.set_test_img('unittest_data/dead.png')
+            pool.publish(processor.bgr_img, processor.frame_time)
+            self.assertEqual(wait_verdict(pool, 'dialog', processor.frame_time),
+                             (bool(processor.check_dialog()), processor.frame_time))
+        finally:
+            pool.stop()
+
+    def test_worker_died(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shutil.copy('unittest_data/bounty_hunter_dialog.png', directory)
+        engine = ReplayEngine(directory, config={'vision_workers': 1})
+        macro = engine.macro
+        pool = macro.vision_workers
+        pool.ctx = multiprocessing.get_context(MP_CONTEXT)
+        processor = macro.screen_processor = MockStaticImageProcessor()
+        processor.set_test_img('unittest_data/bounty_hunter_dialog.png')
+        try:
+            pool.publish(processor.bgr_img, processor.frame_time)
+            self.assertIsNotNone(wait_verdict(pool, 'dialog', processor.frame_time))
+            pool.processes[0].kill()
+            pool.processes[0].join()
+            self.assertFalse(pool.running)
+            with self.assertLogs('VisionWorkerPool', 'ERROR'):
+                self.assertTrue(macro._check('dialog'))  # checked in control loop
+            self.assertTrue(pool.failed)
+            pool.publish(processor.bgr_img, processor.frame_time + 1)  # not restarted
+            self.assertFalse(pool.processes)
+        finally:
+            pool.stop()